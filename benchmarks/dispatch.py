@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+"""
+Microbenchmark of the parsing and dispatch of requests: measures the time needed to parse the head of a request and
+find the handler of its method, for each of the supported methods.
+Run it from the root of the repository: python3 benchmarks/dispatch.py
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.request import HttpRequest  # noqa: E402
+from server import Server  # noqa: E402
+from utils.registry import VhostRegistry  # noqa: E402
+
+HEADERS = b"Host: guyincognito.ch\r\nUser-Agent: benchmark\r\nAccept: */*\r\nAccept-Encoding: gzip, br\r\n"
+RAW_REQUESTS = {
+    "GET": b"GET /home.html HTTP/1.1\r\n" + HEADERS + b"\r\n",
+    "PUT": b"PUT /upload.txt HTTP/1.1\r\n" + HEADERS + b"Content-Length: 0\r\n\r\n",
+    "DELETE": b"DELETE /upload.txt HTTP/1.1\r\n" + HEADERS + b"\r\n",
+    "NTW22INFO": b"NTW22INFO / HTTP/1.0\r\n" + HEADERS + b"\r\n",
+}
+
+
+def bench_dispatch(raw: bytes, hosts: VhostRegistry, number: int) -> float:
+    """
+    Measures the parsing and dispatch of a request.
+    :param raw: head of the request
+    :param hosts: virtual hosts of the server
+    :param number: number of requests to be parsed
+    :return: mean time per request in microseconds
+    """
+    def dispatch():
+        request = HttpRequest(raw)
+        request.parse_request(hosts)
+        Server.get_handler(request.get_method())
+
+    return min(timeit.repeat(dispatch, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark of the parsing and dispatch of requests")
+    parser.add_argument("-n", "--number", type=int, nargs='?', const=20000, default=20000,
+                        help="number of requests parsed in each round")
+    args = parser.parse_args()
+
+    hosts = VhostRegistry.parse_file()
+    for method, raw in RAW_REQUESTS.items():
+        print("{:>10}: {:8.2f} us/request".format(method, bench_dispatch(raw, hosts, args.number)))
@@ -0,0 +1,423 @@
+#!/usr/bin/python3
+
+"""
+Load generator for the server: starts it on a temporary copy of the virtual hosts, and drives it with concurrent
+clients sending a mix of methods and file sizes. The throughput and the latency percentiles are printed as JSON, so
+they can be stored and compared between versions.
+Run it from the root of the repository: python3 benchmarks/load.py -c 32 -d 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import mimetypes
+import multiprocessing
+import os
+import random
+import shlex
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, ROOT)
+
+from settings import VHOSTS_FILE, DEFAULT_ENGINE, DEFAULT_THREADS, DEFAULT_WORKERS  # noqa: E402
+from utils.mime import CUSTOM_MIMETYPES  # noqa: E402
+
+SERVER = os.path.join(ROOT, "server.py")
+METHODS = ("GET", "PUT", "DELETE", "NTW22INFO")
+# Files of each size class are smaller than its limit (and at least as large as the limit of the previous one)
+SIZE_CLASSES = {
+    "small": 16 * 1024,
+    "medium": 1024 * 1024,
+    "large": math.inf,
+}
+DEFAULT_METHOD_MIX = "GET=85,PUT=5,DELETE=5,NTW22INFO=5"
+DEFAULT_SIZE_MIX = "small=60,medium=35,large=5"
+# Folder (inside each virtual host) where the files are uploaded
+UPLOAD_FOLDER = "benchmark-uploads"
+SERVER_START_TIMEOUT = 10
+SERVER_STOP_TIMEOUT = 30
+REQUEST_TIMEOUT = 30
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """
+    Parses the weights of a mix given in the command line.
+    :param value: comma-separated list of NAME=WEIGHT items (e.g. "GET=90,PUT=10")
+    :return: weight of each name
+    """
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        try:
+            mix[name.strip()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError("Invalid weight in '{}'".format(item))
+    return mix
+
+
+def is_servable(name: str) -> bool:
+    # Files without a known type are answered with a 415, so they are not requested
+    return mimetypes.guess_type(name)[0] is not None or name.rpartition(".")[2] in CUSTOM_MIMETYPES
+
+
+def prepare_sites(workdir: str) -> Tuple[List[str], Dict[str, List[Tuple[str, str, int]]]]:
+    """
+    Copies the virtual hosts (and the file that defines them) into the working folder of the server, so the files
+    uploaded and deleted during the benchmark do not modify the ones in the repository.
+    :param workdir: working folder of the server
+    :return: names of the hosts, and the files (host, path and size) of each size class
+    """
+    shutil.copy(os.path.join(ROOT, VHOSTS_FILE), workdir)
+    hosts = []
+    files = {size_class: [] for size_class in SIZE_CLASSES}
+    with open(os.path.join(ROOT, VHOSTS_FILE)) as f:
+        for line in f:
+            hostname = line.split(",")[0].strip().lower()
+            source = os.path.join(ROOT, hostname)
+            if not hostname or not os.path.isdir(source):
+                continue
+            shutil.copytree(source, os.path.join(workdir, hostname))
+            hosts.append(hostname)
+            for folder, _, names in os.walk(source):
+                for name in names:
+                    path = "/" + os.path.relpath(os.path.join(folder, name), source).replace(os.sep, "/")
+                    if " " in path or not is_servable(name):
+                        continue
+                    size = os.path.getsize(os.path.join(folder, name))
+                    size_class = next(c for c, limit in SIZE_CLASSES.items() if size < limit)
+                    files[size_class].append((hostname, path, size))
+    return hosts, files
+
+
+def start_server(workdir: str, port: int, server_args: List[str]) -> subprocess.Popen:
+    """
+    Starts the server in its working folder, and waits until it accepts connections.
+    :param workdir: working folder of the server, with the virtual hosts
+    :param port: port where the server listens
+    :param server_args: extra arguments for the server
+    :return: process of the server
+    """
+    process = subprocess.Popen([sys.executable, SERVER, "-p", str(port)] + server_args, cwd=workdir,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited with status {}".format(process.returncode))
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Server did not start within {} seconds".format(SERVER_START_TIMEOUT))
+
+
+def stop_server(process: subprocess.Popen):
+    # Let the server shut down gracefully, as it would in production
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(SERVER_STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def build_request(method: str, client: int, sequence: int, rng: random.Random, config: dict,
+                  uploads: List[Tuple[str, str]]) -> Tuple[str, Tuple[str, str], bytes, bytes]:
+    """
+    Generates the next request of a client.
+    :param method: method of the request
+    :param client: identifier of the client
+    :param sequence: number of the request in the client
+    :param rng: random generator of the client
+    :param config: configuration of the benchmark
+    :param uploads: files uploaded by the client and not deleted yet (the one to be deleted is removed)
+    :return: method (DELETE becomes PUT if there is nothing to delete), requested file (host and path), head and
+             body of the request
+    """
+    size_classes = list(config["size_mix"])
+    host, path, size = rng.choice(config["files"][rng.choices(size_classes, list(config["size_mix"].values()))[0]])
+    body = b""
+    if method == "DELETE" and not uploads:
+        method = "PUT"
+    if method == "PUT":
+        # Upload a file as large as the chosen one
+        host, path = rng.choice(config["hosts"]), "/{}/{}-{}.txt".format(UPLOAD_FOLDER, client, sequence)
+        body = config["payload"][:size]
+    elif method == "DELETE":
+        host, path = uploads.pop(rng.randrange(len(uploads)))
+    elif method == "NTW22INFO":
+        host, path = rng.choice(config["hosts"]), "/"
+
+    head = "{} {} HTTP/1.1\r\nHost: {}\r\n".format(method, path, host)
+    if method == "PUT":
+        head += "Content-Length: {}\r\n".format(len(body))
+    if not config["keep_alive"]:
+        head += "Connection: close\r\n"
+    return method, (host, path), (head + "\r\n").encode("utf-8"), body
+
+
+async def read_response(reader: asyncio.StreamReader) -> Tuple[int, int, bool]:
+    """
+    Reads a whole response from the server.
+    :param reader: connection to the server
+    :return: status code, size of the response in bytes, and whether the server closes the connection
+    """
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.split(b"\r\n")
+    status = int(lines[0].split(b" ")[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower()] = value.strip().lower()
+
+    size = len(head)
+    close = headers.get(b"connection") == b"close"
+    if b"content-length" in headers:
+        size += len(await reader.readexactly(int(headers[b"content-length"])))
+    elif headers.get(b"transfer-encoding") == b"chunked":
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            length = int(line.split(b";")[0], 16)
+            # The data of each chunk is followed by a CRLF (the server does not send trailers)
+            size += len(line) + len(await reader.readexactly(length + 2))
+            if length == 0:
+                break
+    else:
+        # The end of the response is the end of the connection
+        size += len(await reader.read())
+        close = True
+    return status, size, close
+
+
+async def run_client(client: int, config: dict, start: float, results: dict):
+    """
+    Sends requests to the server (one after the other) until the end of the benchmark.
+    :param client: identifier of the client
+    :param config: configuration of the benchmark
+    :param start: time (monotonic) when the measurements start, after the warm-up
+    :param results: results of the process, updated with the ones of the client
+    """
+    rng = random.Random("{}-{}".format(config["seed"], client))
+    methods, weights = list(config["method_mix"]), list(config["method_mix"].values())
+    deadline = start + config["duration"]
+    uploads = []
+    connection = None
+    sequence = 0
+    while time.monotonic() < deadline:
+        sequence += 1
+        method, target, head, body = build_request(rng.choices(methods, weights)[0], client, sequence, rng, config,
+                                                   uploads)
+        sent_at = time.monotonic()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection("127.0.0.1", config["port"])
+            reader, writer = connection
+            writer.write(head)
+            writer.write(body)
+            await writer.drain()
+            status, size, close = await asyncio.wait_for(read_response(reader), REQUEST_TIMEOUT)
+        except (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError):
+            if sent_at >= start:
+                results["errors"] += 1
+            if connection is not None:
+                connection[1].close()
+            connection = None
+            continue
+        if method == "PUT" and status == 201:
+            uploads.append(target)
+        if sent_at >= start:
+            results["latencies"].setdefault(method, []).append(time.monotonic() - sent_at)
+            results["status"][str(status)] += 1
+            results["bytes"] += len(head) + len(body) + size
+        if close or not config["keep_alive"]:
+            writer.close()
+            connection = None
+    if connection is not None:
+        connection[1].close()
+
+
+def run_clients(config: dict, clients: range) -> dict:
+    """
+    Runs some of the clients of the benchmark in this process.
+    :param config: configuration of the benchmark
+    :param clients: identifiers of the clients
+    :return: latencies of each method, status codes, errors and transferred bytes
+    """
+    results = {"latencies": {}, "status": Counter(), "errors": 0, "bytes": 0}
+
+    async def run():
+        start = time.monotonic() + config["warmup"]
+        await asyncio.gather(*(run_client(client, config, start, results) for client in clients))
+
+    asyncio.run(run())
+    return results
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    """
+    Computes the statistics of the latencies of the requests.
+    :param latencies: latencies in seconds
+    :return: mean, percentiles (nearest-rank) and maximum in milliseconds
+    """
+    if not latencies:
+        return {}
+    latencies = sorted(latencies)
+
+    def percentile(q: float) -> float:
+        return latencies[max(0, math.ceil(q * len(latencies)) - 1)] * 1000
+
+    return {
+        "mean": sum(latencies) / len(latencies) * 1000,
+        "p50": percentile(0.5),
+        "p99": percentile(0.99),
+        "p999": percentile(0.999),
+        "max": latencies[-1] * 1000,
+    }
+
+
+def run_benchmark(args: argparse.Namespace) -> dict:
+    """
+    Starts the server, runs the clients (split among the load processes) and stops the server.
+    :param args: arguments of the command line
+    :return: report of the benchmark
+    """
+    server_args = ["-e", args.engine, "-w", str(args.workers), "-t", str(args.threads)] + \
+        shlex.split(args.server_args)
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir:
+        hosts, files = prepare_sites(workdir)
+        # Size classes without files cannot be requested
+        size_mix = {size_class: weight for size_class, weight in args.size_mix.items() if files[size_class]}
+        if not size_mix:
+            raise RuntimeError("There are no files of the requested sizes in the virtual hosts")
+        largest = max(size for size_class in size_mix for _, _, size in files[size_class])
+        config = {
+            "port": args.port,
+            "hosts": hosts,
+            "files": files,
+            "method_mix": args.method_mix,
+            "size_mix": size_mix,
+            "keep_alive": not args.close,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "payload": os.urandom(largest),
+        }
+        # Clients are split among the processes, so the load generator is not limited to a single core
+        processes = max(1, min(args.processes, args.concurrency))
+        groups = [range(first, args.concurrency, processes) for first in range(processes)]
+
+        server = start_server(workdir, args.port, server_args)
+        try:
+            if processes == 1:
+                partial = [run_clients(config, groups[0])]
+            else:
+                with multiprocessing.Pool(processes) as pool:
+                    partial = pool.starmap(run_clients, [(config, group) for group in groups])
+        finally:
+            stop_server(server)
+
+    latencies, status, errors, transferred = {}, Counter(), 0, 0
+    for results in partial:
+        for method, values in results["latencies"].items():
+            latencies.setdefault(method, []).extend(values)
+        status.update(results["status"])
+        errors += results["errors"]
+        transferred += results["bytes"]
+    requests = sum(len(values) for values in latencies.values())
+
+    return {
+        "config": {
+            "engine": args.engine,
+            "workers": args.workers,
+            "threads": args.threads,
+            "server_args": args.server_args,
+            "concurrency": args.concurrency,
+            "processes": processes,
+            "keep_alive": not args.close,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "method_mix": args.method_mix,
+            "size_mix": size_mix,
+            "seed": args.seed,
+        },
+        "requests": requests,
+        "errors": errors,
+        "requests_per_second": requests / args.duration,
+        "bytes_per_second": transferred / args.duration,
+        "latency_ms": summarize([value for values in latencies.values() for value in values]),
+        "status": dict(sorted(status.items())),
+        "methods": {method: {"requests": len(values), "latency_ms": summarize(values)}
+                    for method, values in sorted(latencies.items())},
+    }
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the server, which reports the results as JSON")
+    parser.add_argument("-p", "--port", type=int, nargs='?', const=None, default=None,
+                        help="port of the server (a free one by default)")
+    parser.add_argument("-e", "--engine", type=str, nargs='?', const=DEFAULT_ENGINE, default=DEFAULT_ENGINE,
+                        help="engine of the server")
+    parser.add_argument("-w", "--workers", type=int, nargs='?', const=DEFAULT_WORKERS, default=DEFAULT_WORKERS,
+                        help="number of worker processes of the server")
+    parser.add_argument("-t", "--threads", type=int, nargs='?', const=DEFAULT_THREADS, default=DEFAULT_THREADS,
+                        help="number of worker threads of the server (threaded engine)")
+    parser.add_argument("--server-args", type=str, nargs='?', const="", default="",
+                        help="extra arguments for the server (e.g. \"--cache-size 0\")")
+    parser.add_argument("-c", "--concurrency", type=int, nargs='?', const=16, default=16,
+                        help="number of concurrent clients (each one with its own connection)")
+    parser.add_argument("-P", "--processes", type=int, nargs='?', const=1, default=1,
+                        help="number of processes generating the load")
+    parser.add_argument("-d", "--duration", type=float, nargs='?', const=10, default=10,
+                        help="seconds during which the requests are measured")
+    parser.add_argument("--warmup", type=float, nargs='?', const=1, default=1,
+                        help="seconds of requests before the measurements start")
+    parser.add_argument("--close", action="store_true",
+                        help="open a new connection for each request, instead of keeping them alive")
+    parser.add_argument("-m", "--method-mix", type=parse_mix, nargs='?', const=DEFAULT_METHOD_MIX,
+                        default=DEFAULT_METHOD_MIX, help="weights of the methods of the requests")
+    parser.add_argument("-s", "--size-mix", type=parse_mix, nargs='?', const=DEFAULT_SIZE_MIX,
+                        default=DEFAULT_SIZE_MIX, help="weights of the sizes of the files ({})".format(
+                            ", ".join("{} < {}".format(name, limit) for name, limit in SIZE_CLASSES.items()
+                                      if limit != math.inf)))
+    parser.add_argument("--seed", type=int, nargs='?', const=0, default=0,
+                        help="seed of the random choices of the clients")
+    parser.add_argument("-o", "--output", type=str, nargs='?', const=None, default=None,
+                        help="file where the JSON report is written (standard output by default)")
+    args = parser.parse_args()
+
+    if set(args.method_mix) - set(METHODS):
+        parser.error("Methods must be some of {}".format(", ".join(METHODS)))
+    if set(args.size_mix) - set(SIZE_CLASSES):
+        parser.error("Sizes must be some of {}".format(", ".join(SIZE_CLASSES)))
+    if args.concurrency < 1 or args.duration <= 0 or args.warmup < 0:
+        parser.error("Concurrency and duration must be positive")
+    if args.port is None:
+        args.port = get_free_port()
+
+    report = json.dumps(run_benchmark(args), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
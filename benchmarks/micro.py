@@ -0,0 +1,251 @@
+#!/usr/bin/python3
+
+"""
+Microbenchmarks of the hot paths of the server (parsing requests, checking paths and serializing responses). Each case
+reports its time per call and the memory it allocates (measured with tracemalloc), and the results are compared with
+a stored baseline, so regressions are noticed before they reach production. Allocations do not depend on the load of the
+machine, so growing them fails the comparison, while slower timings are only reported (unless --fail-on-time is given).
+Run it from the root of the repository: python3 benchmarks/micro.py (or with --save to store a new baseline)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, ROOT)
+
+from http.enums import HttpResponseCode  # noqa: E402
+from http.header import HttpHeader, HEADER_CONTENT_TYPE, HEADER_CONTENT_TYPE_TEXT_PLAIN  # noqa: E402
+from http.request import HttpRequest  # noqa: E402
+from http.response import HttpResponse, HttpResponseNotFound  # noqa: E402
+from settings import MAX_HEADER_SIZE  # noqa: E402
+from utils.entity import generate_output  # noqa: E402
+from utils.registry import VhostRegistry  # noqa: E402
+from utils.vhosts import Vhost  # noqa: E402
+from output import FILE_HEADERS  # noqa: E402
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Rounds of each timing: their median is compared, and their spread tells how noisy the measurement was
+REPEAT = 15
+# Calls whose allocations are averaged, and calls whose smallest peak is taken (a single call may also fill a cache)
+ALLOCATION_CALLS = 100
+PEAK_CALLS = 5
+# Slowdown (or growth of the allocations) that is reported as a regression
+DEFAULT_THRESHOLD = 1.25
+# Smallest reference value of the compared metrics (as a few nanoseconds or bytes more than a tiny value would always
+# look like a regression)
+TIME_MINIMUM = 0.5
+ALLOCATION_METRICS = {
+    "peak_bytes": 64,
+    "retained_bytes": 64,
+}
+
+RAW_MINIMAL = b"GET / HTTP/1.1\r\nHost: guyincognito.ch\r\n\r\n"
+RAW_BROWSER = (
+    b"GET /images/avatar.png?v=3 HTTP/1.1\r\n"
+    b"Host: guyincognito.ch:8080\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:109.0) Gecko/20100101 Firefox/115.0\r\n"
+    b"Accept: image/avif,image/webp,*/*\r\n"
+    b"Accept-Language: en-US,en;q=0.5\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Referer: http://guyincognito.ch/\r\n"
+    b"Cookie: session=0123456789abcdef; theme=dark\r\n"
+    b"If-None-Match: \"11e06f-8bf-16f08c192ce13600\"\r\n"
+    b"If-Modified-Since: Thu, 19 May 2022 15:45:03 GMT\r\n"
+    b"Cache-Control: max-age=0\r\n"
+    b"\r\n"
+)
+RAW_PUT = b"PUT /uploads/file.txt HTTP/1.1\r\nHost: marina.ch\r\nContent-Length: 1048576\r\n\r\n"
+
+# Paths as long as the head of a request can be, which make the check walk every segment
+PATH_LENGTH = MAX_HEADER_SIZE - len("GET  HTTP/1.1\r\n\r\n")
+ADVERSARIAL_PATHS = {
+    "plain": "/assets/css/features.css",
+    "deep_valid": "/" + "a/../" * (PATH_LENGTH // 5),
+    "empty_segments": "/" * PATH_LENGTH,
+    "dot_segments": "/." * (PATH_LENGTH // 2),
+    "late_escape": "/" + "a/" * (PATH_LENGTH // 6) + "../" * (PATH_LENGTH // 6 + 1),
+}
+
+
+def build_cases(hosts: VhostRegistry) -> Dict[str, Callable[[], object]]:
+    """
+    Generates the benchmarked cases.
+    :param hosts: virtual hosts of the server
+    :return: function of each case, which returns what it generates (so its memory can be measured)
+    """
+    def parse(raw: bytes) -> Callable[[], HttpRequest]:
+        def case():
+            request = HttpRequest(raw)
+            request.parse_request(hosts)
+            return request
+        return case
+
+    def secure_path(path: str) -> Callable[[], bool]:
+        return lambda: Vhost.is_secure_path(path)
+
+    get_request = parse(RAW_BROWSER)()
+    info_request = parse(RAW_MINIMAL)()
+    content = b"x" * 2048
+
+    def file_response() -> HttpResponse:
+        response = HttpResponse(content=content)
+        for header in FILE_HEADERS:
+            response.add_header(header.name, header)
+        return response
+
+    def info_response() -> HttpResponse:
+        response = HttpResponse(content="The administrator of guyincognito.ch is Guy Incognito.")
+        response.add_header(HEADER_CONTENT_TYPE, HttpHeader(HEADER_CONTENT_TYPE, HEADER_CONTENT_TYPE_TEXT_PLAIN))
+        return response
+
+    cases = {
+        "request_minimal": parse(RAW_MINIMAL),
+        "request_browser": parse(RAW_BROWSER),
+        "request_put": parse(RAW_PUT),
+    }
+    for name, path in ADVERSARIAL_PATHS.items():
+        cases["secure_path_" + name] = secure_path(path)
+    cases.update({
+        "response_bytes_file": lambda: bytes(file_response()),
+        "response_bytes_info": lambda: bytes(info_response()),
+        "output_file": lambda: generate_output(get_request, file_response()),
+        "output_info": lambda: generate_output(info_request, info_response()),
+        "output_not_found": lambda: generate_output(info_request, HttpResponseNotFound(
+            content=HttpResponseCode.NOT_FOUND.get_reason())),
+    })
+    return cases
+
+
+def measure(case: Callable[[], object]) -> Dict[str, float]:
+    """
+    Measures the time and the memory needed by a case.
+    :param case: function of the case
+    :return: minimum and median time per call (in microseconds) and the interquartile range of the rounds, peak of
+             memory allocated during a call, and memory (bytes and blocks) retained by the result of a call
+    """
+    number, _ = timeit.Timer(case).autorange()
+    timings = [timing / number * 1e6 for timing in timeit.repeat(case, number=number, repeat=REPEAT)]
+    quartiles = statistics.quantiles(timings, n=4)
+
+    tracemalloc.start()
+    try:
+        # Peak of a single call (including the memory which is released before it returns)
+        peak = None
+        for _ in range(PEAK_CALLS):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            case()
+            _, current = tracemalloc.get_traced_memory()
+            peak = current - before if peak is None else min(peak, current - before)
+
+        # Memory kept by the results, averaged over several calls (the list that keeps them is allocated before)
+        results = [None] * ALLOCATION_CALLS
+        snapshot = tracemalloc.take_snapshot()
+        for call in range(ALLOCATION_CALLS):
+            results[call] = case()
+        retained = tracemalloc.take_snapshot().compare_to(snapshot, "filename")
+        del results
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "time_min_us": min(timings),
+        "time_median_us": statistics.median(timings),
+        "time_spread_us": quartiles[2] - quartiles[0],
+        "peak_bytes": peak,
+        "retained_bytes": sum(stat.size_diff for stat in retained) / ALLOCATION_CALLS,
+        "retained_blocks": sum(stat.count_diff for stat in retained) / ALLOCATION_CALLS,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> Tuple[Dict[str, list],
+                                                                                           Dict[str, float]]:
+    """
+    Compares the results with the baseline.
+    :param results: measurements of each case
+    :param baseline: stored measurements of each case
+    :param threshold: ratio from which a slower time or larger allocations are a regression
+    :return: regressed allocation metrics of each case, and ratio of the median time of the cases which are slower (by
+             more than the spread of both measurements, which is only noise from the system)
+    """
+    regressions = {}
+    slowdowns = {}
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]
+        for metric, minimum in ALLOCATION_METRICS.items():
+            if result[metric] > max(reference[metric], minimum) * threshold:
+                regressions.setdefault(name, []).append(metric)
+        median = max(reference["time_median_us"], TIME_MINIMUM)
+        noise = result["time_spread_us"] + reference.get("time_spread_us", 0)
+        if result["time_median_us"] - noise > median * threshold:
+            slowdowns[name] = result["time_median_us"] / median
+    return regressions, slowdowns
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the hot paths of the server")
+    parser.add_argument("-k", "--filter", type=str, nargs='?', const="", default="",
+                        help="only run the cases whose name contains the given text")
+    parser.add_argument("--baseline", type=str, nargs='?', const=BASELINE_FILE, default=BASELINE_FILE,
+                        help="file with the stored results to compare with")
+    parser.add_argument("--save", action="store_true",
+                        help="store the results as the new baseline instead of comparing them")
+    parser.add_argument("--threshold", type=float, nargs='?', const=DEFAULT_THRESHOLD, default=DEFAULT_THRESHOLD,
+                        help="ratio from which a case is reported as a regression")
+    parser.add_argument("--fail-on-time", action="store_true",
+                        help="also exit with an error if a case is slower (timings depend on the load of the machine)")
+    parser.add_argument("--json", action="store_true",
+                        help="print the results as JSON")
+    args = parser.parse_args()
+
+    cases = {name: case for name, case in build_cases(VhostRegistry.parse_file()).items() if args.filter in name}
+    results = {name: measure(case) for name, case in cases.items()}
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions, slowdowns = compare(results, baseline, args.threshold)
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions, "slowdowns": slowdowns}, indent=2))
+    else:
+        print("{:<28} {:>10} {:>10} {:>10} {:>10} {:>10} {:>8}  {}".format(
+            "case", "min us", "median us", "spread us", "peak B", "kept B", "blocks", "vs baseline"))
+        for name, result in results.items():
+            ratio = ""
+            if name in baseline:
+                ratio = "{:.2f}x".format(result["time_median_us"] / baseline[name]["time_median_us"])
+                if name in slowdowns:
+                    ratio += " SLOWER"
+                if name in regressions:
+                    ratio += " REGRESSION " + ", ".join(regressions[name])
+            print("{:<28} {:>10.2f} {:>10.2f} {:>10.2f} {:>10.0f} {:>10.0f} {:>8.1f}  {}".format(
+                name, result["time_min_us"], result["time_median_us"], result["time_spread_us"],
+                result["peak_bytes"], result["retained_bytes"], result["retained_blocks"], ratio))
+
+    if args.save:
+        # Keep the cases that were not run this time
+        stored = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                stored = json.load(f)
+        stored.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+            f.write("\n")
+    elif regressions or (slowdowns and args.fail_on_time):
+        sys.exit(1)
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+"""
+Microbenchmark of the serialization of responses: measures the time needed to turn an already generated response
+into the buffers that are written to the socket, for contents of several sizes.
+Run it from the root of the repository: python3 benchmarks/output.py
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.header import HttpHeader, HEADER_CONTENT_TYPE, HEADER_ETAG, HEADER_LAST_MODIFIED, \
+    HEADER_ACCEPT_RANGES, HEADER_ACCEPT_RANGES_BYTES  # noqa: E402
+from http.request import HttpRequest  # noqa: E402
+from http.response import HttpResponse  # noqa: E402
+from utils.entity import generate_output  # noqa: E402
+from utils.registry import VhostRegistry  # noqa: E402
+
+RAW_REQUEST = b"GET /home.html HTTP/1.1\r\nHost: guyincognito.ch\r\nAccept: */*\r\n\r\n"
+# Headers of a cached file, which are shared by all the responses of that file
+FILE_HEADERS = [
+    HttpHeader(HEADER_CONTENT_TYPE, "text/html"),
+    HttpHeader(HEADER_ETAG, '"5f2b1c-1a2b"'),
+    HttpHeader(HEADER_LAST_MODIFIED, "Sun, 18 Oct 2026 10:00:00 GMT"),
+    HttpHeader(HEADER_ACCEPT_RANGES, HEADER_ACCEPT_RANGES_BYTES),
+]
+CONTENT_SIZES = (0, 1024, 64 * 1024)
+
+
+def bench_output(request: HttpRequest, content: bytes, number: int) -> float:
+    """
+    Measures the serialization of a response with the given content.
+    :param request: parsed request being answered
+    :param content: contents of the response
+    :param number: number of responses to be serialized
+    :return: mean time per response in microseconds
+    """
+    def serialize():
+        response = HttpResponse(content=content)
+        for header in FILE_HEADERS:
+            response.add_header(header.name, header)
+        generate_output(request, response)
+
+    return min(timeit.repeat(serialize, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark of the serialization of responses")
+    parser.add_argument("-n", "--number", type=int, nargs='?', const=20000, default=20000,
+                        help="number of responses serialized in each round")
+    args = parser.parse_args()
+
+    request = HttpRequest(RAW_REQUEST)
+    request.parse_request(VhostRegistry.parse_file())
+    for size in CONTENT_SIZES:
+        print("{:>8} bytes: {:8.2f} us/response".format(size, bench_output(request, b"x" * size, args.number)))
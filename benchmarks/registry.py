@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+
+"""
+Benchmark of the virtual hosts registry: measures the time needed to load a file with the given numbers of tenants
+(half of them with exact hostnames and half with wildcards) and to find the host of a request, so it can be checked
+that neither of them grows with the number of tenants.
+Run it from the root of the repository: python3 benchmarks/registry.py
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.registry import VhostRegistry  # noqa: E402
+
+
+def write_hosts(path: str, tenants: int):
+    """
+    Writes a virtual hosts file.
+    :param path: path of the file
+    :param tenants: number of hosts in the file
+    """
+    with open(path, "w") as f:
+        for tenant in range(tenants):
+            hostname = "site{}.ch".format(tenant) if tenant % 2 == 0 else "*.tenant{}.example.ch".format(tenant)
+            f.write("{},index.html,Tenant {},admin@site{}.ch\n".format(hostname, tenant, tenant))
+
+
+def bench_registry(tenants: int, number: int) -> dict:
+    """
+    Measures loading a registry and finding hosts in it.
+    :param tenants: number of hosts in the registry
+    :param number: number of lookups in each round
+    :return: loading time in milliseconds, and time per lookup in microseconds of each kind of hostname
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "vhosts.conf")
+        write_hosts(path, tenants)
+        start = time.perf_counter()
+        registry = VhostRegistry.parse_file(path)
+        load = (time.perf_counter() - start) * 1e3
+
+    hostnames = {
+        "exact": "site0.ch",
+        "wildcard": "www.tenant1.example.ch",
+        "missing": "www.unknown.example.ch",
+    }
+    result = {"load": load}
+    for kind, hostname in hostnames.items():
+        timing = min(timeit.repeat(lambda: registry.find(hostname), number=number, repeat=5))
+        result[kind] = timing / number * 1e6
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the virtual hosts registry")
+    parser.add_argument("-t", "--tenants", type=int, nargs='*', default=[10, 1000, 10000, 100000],
+                        help="numbers of hosts to be measured (at least 2)")
+    parser.add_argument("-n", "--number", type=int, nargs='?', const=100000, default=100000,
+                        help="number of lookups in each round")
+    args = parser.parse_args()
+
+    print("{:>10} {:>10} {:>12} {:>12} {:>12}".format("tenants", "load ms", "exact us", "wildcard us", "missing us"))
+    for tenants in args.tenants:
+        result = bench_registry(tenants, args.number)
+        print("{:>10} {:>10.1f} {:>12.3f} {:>12.3f} {:>12.3f}".format(
+            tenants, result["load"], result["exact"], result["wildcard"], result["missing"]))
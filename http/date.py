@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import time
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+# HTTP dates (RFC 7231) are always in English and in GMT, so they are generated without depending on the locale.
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# Current second and its formatted date. It is replaced as a whole (never modified), so threads and event loops can
+# share it without locks
+_current_date = (0, "")
+
+
+def format_http_date(timestamp: float) -> str:
+    """
+    Formats a timestamp as an HTTP date.
+    :param timestamp: seconds since the epoch
+    :return: "Day, DD Mon YYYY HH:MM:SS GMT"
+    """
+    t = time.gmtime(timestamp)
+    return "{}, {:02d} {} {:04d} {:02d}:{:02d}:{:02d} GMT".format(
+        DAY_NAMES[t.tm_wday], t.tm_mday, MONTH_NAMES[t.tm_mon - 1], t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def get_current_http_date() -> str:
+    """
+    Returns the current date formatted as an HTTP date (for the Date header). The date is only formatted again
+    when the second changes.
+    :return: "Day, DD Mon YYYY HH:MM:SS GMT"
+    """
+    global _current_date
+    now = int(time.time())
+    current = _current_date
+    if current[0] != now:
+        # Several threads may format it at the same time, but all of them get the same result
+        current = (now, format_http_date(now))
+        _current_date = current
+    return current[1]
+
+
+def parse_http_date(value: str) -> float | None:
+    """
+    Parses an HTTP date.
+    :param value: HTTP date, as received in a header
+    :return: seconds since the epoch, or None if the date is not valid
+    """
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date.tzinfo is None:
+        # HTTP dates are always in GMT
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
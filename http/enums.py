@@ -1,5 +1,7 @@
 from enum import Enum
 
+from settings import HEADER_ENCODING
+
 # This file defines several enums that are used by the HTTP server in order to build a cleaner implementation of
 # the HTTP protocol.
 
@@ -27,6 +29,7 @@ class HttpMethod(Enum):
     PUT = "PUT"
     DELETE = "DELETE"
     NTW22INFO = "NTW22INFO"
+    NTW22DEPLOY = "NTW22DEPLOY"
 
     def __str__(self):
         """
@@ -42,15 +45,24 @@ class HttpResponseCode(Enum):
     """
     OK = 200, "OK"
     CREATED = 201, "Created"
+    PARTIAL_CONTENT = 206, "Partial Content"
+
+    NOT_MODIFIED = 304, "Not Modified"
 
     BAD_REQUEST = 400, "Bad Request"
     FORBIDDEN = 403, "Forbidden"
     NOT_FOUND = 404, "Not Found"
     METHOD_NOT_ALLOWED = 405, "Method Not Allowed"
+    REQUEST_TIMEOUT = 408, "Request Timeout"
+    CONFLICT = 409, "Conflict"
+    PAYLOAD_TOO_LARGE = 413, "Payload Too Large"
     UNSUPPORTED_MEDIA_TYPE = 415, "Unsupported Media Type"
+    RANGE_NOT_SATISFIABLE = 416, "Range Not Satisfiable"
+    REQUEST_HEADER_FIELDS_TOO_LARGE = 431, "Request Header Fields Too Large"
 
     INTERNAL_SERVER_ERROR = 500, "Internal Server Error"
     NOT_IMPLEMENTED = 501, "Not Implemented"
+    SERVICE_UNAVAILABLE = 503, "Service Unavailable"
     HTTP_VERSION_NOT_SUPPORTED = 505, "HTTP Version Not Supported"
 
     def get_code(self) -> int:
@@ -65,3 +77,22 @@ class HttpResponseCode(Enum):
         :return: "CODE Reason-Phrase"
         """
         return "{} {}".format(self.value[0], self.value[1])
+
+    def get_status_line(self, version: HttpVersion) -> bytes:
+        """
+        Returns the already encoded status line of a response with this code.
+        :param version: HTTP version of the response
+        :return: b"HTTP/X.X CODE Reason-Phrase\r\n"
+        """
+        return STATUS_LINES[version, self]
+
+
+# Methods and versions by their raw name in the request-line, so they are found with a single lookup
+METHODS = {method.value.encode(HEADER_ENCODING): method for method in HttpMethod}
+VERSIONS = {version.value.encode(HEADER_ENCODING): version for version in HttpVersion}
+
+# Status lines are generated once, as they are sent in every response
+STATUS_LINES = {
+    (version, status): "{} {}\r\n".format(version, status).encode(HEADER_ENCODING)
+    for version in HttpVersion for status in HttpResponseCode
+}
@@ -1,25 +1,73 @@
+from settings import HTTP_ENCODING
+
 HEADER_HOST = 'Host'
+HEADER_ACCEPT_ENCODING = 'Accept-Encoding'
+HEADER_ACCEPT_RANGES = 'Accept-Ranges'
+HEADER_ACCEPT_RANGES_BYTES = 'bytes'
 HEADER_CONNECTION = 'Connection'
 HEADER_CONNECTION_CLOSE = 'close'
+HEADER_CONTENT_ENCODING = 'Content-Encoding'
 HEADER_CONTENT_LENGTH = 'Content-Length'
 HEADER_CONTENT_LOCATION = 'Content-Location'
+HEADER_CONTENT_RANGE = 'Content-Range'
 HEADER_CONTENT_TYPE = 'Content-Type'
 HEADER_CONTENT_TYPE_TEXT_PLAIN = 'text/plain'
 HEADER_CONTENT_TYPE_TEXT_HTML = 'text/html'
+HEADER_CONTENT_TYPE_MULTIPART_BYTERANGES = 'multipart/byteranges'
 HEADER_DATE = 'Date'
+HEADER_ETAG = 'ETag'
+HEADER_IF_MODIFIED_SINCE = 'If-Modified-Since'
+HEADER_IF_NONE_MATCH = 'If-None-Match'
+HEADER_IF_RANGE = 'If-Range'
+HEADER_LAST_MODIFIED = 'Last-Modified'
+HEADER_RANGE = 'Range'
+HEADER_RETRY_AFTER = 'Retry-After'
 HEADER_SERVER = 'Server'
+HEADER_TRANSFER_ENCODING = 'Transfer-Encoding'
+HEADER_TRANSFER_ENCODING_CHUNKED = 'chunked'
+HEADER_VARY = 'Vary'
 
 
 class HttpHeader:
     """
     Defines a new HTTP header, with the given name and value.
+    The encoded header line is generated only once, so the headers that are shared by many responses (e.g. the ones
+    of cached files) are not serialized again for each of them.
     """
-    name = None
-    value = None
+    # Encoded "Name: Value\r\n" line is None until it is needed (or after changing the header)
+    __slots__ = ("__name", "__value", "__line")
 
     def __init__(self, name: str, value: str):
-        self.name = name
-        self.value = value
+        self.__name = name
+        self.__value = value
+        self.__line = None
+
+    @property
+    def name(self) -> str:
+        return self.__name
+
+    @name.setter
+    def name(self, name: str):
+        self.__name = name
+        self.__line = None
+
+    @property
+    def value(self) -> str:
+        return self.__value
+
+    @value.setter
+    def value(self, value: str):
+        self.__value = value
+        self.__line = None
+
+    def to_bytes(self) -> bytes:
+        """
+        Returns the header line as sent in a response.
+        :return: b"Name: Value\r\n"
+        """
+        if self.__line is None:
+            self.__line = "{}: {}\r\n".format(self.__name, self.__value).encode(HTTP_ENCODING)
+        return self.__line
 
     def __eq__(self, other):
         """
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import socket
+from typing import Callable
+
+from http.response import HttpResponseBadRequest, HttpResponseRequestHeaderFieldsTooLarge, \
+    HttpResponseRequestTimeout
+from settings import RECV_SIZE
+
+HEAD_TERMINATOR = b"\r\n\r\n"
+LINE_TERMINATOR = b"\r\n"
+
+
+class HttpStreamReader:
+    """
+    Buffered reader for the data received in a connection. The buffer is kept between requests, so data received
+    after the end of a request is not lost.
+    Request heads are extracted from the buffer once they are complete, while request bodies are streamed in chunks
+    through the given recv function (which must block until some data is available).
+    The buffer is an immutable bytes object plus the position of the first unread byte, so body chunks can be
+    returned as views of the received data without copying them.
+    """
+    __recv = None
+    __buffer = None
+    # Position of the first byte in the buffer that has not been read yet
+    __offset = 0
+    # Position of the buffer until which the head terminator has already been searched
+    __scanned = 0
+
+    def __init__(self, recv: Callable[[int], bytes]):
+        self.__recv = recv
+        self.__buffer = b""
+        self.__offset = 0
+        self.__scanned = 0
+
+    def feed(self, data: bytes):
+        """
+        Appends data received from the connection to the buffer.
+        :param data: received data
+        """
+        if self.__offset == len(self.__buffer):
+            # Everything has been read, so the received data becomes the buffer (no copy needed)
+            self.__buffer = data
+            self.__scanned = 0
+        else:
+            # Only the unread data is kept along with the received one
+            self.__scanned = max(0, self.__scanned - self.__offset)
+            self.__buffer = self.__buffer[self.__offset:] + data
+        self.__offset = 0
+
+    def fill(self) -> bool:
+        """
+        Receives more data from the connection and appends it to the buffer.
+        :return: False if the connection has been closed by the client
+        """
+        data = self.__recv(RECV_SIZE)
+        if not data:
+            return False
+        self.feed(data)
+        return True
+
+    def has_data(self) -> bool:
+        return self.__offset < len(self.__buffer)
+
+    def has_head(self) -> bool:
+        """
+        Checks if the head of the next request has already been completely received, without extracting it.
+        :return: True if the head can be taken right away
+        """
+        start = max(self.__offset, self.__scanned - len(HEAD_TERMINATOR) + 1)
+        return self.__buffer.find(HEAD_TERMINATOR, start) >= 0
+
+    def take_head(self, max_size: int) -> bytes | None:
+        """
+        Extracts the head of the request (request-line and headers, including the final empty line) from the
+        buffer, if it has been completely received.
+        :param max_size: maximum allowed size for the head
+        :return: head of the request, or None if it is not complete yet
+        """
+        # The terminator could have started at the end of the previously scanned data
+        start = max(self.__offset, self.__scanned - len(HEAD_TERMINATOR) + 1)
+        end = self.__buffer.find(HEAD_TERMINATOR, start)
+        if end < 0:
+            self.__scanned = len(self.__buffer)
+            if self.__scanned - self.__offset > max_size:
+                raise HttpResponseRequestHeaderFieldsTooLarge(content="Request head is too large")
+            return None
+
+        end += len(HEAD_TERMINATOR)
+        if end - self.__offset > max_size:
+            raise HttpResponseRequestHeaderFieldsTooLarge(content="Request head is too large")
+        head = self.__buffer[self.__offset:end]
+        self.__offset = end
+        self.__scanned = end
+        return head
+
+    def read_line(self, max_size: int) -> bytes:
+        """
+        Reads a line of the request body (e.g. the size of a chunk), receiving more data from the connection until
+        it is complete.
+        :param max_size: maximum allowed size for the line
+        :return: line, without the final CRLF
+        """
+        end = self.__buffer.find(LINE_TERMINATOR, self.__offset)
+        while end < 0:
+            if len(self.__buffer) - self.__offset > max_size:
+                raise HttpResponseBadRequest(content="Line in the request body is too long")
+            # Do not search again the data already searched (except the last byte, which may be a CR)
+            start = max(self.__offset, len(self.__buffer) - 1)
+            try:
+                data = self.__recv(RECV_SIZE)
+            except socket.timeout:
+                raise HttpResponseRequestTimeout(content="Timed out while receiving the request body")
+            if not data:
+                raise HttpResponseBadRequest(content="Connection closed while receiving the request body")
+            start -= self.__offset
+            self.feed(data)
+            end = self.__buffer.find(LINE_TERMINATOR, start)
+
+        if end - self.__offset > max_size:
+            raise HttpResponseBadRequest(content="Line in the request body is too long")
+        line = self.__buffer[self.__offset:end]
+        self.__offset = end + len(LINE_TERMINATOR)
+        return line
+
+    def read(self, size: int) -> memoryview:
+        """
+        Reads up to size bytes, first from the buffer and, once empty, from the connection.
+        :param size: maximum number of bytes to read
+        :return: view of the read data (empty if the connection has been closed by the client)
+        """
+        if not self.has_data():
+            try:
+                # Avoid going through the buffer
+                return memoryview(self.__recv(min(size, RECV_SIZE)))
+            except socket.timeout:
+                raise HttpResponseRequestTimeout(content="Timed out while receiving the request body")
+
+        end = min(self.__offset + size, len(self.__buffer))
+        data = memoryview(self.__buffer)[self.__offset:end]
+        self.__offset = end
+        return data
@@ -1,14 +1,21 @@
 from __future__ import annotations
 
-from typing import List, Dict
+import re
+from typing import List, Dict, Iterator
 
-from http.enums import HttpMethod, HttpVersion
-from http.header import HttpHeader, HEADER_CONTENT_LENGTH, HEADER_HOST
+from http.enums import METHODS, VERSIONS, HttpMethod, HttpVersion
+from http.header import HttpHeader, HEADER_CONTENT_LENGTH, HEADER_HOST, HEADER_TRANSFER_ENCODING, \
+    HEADER_TRANSFER_ENCODING_CHUNKED
+from http.reader import HttpStreamReader
 from http.response import HttpResponseBadRequest, HttpResponseNotImplemented, HttpResponseHttpVersionNotSupported, \
-    HttpResponseForbidden, HttpResponseNotFound
-from settings import HTTP_ENCODING
+    HttpResponseForbidden, HttpResponseNotFound, HttpResponsePayloadTooLarge, HttpResponseError
+from settings import HTTP_ENCODING, HEADER_ENCODING, MAX_BODY_SIZE, RECV_SIZE, MAX_CHUNK_LINE_SIZE
+from utils.registry import VhostRegistry
 from utils.vhosts import Vhost
 
+# Size of a chunk of the body, in hexadecimal
+CHUNK_SIZE = re.compile(rb"[0-9A-Fa-f]{1,16}")
+
 
 class HttpRequest:
     """
@@ -16,24 +23,40 @@ class HttpRequest:
     and body (if present).
     Constructing the class will throw HttpResponseError with further information on why the request is not
     valid.
+    The body is not part of the raw bytes given to the constructor: it is streamed from the reader on demand.
+    There is one request alive per connection, so their attributes are stored in slots and the headers are kept as
+    received, only being decoded when they are looked up.
     """
-    # Note this lines variable is only used internally
-    __lines = None
-    __method, __path, __http_version = None, None, None
-    __headers = {}
-    __body = None
-    __vhost = None
-
-    def __init__(self, raw_bytes: bytes):
+    __slots__ = (
+        # Note this lines variable is only used internally
+        "__lines",
+        "__method", "__path", "__http_version",
+        # Raw (name, value) pairs of the headers, in the order they were received, and the position of each one by
+        # its lowercase name (built the first time a header is looked up)
+        "__headers", "__header_index",
+        "__vhost",
+        "__reader",
+        # Number of body bytes (of the current chunk, if chunked) that have not been read yet from the reader (None if
+        # body framing is unknown)
+        "__body_remaining",
+        # Chunked bodies are only finished once the last chunk is read
+        "__chunked", "__body_finished", "__body_size",
+        "__max_body_size",
+    )
+
+    def __init__(self, raw_bytes: bytes, reader: HttpStreamReader | None = None):
         """
-        Given an array of bytes, tries to parse the request.
-        :param raw_bytes:
+        Given the head of the request (request-line and headers) as an array of bytes, tries to parse the
+        request.
+        :param raw_bytes: head of the request, including the final empty line
+        :param reader: reader of the connection, from which the body will be streamed
         """
         if not raw_bytes:
             raise HttpResponseBadRequest(content="No data found to be parsed")
 
-        raw_data = raw_bytes.decode(HTTP_ENCODING)
-        self.__lines = raw_data.split("\r\n")
+        # The head is split as bytes, so only the needed parts are decoded later on (and the body is never part
+        # of it)
+        self.__lines = raw_bytes.split(b"\r\n")
         if len(self.__lines) == 0:
             raise HttpResponseBadRequest(content="No data found")
 
@@ -46,9 +69,15 @@ class HttpRequest:
         #       we can appropiately indicate headers and other HTTP data at a later stage.
 
         # Reset the rest of the fields
-        self.__headers = {}
-        self.__body = None
+        self.__headers = []
+        self.__header_index = None
         self.__vhost = None
+        self.__reader = reader
+        self.__body_remaining = None
+        self.__chunked = False
+        self.__body_finished = False
+        self.__body_size = 0
+        self.__max_body_size = None
 
     def __init_parse_requestline(self, lines):
         """
@@ -56,33 +85,47 @@ class HttpRequest:
         :param lines: list of lines in the request
         :return: None
         """
-        first_line_data = lines[0].split(" ")
+        first_line_data = lines[0].split(b" ")
         if len(first_line_data) != 3:
             # If we split the first line by the space, and does not have 3 elements, request is malformed
             raise HttpResponseBadRequest(content="Invalid request-line")
-        method, path, http_version = first_line_data
-
-        for avail_method in HttpMethod:
-            # Method is case sensitive, so no .upper()
-            if str(avail_method) == method:
-                method = avail_method
-                break
-        if isinstance(method, str):
+        try:
+            # The path may contain UTF-8 characters (method and version are plain ASCII tokens)
+            path = first_line_data[1].decode(HTTP_ENCODING)
+        except UnicodeDecodeError:
+            raise HttpResponseBadRequest(content="Could not decode the request-line")
+
+        # Method is case sensitive, so it is looked up as received
+        method = METHODS.get(first_line_data[0])
+        if method is None:
             # If we are not able to get the HttpMethod object from it, it is because we do not support
             # the request method
-            raise HttpResponseNotImplemented(content="Method {} is not available".format(method))
+            raise HttpResponseNotImplemented(content="Method {} is not available".format(
+                first_line_data[0].decode(HEADER_ENCODING)))
         self.__method = method
 
         # Check that path is an absolute URL (proxy-URL is not supported)
-        if path[0] != "/":
+        if not path.startswith("/"):
             raise HttpResponseBadRequest(content="Path must be absolute, starting with /")
         # Confirm that path is secure (does not try to access outside of host's folder scope)
         if not Vhost.is_secure_path(path):
             raise HttpResponseForbidden(content="Trying to access a folder outside the host root")
-        # Remove the starting /, and remove the query string as well
-        self.__path = path[1:].split("?")[0]
+        # Remove the starting / (all of them, so the path never becomes absolute), and remove the query string as well
+        self.__path = path.split("?")[0].lstrip("/")
+
+        # HTTP version is case-sensitive as well, and the supported ones are always valid
+        http_version = VERSIONS.get(first_line_data[2])
+        if http_version is None:
+            # Otherwise, tell apart malformed versions from the ones we do not support
+            HttpRequest.__check_http_version(first_line_data[2].decode(HEADER_ENCODING))
+        self.__http_version = http_version
 
-        # Now, try to parse the HTTP version
+    @staticmethod
+    def __check_http_version(http_version: str):
+        """
+        Given a HTTP version which is not supported, checks if it is a valid one.
+        :param http_version: HTTP version of the request-line
+        """
         http = http_version.split("/")
         if len(http) != 2:
             # It has to have two parts: HTTP SLASH VERSION
@@ -99,40 +142,31 @@ class HttpRequest:
                 raise ValueError()
         except ValueError:
             raise HttpResponseBadRequest(content="Could not parse HTTP version number")
+        # If it is valid, we do not support such version
+        raise HttpResponseHttpVersionNotSupported(content="HTTP version {} is not available".format(http_version))
 
-        for avail_version in HttpVersion:
-            # HTTP version is case-sensitive, so we cannot either apply .upper()
-            if str(avail_version) == http_version:
-                http_version = avail_version
-                break
-        if isinstance(http_version, str):
-            # If http_version is still a string, we do not support such version
-            raise HttpResponseHttpVersionNotSupported(content="HTTP version {} is not available".format(http_version))
-        self.__http_version = http_version
-
-    def parse_request(self, hosts: Dict[str, Vhost]):
+    def parse_request(self, hosts: VhostRegistry, max_body_size: int = MAX_BODY_SIZE):
         """
         Method that finishes parsing the raw request. Can only be invoked once, and must be invoked right after
-        constructing the object. It will get the remaining lines to be parsed, and extract both headers and
-        request body.
-        :param hosts: dictionary of available hosts in the server
+        constructing the object. It will get the remaining lines to be parsed, extract the headers and check how
+        long the request body is (the body itself is streamed later on).
+        :param hosts: available hosts in the server
+        :param max_body_size: maximum allowed size for the request body
         """
         # If lines is None, we have already parsed the request
         if self.__lines is None:
             return
 
         # Then we parse the header lines (which follow right after the request-line)
-        c_headers = self.__init_parse_headers(self.__lines[1:])
+        self.__init_parse_headers(self.__lines[1:])
 
-        # For HTTP/1.0, if no Host header is present, add it with the first entry (dictionaries in Python 3.6+
-        # are ordered)
+        # For HTTP/1.0, if no Host header is present, add it with the first entry
         if self.__http_version == HttpVersion.HTTP_10 and not self.has_header(HEADER_HOST):
-            try:
-                default_hostname = next(iter(hosts))
-            except StopIteration:
+            default_host = hosts.get_default()
+            if default_host is None:
                 # If no hosts in the file, then error
                 raise HttpResponseNotFound(content='No hosts availables')
-            self.__headers[HEADER_HOST.lower()] = HttpHeader(HEADER_HOST, default_hostname)
+            self.__set_header(HEADER_HOST, default_host.get_hostname())
 
         # Try to access the host
         host = self.get_header(HEADER_HOST)
@@ -140,14 +174,17 @@ class HttpRequest:
             # Host is missing (HTTP/1.1)
             raise HttpResponseBadRequest(content='Mising Host header')
         # Remove port from Host header
-        host.value = host.value.split(":")[0]
-        if host.value.lower() not in hosts:
+        hostname = host.value.split(":")[0]
+        if hostname != host.value:
+            self.__set_header(HEADER_HOST, hostname)
+        vhost = hosts.find(hostname)
+        if vhost is None or not vhost.is_available():
             # Host is not available
-            raise HttpResponseNotFound(content='Host {} is not found'.format(host.value))
-        self.__vhost = hosts[host.value.lower()]
+            raise HttpResponseNotFound(content='Host {} is not found'.format(hostname))
+        self.__vhost = vhost
 
-        # And finally, we parse the body (or we make sure that such body is not present)
-        self.__init_parse_body(self.__lines[(1 + c_headers + 1):])
+        # And finally, we check the length of the body
+        self.__init_parse_body(max_body_size)
 
         # And indicate that request has been parsed already
         self.__lines = None
@@ -162,15 +199,17 @@ class HttpRequest:
         found_crlf = False
         for line in lines:
             # If line is "blank", it is because it CRLF, so end of headers
-            if line == '':
+            if line == b'':
                 found_crlf = True
                 break
             # Try to parse header with format ': SPACE'
-            header = line.split(": ")
+            header = line.split(b": ")
             if len(header) != 2:
                 # Malformed header
-                raise HttpResponseBadRequest(content="Header '{}' is not a valid header format".format(line))
-            self.__headers[header[0].lower()] = HttpHeader(header[0], header[1])
+                raise HttpResponseBadRequest(content="Header '{}' is not a valid header format".format(
+                    line.decode(HEADER_ENCODING)))
+            # Header fields are kept as bytes, and only decoded if they are looked up
+            self.__headers.append((header[0], header[1]))
             count += 1
 
         if not found_crlf:
@@ -179,40 +218,123 @@ class HttpRequest:
             raise HttpResponseBadRequest(content="Could not find CRLF after headers parsing")
         return count
 
-    def __init_parse_body(self, lines):
+    def __init_parse_body(self, max_body_size: int):
         """
-        Function that given the remaining lines of the request, will check for the body if needed.
-        :param lines: "body" part
-        :return:
+        Function that checks the length of the body, so it can be streamed afterwards.
+        :param max_body_size: maximum allowed size for the request body
         """
+        self.__max_body_size = max_body_size
+        if self.has_header(HEADER_TRANSFER_ENCODING):
+            # Only chunked bodies are supported (without any other encoding)
+            if self.get_header(HEADER_TRANSFER_ENCODING).value.strip().lower() != HEADER_TRANSFER_ENCODING_CHUNKED:
+                raise HttpResponseNotImplemented(content="Transfer-Encoding is not supported")
+            if self.has_header(HEADER_CONTENT_LENGTH):
+                # Both of them would allow to smuggle requests, so the request is rejected
+                raise HttpResponseBadRequest(content="Content-Length cannot be used along with Transfer-Encoding")
+            self.__chunked = True
+            self.__body_remaining = 0
+            return
+
         if not self.has_header(HEADER_CONTENT_LENGTH):
-            # If no Content-Length header is present, it means that we can NOT receive any body. Thus, the remaining
-            # lines has to be an empty one (the CRLF that ends the request)
-            if len(lines) != 1 or lines[0] != '':
-                raise HttpResponseBadRequest(content="Expecting no request body, but found")
+            # If no Content-Length header is present, it means that we can NOT receive any body. Thus, any data
+            # after the head belongs to the next request
+            self.__body_remaining = 0
             return
 
         # Note that PUT method does not strictly require to have a body, nor GET or DELETE are forbidden to
         # contain such body.
         # https://stackoverflow.com/questions/1233372/is-an-http-put-request-required-to-include-a-body
-
-        # If Content-Length is present, we check if the length of the remaining data matches the specified
-        # Content-Length value
-        body = "\r\n".join(lines)
-        actual_length = len(body)
         try:
-            val = self.get_header(HEADER_CONTENT_LENGTH)
-            if val is None:
-                raise ValueError
-            # If the value of the header is not an integer, then it is malformed
-            expected_length = int(val.value)
+            # If the value of the header is not a positive integer, then it is malformed
+            expected_length = int(self.get_header(HEADER_CONTENT_LENGTH).value)
+            if expected_length < 0:
+                raise ValueError()
         except ValueError:
             raise HttpResponseBadRequest(content="Could not parse Content-Length")
 
-        if expected_length != actual_length:
-            raise HttpResponseBadRequest(content="Request body differs from the specified Content-Length value")
-        # And save the body data as binary
-        self.__body = body.encode(HTTP_ENCODING)
+        if expected_length > max_body_size:
+            raise HttpResponsePayloadTooLarge(content="Request body is larger than {} bytes".format(max_body_size))
+        self.__body_remaining = expected_length
+
+    def iter_body(self) -> Iterator[memoryview]:
+        """
+        Streams the request body from the connection, chunk after chunk. The body can only be streamed once.
+        Chunks are views of the received data, so they are never copied nor decoded.
+        :return: iterator over the chunks of the body
+        """
+        if self.__chunked:
+            yield from self.__iter_chunked_body()
+            return
+        while self.__body_remaining:
+            chunk = self.__reader.read(min(self.__body_remaining, RECV_SIZE))
+            if not chunk:
+                raise HttpResponseBadRequest(content="Request body differs from the specified Content-Length value")
+            self.__body_remaining -= len(chunk)
+            yield chunk
+
+    def __iter_chunked_body(self) -> Iterator[memoryview]:
+        """
+        Streams a body sent with the chunked transfer encoding, removing the framing of the chunks.
+        :return: iterator over the data of the chunks
+        """
+        while not self.__body_finished:
+            if self.__body_remaining == 0:
+                # Start of the next chunk
+                self.__init_parse_chunk_size()
+                continue
+
+            chunk = self.__reader.read(min(self.__body_remaining, RECV_SIZE))
+            if not chunk:
+                raise HttpResponseBadRequest(content="Connection closed while receiving the request body")
+            self.__body_remaining -= len(chunk)
+            if self.__body_remaining == 0 and self.__reader.read_line(1) != b"":
+                # The data of each chunk is followed by a CRLF (allow a single byte, as it may be the CR alone)
+                raise HttpResponseBadRequest(content="Chunk is longer than its specified size")
+            yield chunk
+
+    def __init_parse_chunk_size(self):
+        """
+        Parses the line that starts a chunk (its size in hexadecimal, and optional extensions which are ignored). On
+        the last chunk, the trailer headers are discarded as well.
+        """
+        size = self.__reader.read_line(MAX_CHUNK_LINE_SIZE).split(b";")[0].strip()
+        if not CHUNK_SIZE.fullmatch(size):
+            raise HttpResponseBadRequest(content="Could not parse the size of a chunk")
+        size = int(size, 16)
+
+        if size == 0:
+            # Last chunk, which may be followed by trailer headers until an empty line
+            while self.__reader.read_line(MAX_CHUNK_LINE_SIZE) != b"":
+                pass
+            self.__body_finished = True
+            return
+
+        self.__body_size += size
+        if self.__body_size > self.__max_body_size:
+            raise HttpResponsePayloadTooLarge(content="Request body is larger than {} bytes".format(
+                self.__max_body_size))
+        self.__body_remaining = size
+
+    def is_body_finished(self) -> bool:
+        # Checks if the whole body has been read (or there was none), so the reader is not needed anymore
+        if self.__chunked:
+            return self.__body_finished
+        return self.__body_remaining == 0
+
+    def finish_body(self) -> bool:
+        """
+        Discards the part of the request body that has not been read, so the connection is ready for the next
+        request.
+        :return: False if the end of the request is unknown (so the connection cannot be reused)
+        """
+        if self.__body_remaining is None:
+            return False
+        try:
+            for _ in self.iter_body():
+                pass
+        except HttpResponseError:
+            return False
+        return True
 
     def get_method(self) -> HttpMethod:
         return self.__method
@@ -224,22 +346,50 @@ class HttpRequest:
         return self.__http_version
 
     def get_headers(self) -> List[HttpHeader]:
-        return list(self.__headers.values())
+        # Later headers replace the previous ones with the same name
+        return [self.__decode_header(position) for position in self.__get_header_index().values()]
 
     def get_vhost(self) -> Vhost:
         return self.__vhost
 
-    def get_body(self) -> bytes | None:
-        return self.__body
+    def __get_header_index(self) -> Dict[str, int]:
+        # Builds the index of the headers the first time it is needed (later headers replace the previous ones with
+        # the same name)
+        if self.__header_index is None:
+            self.__header_index = {name.decode(HEADER_ENCODING).lower(): position
+                                   for position, (name, _) in enumerate(self.__headers)}
+        return self.__header_index
+
+    def __decode_header(self, position: int) -> HttpHeader:
+        # Header fields are ISO-8859-1, so decoding never fails
+        name, value = self.__headers[position]
+        return HttpHeader(name.decode(HEADER_ENCODING), value.decode(HEADER_ENCODING))
+
+    def __set_header(self, name: str, value: str):
+        # Replaces the value of a header (or adds it if not present), keeping the index up to date
+        pair = (name.encode(HEADER_ENCODING), value.encode(HEADER_ENCODING))
+        index = self.__get_header_index()
+        if name.lower() in index:
+            self.__headers[index[name.lower()]] = pair
+        else:
+            index[name.lower()] = len(self.__headers)
+            self.__headers.append(pair)
 
     def has_header(self, name: str):
-        return name.lower() in self.__headers
+        return name.lower() in self.__get_header_index()
 
     __contains__ = has_header
 
     def get_header(self, name: str) -> HttpHeader | None:
-        if not self.has_header(name):
+        """
+        Looks up a header of the request. The header is decoded on each call, so modifying the returned object does
+        not modify the request.
+        :param name: name of the header (case-insensitive)
+        :return: the header, or None if it is not present
+        """
+        position = self.__get_header_index().get(name.lower())
+        if position is None:
             return None
-        return self.__headers[name.lower()]
+        return self.__decode_header(position)
 
     __getitem__ = get_header
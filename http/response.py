@@ -1,43 +1,144 @@
 from __future__ import annotations
 
+import os
+from typing import BinaryIO, Generator, Iterator, List
+
 from http.enums import HttpResponseCode
 from http.header import HttpHeader
 from settings import HTTP_ENCODING
 
+# Chunk that ends a content sent with the chunked transfer encoding (without trailer headers)
+LAST_CHUNK = b"0\r\n\r\n"
+
 
-class HttpResponse:
+class FileContent:
+    """
+    Content of a response which is an already opened file (or a span of it). Instead of loading it into memory, the
+    server sends it straight from the file to the socket (with sendfile when possible), after sending the response
+    head.
+    """
+    __file = None
+    __stat = None
+    # Span of the file to be sent
+    __offset = 0
+    __length = None
+
+    def __init__(self, file: BinaryIO, offset: int = 0, length: int | None = None,
+                 stat: os.stat_result | None = None):
+        self.__file = file
+        # Take the stat from the opened file, so it matches what will be sent
+        self.__stat = stat if stat is not None else os.fstat(file.fileno())
+        self.__offset = offset
+        self.__length = length if length is not None else self.__stat.st_size - offset
+
+    def get_file(self) -> BinaryIO:
+        return self.__file
+
+    def get_stat(self) -> os.stat_result:
+        return self.__stat
+
+    def get_offset(self) -> int:
+        return self.__offset
+
+    def get_size(self) -> int:
+        # Returns the number of bytes to be sent, not the size of the whole file
+        return self.__length
+
+    # Treats len(FileContent) as the number of bytes to be sent
+    __len__ = get_size
+
+    def get_range(self, offset: int, length: int) -> FileContent:
+        """
+        Creates the content for a span of this one, sharing the same opened file.
+        :param offset: position of the first byte of the span, relative to this content
+        :param length: number of bytes of the span
+        :return: content with only the given span
+        """
+        return FileContent(self.__file, self.__offset + offset, length, self.__stat)
+
+    def close(self):
+        self.__file.close()
+
+
+class ChunkedContent:
+    """
+    Content of a response whose length is not known in advance (e.g. a file which is compressed while it is sent).
+    It is sent with the chunked transfer encoding or, for clients which do not support it, until the connection is
+    closed.
+    """
+    __chunks = None
+    # Content from which the chunks are generated, which is closed along with them
+    __source = None
+    __framed = True
+
+    def __init__(self, chunks: Generator[bytes, None, None], source: FileContent | None = None):
+        self.__chunks = chunks
+        self.__source = source
+        self.__framed = True
+
+    def is_framed(self) -> bool:
+        return self.__framed
+
+    def set_framed(self, framed: bool):
+        # Whether each chunk is preceded by its size (chunked transfer encoding) or sent as it is
+        self.__framed = framed
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """
+        Generates the data to be sent after the head of the response, chunk after chunk.
+        :return: iterator over the chunks, already framed if needed
+        """
+        for data in self.__chunks:
+            # An empty chunk would mean the end of the content
+            if not data:
+                continue
+            if self.__framed:
+                data = b"%x\r\n" % len(data) + data + b"\r\n"
+            yield data
+        if self.__framed:
+            yield LAST_CHUNK
+
+    def close(self):
+        # Stop generating the chunks, so the resources they use are released. A generator which has not started yet
+        # does not run its cleanup when closed, so the source is closed here as well
+        self.__chunks.close()
+        if self.__source is not None:
+            self.__source.close()
+
+
+class HttpResponseBase:
     """
     Base class for a HTTP response object. Contains the response code (status), the headers and the content
     (if any).
     This class can be treated as a dictionary, where the keys are header names and the values are HttpHeader
     objects.
+    It does not define any attribute by itself: HttpResponse stores them in slots, while errors (as any exception)
+    need a dictionary.
     """
-    __status = None
-    __headers = {}
-    _content = None
+    __slots__ = ()
 
     def __init__(self,
                  status: HttpResponseCode = HttpResponseCode.OK,
-                 content: str | bytes | None = None):
-        # Saves the basic data (inmutable) to the class attributes
-        self.__status = status
+                 content: str | bytes | FileContent | ChunkedContent | List[bytes | FileContent] | None = None):
+        # Saves the basic data (inmutable) to the instance attributes
+        self._status = status
         self._content = content
-        self.__headers = {}
+        self._headers = {}
 
     def get_status_code(self):
         # Returns the status code
-        return self.__status
+        return self._status
 
     def has_header(self, name: str):
         # Check if a given header is present
-        return name.lower() in self.__headers
+        return name.lower() in self._headers
 
     # Treats the "in" keyword as has_header function with objects of HttpResponse
     __contains__ = has_header
 
     def add_header(self, key: str, header: HttpHeader):
         # Saves the specified header into the dictionary of headers
-        self.__headers[key.lower()] = header
+        self._headers[key.lower()] = header
 
     # Treats the HttpResponse[HEADER] = VALUE as add_header function with objects of HttpResponse
     __setitem__ = add_header
@@ -47,7 +148,7 @@ class HttpResponse:
         if not self.has_header(name):
             return None
         # Else return the HttpHeader object
-        return self.__headers[name.lower()]
+        return self._headers[name.lower()]
 
     # Treats the HttpResponse[HEADER] as get_header function with objects of HttpResponse
     __getitem__ = get_header
@@ -57,39 +158,75 @@ class HttpResponse:
         if not self.has_header(name):
             return
         # Else delete the header
-        self.__headers.pop(name.lower())
+        self._headers.pop(name.lower())
 
     # Treats the "del" keyword as has_header function with objects of HttpResponse
     __delitem__ = del_header
 
-    def get_content(self) -> str | bytes | None:
+    def get_content(self) -> str | bytes | FileContent | ChunkedContent | List[bytes | FileContent] | None:
         return self._content
 
+    def get_content_length(self) -> int | None:
+        # Returns the number of bytes of the content, also when it is sent by parts (None if it is not known)
+        if isinstance(self._content, ChunkedContent):
+            return None
+        if self._content is None:
+            return 0
+        if isinstance(self._content, str):
+            return len(self._content.encode(HTTP_ENCODING))
+        if isinstance(self._content, list):
+            return sum(len(part) for part in self._content)
+        return len(self._content)
+
+    def get_streamed_content(self) -> List[bytes | FileContent | ChunkedContent] | None:
+        # Returns the parts to be sent after the head, only if the content is (or includes) a file or it is chunked
+        if isinstance(self._content, (FileContent, ChunkedContent)):
+            return [self._content]
+        if isinstance(self._content, list):
+            return self._content
+        return None
+
     def serialize_headers(self):
-        if len(self.__headers) == 0:
+        if len(self._headers) == 0:
             # If no headers are present, just return an empty string
             return ''
         # Else, concatenate all of them with the HTTP format and append \r\n to the last one (join only adds it
         # in between)
-        return '\r\n'.join("{}: {}".format(h.name, h.value) for h in self.__headers.values()) + '\r\n'
+        return '\r\n'.join("{}: {}".format(h.name, h.value) for h in self._headers.values()) + '\r\n'
 
     def serialize(self):
-        # Convert to string headers with content (if present)
-        return self.serialize_headers() + '\r\n' + (str(self._content) if self._content is not None else '')
-
-    def __bytes__(self):
-        out = (self.serialize_headers() + '\r\n').encode(HTTP_ENCODING)
-        if self._content is not None:
+        # Convert to string headers with content (if present, and if it is not sent from a file)
+        content = self._content if self.get_streamed_content() is None else None
+        return self.serialize_headers() + '\r\n' + (str(content) if content is not None else '')
+
+    def get_buffers(self) -> List[bytes]:
+        # Returns the encoded header lines, the end of the head and the content (unless it is sent from a file) as
+        # separate buffers, so they can be written at once without copying them into a single one
+        buffers = [header.to_bytes() for header in self._headers.values()]
+        buffers.append(b'\r\n')
+        if self._content is not None and self.get_streamed_content() is None:
             content = self._content
-            if isinstance(self._content, str):
+            if isinstance(content, str):
                 content = content.encode(HTTP_ENCODING)
-            out += content
-        return out
+            if content:
+                buffers.append(content)
+        return buffers
+
+    def __bytes__(self):
+        return b''.join(self.get_buffers())
+
+
+class HttpResponse(HttpResponseBase):
+    """
+    HTTP response which is not an error. Many of them are alive at the same time, so their attributes are stored in
+    slots (without a dictionary per object).
+    """
+    __slots__ = ("_status", "_headers", "_content")
 
 
-class HttpResponseError(HttpResponse, RuntimeError):
+class HttpResponseError(HttpResponseBase, RuntimeError):
     """
-    Specific subclass of HttpResponse which indicates an error has been catched. It extends RuntimeError,
+    Specific subclass of HttpResponseBase which indicates an error has been catched. It extends RuntimeError,
     so it can be thrown (specifically during the HttpRequest object construction while parsing the
     request).
     Then other sub-classes are defined for other response codes.
@@ -136,6 +273,27 @@ class HttpResponseMethodNotAllowed(HttpResponseError):
                                                            *args, **kwargs)
 
 
+# 408
+class HttpResponseRequestTimeout(HttpResponseError):
+    def __init__(self, *args, **kwargs):
+        super(HttpResponseRequestTimeout, self).__init__(status=HttpResponseCode.REQUEST_TIMEOUT,
+                                                         *args, **kwargs)
+
+
+# 409
+class HttpResponseConflict(HttpResponseError):
+    def __init__(self, *args, **kwargs):
+        super(HttpResponseConflict, self).__init__(status=HttpResponseCode.CONFLICT,
+                                                   *args, **kwargs)
+
+
+# 413
+class HttpResponsePayloadTooLarge(HttpResponseError):
+    def __init__(self, *args, **kwargs):
+        super(HttpResponsePayloadTooLarge, self).__init__(status=HttpResponseCode.PAYLOAD_TOO_LARGE,
+                                                          *args, **kwargs)
+
+
 # 415
 class HttpResponseUnsupportedMediaType(HttpResponseError):
     def __init__(self, *args, **kwargs):
@@ -143,6 +301,20 @@ class HttpResponseUnsupportedMediaType(HttpResponseError):
                                                                *args, **kwargs)
 
 
+# 416
+class HttpResponseRangeNotSatisfiable(HttpResponseError):
+    def __init__(self, *args, **kwargs):
+        super(HttpResponseRangeNotSatisfiable, self).__init__(status=HttpResponseCode.RANGE_NOT_SATISFIABLE,
+                                                              *args, **kwargs)
+
+
+# 431
+class HttpResponseRequestHeaderFieldsTooLarge(HttpResponseError):
+    def __init__(self, *args, **kwargs):
+        super(HttpResponseRequestHeaderFieldsTooLarge, self).__init__(
+            status=HttpResponseCode.REQUEST_HEADER_FIELDS_TOO_LARGE, *args, **kwargs)
+
+
 # 501
 class HttpResponseNotImplemented(HttpResponseError):
     def __init__(self, *args, **kwargs):
@@ -150,6 +322,13 @@ class HttpResponseNotImplemented(HttpResponseError):
                                                          *args, **kwargs)
 
 
+# 503
+class HttpResponseServiceUnavailable(HttpResponseError):
+    def __init__(self, *args, **kwargs):
+        super(HttpResponseServiceUnavailable, self).__init__(status=HttpResponseCode.SERVICE_UNAVAILABLE,
+                                                             *args, **kwargs)
+
+
 # 505
 class HttpResponseHttpVersionNotSupported(HttpResponseError):
     def __init__(self, *args, **kwargs):
@@ -1,118 +1,509 @@
 #!/usr/bin/python3
 
+from __future__ import annotations
+
 import argparse
+import asyncio
+import collections
+import concurrent.futures
 import logging
 import mimetypes
 import os
+import queue
+import shutil
+import signal
 import socket
+import tempfile
 import threading
+import time
+from pathlib import Path
+from typing import Callable, Generator, Hashable, List, Tuple
 
 from http.enums import HttpMethod, HttpResponseCode, HttpVersion
 from http.header import HttpHeader, HEADER_CONTENT_TYPE, HEADER_CONTENT_TYPE_TEXT_PLAIN, HEADER_CONNECTION, \
-    HEADER_CONNECTION_CLOSE, HEADER_CONTENT_LOCATION
+    HEADER_CONNECTION_CLOSE, HEADER_CONTENT_LOCATION, HEADER_RETRY_AFTER, HEADER_ETAG, HEADER_LAST_MODIFIED, \
+    HEADER_RANGE, HEADER_VARY
+from http.reader import HttpStreamReader
 from http.request import HttpRequest
-from http.response import HttpResponse, HttpResponseError, HttpResponseMethodNotAllowed, HttpResponseNotFound, \
-    HttpResponseUnsupportedMediaType, HttpResponseForbidden
-from settings import DEFAULT_PORT, VHOSTS_FILE
-from utils.entity import generate_output
+from http.response import ChunkedContent, FileContent, HttpResponse, HttpResponseError, HttpResponseMethodNotAllowed, \
+    HttpResponseNotFound, HttpResponseUnsupportedMediaType, HttpResponseForbidden, HttpResponseServiceUnavailable, \
+    HttpResponseRequestTimeout, HttpResponseNotImplemented, HttpResponseBadRequest, HttpResponseConflict
+from settings import DEFAULT_PORT, VHOSTS_FILE, DEFAULT_ENGINE, ENGINE_ASYNCIO, ENGINES, DEFAULT_BACKLOG, \
+    DEFAULT_THREADS, DEFAULT_QUEUE_SIZE, RETRY_AFTER, IDLE_TIMEOUT, HEADER_TIMEOUT, MAX_KEEPALIVE_REQUESTS, \
+    MAX_PIPELINE_DEPTH, RECV_SIZE, MAX_SEND_BUFFERS, MAX_HEADER_SIZE, MAX_BODY_SIZE, CACHE_SIZE, CACHE_MAX_FILE_SIZE, \
+    CACHE_REVALIDATE_INTERVAL, INDEX_REBUILD_INTERVAL, VHOSTS_POLL_INTERVAL, COMPRESSION_MIN_SIZE, \
+    COMPRESSION_MAX_FILE_SIZE, DEFAULT_WORKERS, SHUTDOWN_TIMEOUT, SHUTDOWN_POLL_INTERVAL, PATH_LOCK_STRIPES, \
+    PATH_LOCK_FOLDER_PREFIX
+from utils.cache import FileCache, FileCacheEntry
+from utils.deploy import create_staging_folder, extract_archive, swap_folders
+from utils.encoding import ENCODINGS, can_compress, compress, compress_stream, generate_variant_headers, \
+    is_compressible, negotiate_encodings
+from utils.entity import ACCEPT_RANGES_HEADER, VARY_HEADER, generate_output, generate_validator_headers, \
+    get_content_type_header, is_not_modified
+from utils.locks import PathLockTable
 from utils.mime import CUSTOM_MIMETYPES
-from utils.vhosts import Vhost
+from utils.ranges import generate_range_response
+from utils.registry import VhostRegistry
+from utils.vhosts import FileUpload, Vhost, is_upload_temp_path
+from utils.workers import WorkerSupervisor
+
+
+class ServerShutdown(Exception):
+    """
+    Raised from the signal handler to stop accepting connections, so the server can be shut down gracefully.
+    """
 
 
 class Server:
     __socket = None
+    # Virtual hosts, which are replaced at once (never modified) when reloaded
     __hosts = None
+    # Values of the stat of the virtual hosts file when it was parsed, and event to reload it right away
+    __hosts_stat_key = None
+    __reload_requested = None
+    __engine = None
+    __threads = None
+    __connections = None
+    __overload_output = None
+    __timeout_output = None
+    __idle_timeout = None
+    __header_timeout = None
+    __max_requests = None
+    __max_header_size = None
+    __max_body_size = None
+    __file_cache = None
+    # Locks of the paths being modified by PUT and DELETE
+    __path_locks = None
+    __compression_max_file_size = None
+    # Set when shutting down, so connections are closed after their current request
+    __stopping = False
+    # Connections being served by the asyncio engine
+    __tasks = None
+    # Threads of the asyncio engine for the requests whose body is still being received, and how many are free
+    __body_executor = None
+    __body_slots = 0
 
-    def __init__(self, port=DEFAULT_PORT):
+    def __init__(self, port=DEFAULT_PORT, engine=DEFAULT_ENGINE, backlog=DEFAULT_BACKLOG, threads=DEFAULT_THREADS,
+                 queue_size=DEFAULT_QUEUE_SIZE, idle_timeout=IDLE_TIMEOUT, header_timeout=HEADER_TIMEOUT,
+                 max_requests=MAX_KEEPALIVE_REQUESTS, max_header_size=MAX_HEADER_SIZE, max_body_size=MAX_BODY_SIZE,
+                 cache_size=CACHE_SIZE, cache_max_file_size=CACHE_MAX_FILE_SIZE,
+                 compression_max_file_size=COMPRESSION_MAX_FILE_SIZE, reuse_port=False, lock_folder=None):
+        if engine not in ENGINES:
+            raise ValueError("Engine {} is not available".format(engine))
+        self.__engine = engine
+        # Connections accepted by the threaded engine wait here until a worker is free
+        self.__threads = threads
+        self.__connections = queue.Queue(maxsize=queue_size)
+        # The response for overloaded situations is always the same, so it is generated only once
+        Server.__overload_output = Server.__generate_overload_output()
+        # And the same happens for clients that are too slow sending their request
+        Server.__timeout_output = Server.__generate_timeout_output()
+        # Keep-alive connections are reclaimed when idle, or after serving some requests
+        Server.__idle_timeout = idle_timeout
+        Server.__header_timeout = header_timeout
+        Server.__max_requests = max_requests
+        # Limits for the size of the requests
+        Server.__max_header_size = max_header_size
+        Server.__max_body_size = max_body_size
+        # Small files are kept in memory, shared by all the workers
+        Server.__file_cache = FileCache(cache_size, cache_max_file_size, CACHE_REVALIDATE_INTERVAL)
+        # Files and folders are modified concurrently, but requests for the same paths must not race (neither in this
+        # process nor in the other workers, if they share the folder of the locks)
+        Server.__path_locks = PathLockTable(PATH_LOCK_STRIPES, lock_folder)
+        # Bigger text files are not compressed on the fly (only their precompressed files are used)
+        Server.__compression_max_file_size = compression_max_file_size
         # Parse vhosts.conf file
-        Server.__hosts = Vhost.parse_file(VHOSTS_FILE)
+        Server.__hosts_stat_key = Server.__get_hosts_stat_key()
+        Server.__hosts = VhostRegistry.parse_file(VHOSTS_FILE)
+        Server.__reload_requested = threading.Event()
         # Initialize the socket to work with IPv4 TCP
         self.__socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if reuse_port:
+            # Several worker processes listen on the same port, and the kernel balances the connections among them
+            self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         # Using the specified port
         self.__socket.bind(('', port))
         self.__socket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
-        self.__socket.listen(1)
-        logging.info("Server started on port {}".format(port))
+        self.__socket.listen(backlog)
+        logging.info("Server started on port {} using the {} engine".format(port, engine))
 
     def listen(self):
         if self.__socket is None:
             # Cannot listen if socket is None (probably because it was closed)
             raise Exception("Socket is not available!")
 
-        while True:
-            # We listen to connections forever and, for each connection, launch a thread
-            conn, addr = self.__socket.accept()
-            thread = threading.Thread(target=Server.__process_connection, args=(conn, addr))
+        # Files may also be changed from outside the server, so keep the indexes of the hosts up to date
+        thread = threading.Thread(target=Server.__rebuild_indexes, daemon=True)
+        thread.start()
+        # And reload the hosts when their file changes (or when asked to), without stopping serving requests
+        thread = threading.Thread(target=Server.__watch_hosts, daemon=True)
+        thread.start()
+
+        if self.__engine == ENGINE_ASYNCIO:
+            # A single event loop takes care of all the connections
+            asyncio.run(self.__listen_asyncio())
+            return
+
+        # Launch the fixed pool of workers that will process the connections
+        for _ in range(self.__threads):
+            thread = threading.Thread(target=Server.__worker, args=(self.__connections,), daemon=True)
             thread.start()
 
+        # SIGTERM interrupts the accept loop, so the server can stop gracefully
+        signal.signal(signal.SIGTERM, Server.__request_shutdown)
+        try:
+            while True:
+                # We listen to connections until shut down and, for each connection, queue it for the workers
+                conn, addr = self.__socket.accept()
+                try:
+                    self.__connections.put_nowait((conn, addr))
+                except queue.Full:
+                    # All workers are busy and the queue is full, so reject the connection right away
+                    logging.warning('Rejecting connection from host {} on port {}: server overloaded'.format(
+                        addr[0], addr[1]))
+                    Server.__reject_connection(conn)
+        except ServerShutdown:
+            logging.info("Shutting down, waiting for the connections being served")
+            Server.__stopping = True
+            self.close()
+
+        # Wait until the queued and in-flight connections have been served (idle ones are reclaimed on timeout)
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        while self.__connections.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(SHUTDOWN_POLL_INTERVAL)
+
+    @staticmethod
+    def __request_shutdown(*_):
+        raise ServerShutdown()
+
+    async def __listen_asyncio(self):
+        # The event loop requires the listening socket to be non-blocking
+        self.__socket.setblocking(False)
+        Server.__tasks = set()
+        # Bodies are received by a bounded pool of their own, so slow uploads never take the threads of the default
+        # executor, which build the responses of the rest of the requests
+        Server.__body_executor = concurrent.futures.ThreadPoolExecutor(self.__threads, thread_name_prefix="body")
+        Server.__body_slots = self.__threads
+        server = await asyncio.start_server(Server.__process_connection_async, sock=self.__socket)
+
+        stop = asyncio.Event()
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+        except NotImplementedError:
+            # Signal handlers are not available in this platform, so the server runs until killed
+            pass
+        await stop.wait()
+
+        logging.info("Shutting down, waiting for the connections being served")
+        Server.__stopping = True
+        # Stop accepting connections, and wait until the current ones are finished (idle ones are reclaimed on timeout)
+        server.close()
+        self.__socket = None
+        if Server.__tasks:
+            await asyncio.wait(set(Server.__tasks), timeout=SHUTDOWN_TIMEOUT)
+        Server.__body_executor.shutdown(wait=False)
+
     def close(self):
-        # Close and remove the socket
-        self.__socket.close()
+        # Close and remove the socket (if it has not been closed yet)
+        if self.__socket is not None:
+            self.__socket.close()
         self.__socket = None
 
     @staticmethod
-    def __get_response(request: HttpRequest) -> HttpResponse:
-        # Create an initial response, so at least there is one always
-        response = HttpResponse()
+    def __rebuild_indexes():
+        # Rebuild the resolution index of the hosts whose folders have changed, once in a while (the hosts not used yet
+        # have no index)
+        while True:
+            time.sleep(INDEX_REBUILD_INTERVAL)
+            for vhost in Server.__hosts.values():
+                if vhost.is_indexed():
+                    vhost.refresh_index()
 
-        if request.get_method() == HttpMethod.GET:
-            file_path = request.get_vhost().get_host_root_path().joinpath(request.get_path())
-            # If user is requesting an existing path, try to access the index file
-            if file_path.exists() and not file_path.is_file():
-                file_path = file_path.joinpath(request.get_vhost().get_index_file())
+    @staticmethod
+    def __get_hosts_stat_key() -> tuple | None:
+        # Returns the values of the stat of the virtual hosts file which change when it is modified
+        try:
+            return FileCacheEntry.get_stat_key(os.stat(VHOSTS_FILE))
+        except OSError:
+            return None
 
-            # If file does not exist, then 404
-            if not file_path.exists():
-                raise HttpResponseNotFound()
-            # And if it is a folder, then 405
-            elif not file_path.is_file():
-                raise HttpResponseMethodNotAllowed()
+    @staticmethod
+    def __watch_hosts():
+        # Reload the virtual hosts when requested, or when their file is modified
+        while True:
+            requested = Server.__reload_requested.wait(VHOSTS_POLL_INTERVAL)
+            Server.__reload_requested.clear()
+            stat_key = Server.__get_hosts_stat_key()
+            if requested or stat_key != Server.__hosts_stat_key:
+                Server.__hosts_stat_key = stat_key
+                try:
+                    Server.reload_hosts()
+                except Exception:
+                    # The watcher must never die, or the hosts would not be reloaded anymore
+                    logging.exception("Could not reload the virtual hosts")
 
-            # Try to get file contents
-            content = Vhost.get_file_contents(file_path)
-            response = HttpResponse(content=content)
-
-            # Try to guess the content type from the MIME type
-            content_type = mimetypes.guess_type(file_path)[0]
-            if content_type is None:
-                # If no content type, check if it is one of the manually defined ones
-                extension = file_path.suffix[1:]
-                if extension not in CUSTOM_MIMETYPES:
-                    # If still cannot find the content type, raise error 415
-                    raise HttpResponseUnsupportedMediaType()
-                content_type = CUSTOM_MIMETYPES[extension]
-
-            # Add the Content-Type header
-            content_type_header = HttpHeader(HEADER_CONTENT_TYPE, content_type)
-            response.add_header(HEADER_CONTENT_TYPE, content_type_header)
-
-        elif request.get_method() == HttpMethod.PUT:
-            # It is not possible to PUT to a folder so, if it is one, just raise 405
-            if request.get_path().endswith("/"):
-                raise HttpResponseMethodNotAllowed()
+    @staticmethod
+    def request_reload(*_):
+        """
+        Asks the server to reload the virtual hosts file (it only sets a flag, so it can be used as a signal handler).
+        """
+        if Server.__reload_requested is not None:
+            Server.__reload_requested.set()
 
-            # Get the file to remove, and the parent one (create these folders recursively)
-            file_path = request.get_vhost().get_host_root_path().joinpath(request.get_path())
-            folder_path = file_path.parent
+    @staticmethod
+    def reload_hosts():
+        """
+        Parses the virtual hosts file again, off the path of the requests, and swaps the table of hosts at once. The
+        requests already parsed finish with the host they got, and the hosts whose line has not changed are kept as
+        they are (so their resolution index is not rebuilt, and their files stay in the cache).
+        """
+        current = Server.__hosts
+        try:
+            hosts = VhostRegistry.parse_file(VHOSTS_FILE, current)
+        except (OSError, ValueError) as e:
+            # Keep serving the current hosts until the file is fixed (it may not even be text)
+            logging.error("Could not reload the virtual hosts: {}".format(e))
+            return
+        Server.__hosts = hosts
+        changed = sum(1 for hostname, vhost in hosts.items() if hostname in current and current[hostname] is not vhost)
+        logging.info("Reloaded the virtual hosts: {} added, {} removed, {} changed".format(
+            len(hosts.keys() - current.keys()), len(current.keys() - hosts.keys()), changed))
+
+    @staticmethod
+    def get_cache_stats():
+        # Returns the counters of the file cache
+        return Server.__file_cache.get_stats()
+
+    @staticmethod
+    def get_lock_stats():
+        # Returns the counters of the locks of the paths (how often and how long requests waited for them)
+        return Server.__path_locks.get_stats()
 
+    @staticmethod
+    def __get_file(file_path: Path) -> Tuple[bytes | FileContent, List[HttpHeader], os.stat_result]:
+        """
+        Gets a file to be sent in a GET response, from the file cache or from the filesystem.
+        :param file_path: file to be sent
+        :return: contents of the file (or the opened file, if it is not cached), its headers and its stat
+        """
+        # Hot files are served from memory, without accessing the filesystem
+        entry = Server.__file_cache.get(file_path)
+        if entry is not None:
+            return entry.get_content(), entry.get_headers(), entry.get_stat()
+        return Server.__open_file(file_path)
+
+    @staticmethod
+    def __open_file(file_path: Path) -> Tuple[bytes | FileContent, List[HttpHeader], os.stat_result]:
+        """
+        Opens a file to be sent in a GET response, and generates the headers that describe it. If the file is small
+        enough, it is read and kept in the file cache.
+        :param file_path: file to be opened
+        :return: contents of the file (or the opened file, if it is not cached), its headers and its stat
+        """
+        # Try to open the file (its contents will be sent straight from the filesystem)
+        content = Vhost.open_file(file_path)
+
+        # Try to guess the content type from the MIME type
+        content_type = mimetypes.guess_type(file_path)[0]
+        if content_type is None:
+            # If no content type, check if it is one of the manually defined ones
+            extension = file_path.suffix[1:]
+            if extension not in CUSTOM_MIMETYPES:
+                # If still cannot find the content type, raise error 415 (file will not be sent)
+                content.close()
+                raise HttpResponseUnsupportedMediaType()
+            content_type = CUSTOM_MIMETYPES[extension]
+        headers = [get_content_type_header(content_type), ACCEPT_RANGES_HEADER] + \
+            generate_validator_headers(content.get_stat())
+        if is_compressible(content_type):
+            # Caches must not mix up the plain file with its compressed variants
+            headers.append(VARY_HEADER)
+
+        return Server.__cache_file(file_path, file_path, content, headers), headers, content.get_stat()
+
+    @staticmethod
+    def __cache_file(key: Hashable, file_path: Path, content: FileContent,
+                     headers: List[HttpHeader]) -> bytes | FileContent:
+        """
+        Reads an opened file and keeps it in the file cache, if it is small enough.
+        :param key: key of the file in the cache
+        :param file_path: path of the opened file
+        :param content: opened file
+        :param headers: headers of the file
+        :return: contents of the file, or the opened file if it is not cached
+        """
+        if not Server.__file_cache.accepts(content.get_size()):
+            return content
+
+        # Small files are read and kept in memory (along with their headers) for the next requests
+        with content.get_file() as f:
+            data = f.read()
+        Server.__file_cache.put(key, FileCacheEntry(file_path, data, headers, content.get_stat()))
+        return data
+
+    @staticmethod
+    def __get_variant(file_path: Path, content: bytes | FileContent, headers: List[HttpHeader],
+                      stat: os.stat_result, encodings: List[str]) -> Tuple[bytes | FileContent, List[HttpHeader]]:
+        """
+        Gets the compressed variant of a file for one of the encodings accepted by the client. Precompressed files
+        next to the file (e.g. style.css.gz) are preferred, otherwise the file is compressed on the fly if it is not
+        too big. Compressed variants are kept in the file cache.
+        :param file_path: file to be sent
+        :param content: contents of the file (or the opened file)
+        :param headers: headers of the file
+        :param stat: stat of the file
+        :param encodings: encodings accepted by the client, from the most to the least preferred one
+        :return: contents and headers of the variant, or the given ones if there is no variant worth sending
+        """
+        for encoding in encodings:
+            entry = Server.__file_cache.get((file_path, encoding))
+            if entry is not None:
+                if isinstance(content, FileContent):
+                    content.close()
+                return entry.get_content(), entry.get_headers()
+
+        for encoding in encodings:
+            variant_path = file_path.with_name(file_path.name + ENCODINGS[encoding])
+            try:
+                variant = Vhost.open_file(variant_path)
+            except HttpResponseError:
+                continue
+            if isinstance(content, FileContent):
+                content.close()
+            # The precompressed file has its own validators
+            validators = generate_validator_headers(variant.get_stat())
+            variant_headers = generate_variant_headers(headers, encoding, validators)
+            return Server.__cache_file((file_path, encoding), variant_path, variant, variant_headers), variant_headers
+
+        encoding = next((encoding for encoding in encodings if can_compress(encoding)), None)
+        if encoding is None or not COMPRESSION_MIN_SIZE <= len(content) <= Server.__compression_max_file_size:
+            return content, headers
+
+        if isinstance(content, FileContent):
+            # Big files are compressed while they are sent, so the client does not wait for the whole file
+            variant_headers = generate_variant_headers(headers, encoding)
+            chunks = Server.__compress_file((file_path, encoding), file_path, content, encoding, variant_headers, stat)
+            return ChunkedContent(chunks, content), variant_headers
+
+        compressed = compress(content, encoding)
+        if len(compressed) >= len(content):
+            # Not worth it, so remember to send the file as it is
+            Server.__file_cache.put((file_path, encoding), FileCacheEntry(file_path, content, headers, stat))
+            return content, headers
+        variant_headers = generate_variant_headers(headers, encoding)
+        Server.__file_cache.put((file_path, encoding), FileCacheEntry(file_path, compressed, variant_headers, stat))
+        return compressed, variant_headers
+
+    @staticmethod
+    def __compress_file(key: Hashable, file_path: Path, content: FileContent, encoding: str,
+                        headers: List[HttpHeader], stat: os.stat_result) -> Generator[bytes, None, None]:
+        """
+        Compresses an opened file while it is being sent. If the compressed file is small enough, it is kept in the
+        file cache once finished.
+        :param key: key of the compressed file in the cache
+        :param file_path: path of the opened file
+        :param content: opened file
+        :param encoding: name of the encoding
+        :param headers: headers of the compressed file
+        :param stat: stat of the file
+        :return: iterator over the compressed contents
+        """
+        compressed = []
+        size = 0
+        with content.get_file() as f:
+            for data in compress_stream(iter(lambda: f.read(RECV_SIZE), b""), encoding):
+                size += len(data)
+                if compressed is not None and not Server.__file_cache.accepts(size):
+                    # Too big to be cached, so there is no need to keep it
+                    compressed = None
+                if compressed is not None:
+                    compressed.append(data)
+                yield data
+        if compressed is not None:
+            Server.__file_cache.put(key, FileCacheEntry(file_path, b"".join(compressed), headers, stat))
+
+    @staticmethod
+    def __handle_get(request: HttpRequest) -> HttpResponse:
+        # Get the file to be served from the index of the host (folders are resolved to their index file)
+        file_path = request.get_vhost().resolve(request.get_path())
+        content, headers, stat = Server.__get_file(file_path)
+
+        # Text files are compressed if the client accepts it (but not for ranges, which refer to the plain file)
+        encodings = [] if request.has_header(HEADER_RANGE) else negotiate_encodings(request)
+        if encodings and any(h.name == HEADER_VARY for h in headers):
+            content, headers = Server.__get_variant(file_path, content, headers, stat, encodings)
+
+        # If the client already has this version of the file, there is no need to send it again
+        if is_not_modified(request, headers):
+            if isinstance(content, (FileContent, ChunkedContent)):
+                content.close()
+            response = HttpResponse(status=HttpResponseCode.NOT_MODIFIED)
+            # Only the validators (and Vary) are sent along with the 304 response
+            for header in headers:
+                if header.name in (HEADER_ETAG, HEADER_LAST_MODIFIED, HEADER_VARY):
+                    response.add_header(header.name, header)
+            return response
+
+        # Send the whole file, or only the ranges requested by the client (along with the headers of the file)
+        return generate_range_response(request, content, headers)
+
+    @staticmethod
+    def __handle_put(request: HttpRequest) -> HttpResponse:
+        # It is not possible to PUT to a folder so, if it is one, just raise 405
+        if request.get_path().endswith("/"):
+            raise HttpResponseMethodNotAllowed()
+        # The temporary files of the uploads (and deploys) being written belong to other requests
+        if is_upload_temp_path(request.get_path()):
+            raise HttpResponseForbidden(content="Temporary files cannot be modified")
+
+        # Get the file to remove, and the parent one (create these folders recursively)
+        vhost = request.get_vhost()
+        file_path = vhost.get_host_root_path().joinpath(request.get_path())
+        folder_path = file_path.parent
+        key = Vhost.normalize_path(request.get_path())
+
+        # The folders must not be removed by a concurrent DELETE until the temporary file is in them
+        with Server.__path_locks.hold(vhost.get_hostname(), key):
             try:
                 # Create all folders up to the file
                 os.makedirs(folder_path, exist_ok=True)
-                # Open file and write contents to it
-                Vhost.put_file_contents(file_path, request.get_body())
             except PermissionError:
                 raise HttpResponseForbidden()
+            except (FileExistsError, NotADirectoryError, FileNotFoundError):
+                # One of the folders is a file (or it has been removed meanwhile from outside the server)
+                raise HttpResponseConflict(content="The folders of the file cannot be created")
+            upload = FileUpload(file_path, vhost.get_durability())
+        try:
+            # Stream the body into the temporary file (which keeps its folder in place) without holding any lock
+            upload.write(request.iter_body())
+            with Server.__path_locks.hold(vhost.get_hostname(), key):
+                upload.replace()
+                # Cached contents are not valid anymore, and the file can be served from now on
+                Server.__file_cache.invalidate(file_path)
+                vhost.index_file_added(request.get_path())
+        finally:
+            upload.discard()
 
-            # Use 201 as response code
-            response = HttpResponse(status=HttpResponseCode.CREATED)
+        # Use 201 as response code
+        response = HttpResponse(status=HttpResponseCode.CREATED)
 
-            # And specify where such file has been created
-            content_location_header = HttpHeader(HEADER_CONTENT_LOCATION, request.get_path())
-            response.add_header(HEADER_CONTENT_LOCATION, content_location_header)
+        # And specify where such file has been created
+        content_location_header = HttpHeader(HEADER_CONTENT_LOCATION, request.get_path())
+        response.add_header(HEADER_CONTENT_LOCATION, content_location_header)
+        return response
 
-        elif request.get_method() == HttpMethod.DELETE:
-            # This method is strict, which means that it will only strictly delete the file if it exists
-            file_path = request.get_vhost().get_host_root_path().joinpath(request.get_path())
+    @staticmethod
+    def __handle_delete(request: HttpRequest) -> HttpResponse:
+        # This method is strict, which means that it will only strictly delete the file if it exists
+        if is_upload_temp_path(request.get_path()):
+            # The temporary files of the uploads (and deploys) being written belong to other requests
+            raise HttpResponseForbidden(content="Temporary files cannot be modified")
+        vhost = request.get_vhost()
+        file_path = vhost.get_host_root_path().joinpath(request.get_path())
+
+        # The empty parent folders are removed too, so they must not be in use by other requests
+        with Server.__path_locks.hold(vhost.get_hostname(), Vhost.normalize_path(request.get_path()),
+                                      parents_exclusive=True):
             if not file_path.exists():
                 raise HttpResponseNotFound(content="File not found")
 
@@ -122,56 +513,530 @@ class Server:
                 raise HttpResponseMethodNotAllowed()
 
             # Deletes the file and also the parent folders if they are empty
-            Vhost.delete_file(file_path, request.get_vhost().get_host_root_path())
+            Vhost.delete_file(file_path, vhost.get_host_root_path())
+            Server.__file_cache.invalidate(file_path)
+            vhost.index_file_removed(request.get_path())
+        return HttpResponse()
 
-        elif request.get_method() == HttpMethod.NTW22INFO:
-            # Specify the format of the output string
-            ntw = "The administrator of {} is {}.\nYou can contact him at {}.".format(
-                request.get_vhost().get_hostname(),
-                request.get_vhost().get_server_admin_name(),
-                request.get_vhost().get_server_admin_email()
-            )
+    @staticmethod
+    def __handle_ntw22info(request: HttpRequest) -> HttpResponse:
+        # Specify the format of the output string
+        ntw = "The administrator of {} is {}.\nYou can contact him at {}.".format(
+            request.get_vhost().get_hostname(),
+            request.get_vhost().get_server_admin_name(),
+            request.get_vhost().get_server_admin_email()
+        )
 
-            # Create the response
-            response = HttpResponse(content=ntw)
+        # Create the response
+        response = HttpResponse(content=ntw)
 
-            # And use plain text as response content
-            content_type_header = HttpHeader(HEADER_CONTENT_TYPE, HEADER_CONTENT_TYPE_TEXT_PLAIN)
-            response.add_header(HEADER_CONTENT_TYPE, content_type_header)
+        # And use plain text as response content
+        response.add_header(HEADER_CONTENT_TYPE, get_content_type_header(HEADER_CONTENT_TYPE_TEXT_PLAIN))
+        return response
+
+    @staticmethod
+    def __handle_ntw22deploy(request: HttpRequest) -> HttpResponse:
+        # Only folders can be deployed (the root of the host, or any folder inside it)
+        if request.get_path() != "" and not request.get_path().endswith("/"):
+            raise HttpResponseMethodNotAllowed()
+        # The temporary folders of the uploads (and deploys) being written belong to other requests
+        if is_upload_temp_path(request.get_path()):
+            raise HttpResponseForbidden(content="Temporary folders cannot be modified")
+        vhost = request.get_vhost()
+        key = Vhost.normalize_path(request.get_path())
+        folder_path = vhost.get_host_root_path().joinpath(key)
+        if folder_path.exists() and not folder_path.is_dir():
+            raise HttpResponseMethodNotAllowed()
+
+        # The archive is extracted into a hidden folder next to the deployed one (which keeps the parent folders from
+        # being removed), while it is being received and without holding any lock
+        with Server.__path_locks.hold(vhost.get_hostname(), key):
+            try:
+                os.makedirs(folder_path.parent, exist_ok=True)
+            except PermissionError:
+                raise HttpResponseForbidden()
+            except (FileExistsError, NotADirectoryError, FileNotFoundError):
+                # One of the parent folders is a file (or it has been removed meanwhile from outside the server)
+                raise HttpResponseConflict(content="The parent folders cannot be created")
+            staging_path = create_staging_folder(folder_path)
+        try:
+            files, size = extract_archive(request.iter_body(), staging_path)
+            if key == "" and not staging_path.joinpath(vhost.get_index_file()).is_file():
+                # The host could not be served anymore
+                raise HttpResponseBadRequest(content="The archive does not contain {}".format(vhost.get_index_file()))
+
+            # Nothing else can modify the folder while it is replaced
+            with Server.__path_locks.hold(vhost.get_hostname(), key):
+                swap_folders(folder_path, staging_path)
+                Server.__file_cache.invalidate_folder(folder_path)
+                vhost.build_index()
+        finally:
+            # Remove the previous folder (or the partial deploy, if it failed)
+            shutil.rmtree(staging_path, ignore_errors=True)
+
+        # Create the response
+        response = HttpResponse(content="Deployed {} files ({} bytes) into /{}".format(files, size, request.get_path()))
 
+        # And use plain text as response content
+        response.add_header(HEADER_CONTENT_TYPE, get_content_type_header(HEADER_CONTENT_TYPE_TEXT_PLAIN))
         return response
 
+    # Function that answers each method (they are plain functions, as static methods cannot be called from here)
+    __handlers = {
+        HttpMethod.GET: __handle_get.__func__,
+        HttpMethod.PUT: __handle_put.__func__,
+        HttpMethod.DELETE: __handle_delete.__func__,
+        HttpMethod.NTW22INFO: __handle_ntw22info.__func__,
+        HttpMethod.NTW22DEPLOY: __handle_ntw22deploy.__func__,
+    }
+
     @staticmethod
-    def __process_connection(conn, addr):
-        logging.debug('Serving a connection from host {} on port {}'.format(addr[0], addr[1]))
+    def register_handler(method: HttpMethod, handler: Callable[[HttpRequest], HttpResponse]):
+        """
+        Sets the function that answers the requests with the given method, so new methods can be served without
+        modifying the server.
+        :param method: method of the requests
+        :param handler: function that receives the parsed request and returns the response (or raises an
+                        HttpResponseError)
+        """
+        Server.__handlers[method] = handler
+
+    @staticmethod
+    def get_handler(method: HttpMethod) -> Callable[[HttpRequest], HttpResponse]:
+        """
+        Gets the function that answers the requests with the given method.
+        :param method: method of the requests
+        :return: registered handler
+        """
+        handler = Server.__handlers.get(method)
+        if handler is None:
+            raise HttpResponseNotImplemented(content="Method {} is not available".format(method))
+        return handler
+
+    @staticmethod
+    def __get_response(request: HttpRequest) -> HttpResponse:
+        # Dispatch the request to the handler of its method
+        return Server.get_handler(request.get_method())(request)
+
+    @staticmethod
+    def __generate_overload_output() -> bytes:
+        """
+        Generates the raw 503 response sent to the connections rejected because the server is overloaded.
+        :return: raw HTTP response
+        """
+        response = HttpResponseServiceUnavailable(content=HttpResponseCode.SERVICE_UNAVAILABLE.get_reason())
+        # Let the client know when to try again, and that the connection will not be reused
+        response.add_header(HEADER_RETRY_AFTER, HttpHeader(HEADER_RETRY_AFTER, str(RETRY_AFTER)))
+        response.add_header(HEADER_CONNECTION, HttpHeader(HEADER_CONNECTION, HEADER_CONNECTION_CLOSE))
+        return b"".join(generate_output(None, response))
 
-        request, response = None, None
+    @staticmethod
+    def __generate_timeout_output() -> bytes:
+        """
+        Generates the raw 408 response sent to the clients that do not send the request before the deadline.
+        :return: raw HTTP response
+        """
+        response = HttpResponseRequestTimeout(content=HttpResponseCode.REQUEST_TIMEOUT.get_reason())
+        response.add_header(HEADER_CONNECTION, HttpHeader(HEADER_CONNECTION, HEADER_CONNECTION_CLOSE))
+        return b"".join(generate_output(None, response))
+
+    @staticmethod
+    def __reject_connection(conn):
+        """
+        Sends the 503 response to the connection and closes it, without ever blocking the accept loop.
+        :param conn: connection to be rejected
+        """
+        try:
+            # If the client is not able to receive the response right now, just drop it
+            conn.setblocking(False)
+            conn.send(Server.__overload_output)
+        except OSError:
+            pass
+        finally:
+            conn.close()
+
+    @staticmethod
+    def __worker(connections: queue.Queue):
+        """
+        Worker thread of the pool, which keeps processing queued connections one after the other.
+        :param connections: queue of accepted connections
+        """
+        while True:
+            conn, addr = connections.get()
+            try:
+                Server.__process_connection(conn, addr)
+            except Exception:
+                # A failing connection must never kill the worker, as the pool would shrink
+                logging.exception('Error serving host {} on port {}'.format(addr[0], addr[1]))
+                conn.close()
+            finally:
+                # Let the shutdown know that this connection has been served
+                connections.task_done()
+
+    @staticmethod
+    def __read_head(conn, reader: HttpStreamReader) -> bytes | None:
+        """
+        Receives data from the connection until the head of the request is complete, which has to happen before
+        the header deadline.
+        :param conn: connection where the request is being received
+        :param reader: reader of the connection
+        :return: head of the request, or None if the client has closed the connection
+        """
+        deadline = time.monotonic() + Server.__header_timeout
+        head = reader.take_head(Server.__max_header_size)
+        while head is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout()
+            conn.settimeout(remaining)
+            if not reader.fill():
+                return None
+            head = reader.take_head(Server.__max_header_size)
+        return head
+
+    @staticmethod
+    async def __read_head_async(stream: asyncio.StreamReader, reader: HttpStreamReader) -> bytes | None:
+        """
+        Receives data from the connection until the head of the request is complete, which has to happen before
+        the header deadline.
+        :param stream: connection where the request is being received
+        :param reader: reader of the connection
+        :return: head of the request, or None if the client has closed the connection
+        """
+        deadline = time.monotonic() + Server.__header_timeout
+        head = reader.take_head(Server.__max_header_size)
+        while head is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            data = await asyncio.wait_for(stream.read(RECV_SIZE), remaining)
+            if not data:
+                return None
+            reader.feed(data)
+            head = reader.take_head(Server.__max_header_size)
+        return head
+
+    @staticmethod
+    def __parse_request(head: bytes, reader: HttpStreamReader) -> Tuple[HttpRequest | None, HttpResponseError | None]:
+        """
+        Parses the head of the request. It is run inside the event loop, even if it may access the filesystem: the
+        root folder and the index file of the requested host (or of the default hosts, for HTTP/1.0 requests without
+        Host) are checked the first time they are used, and then every few seconds while they do not exist.
+        :param head: head of the request received from the socket
+        :param reader: reader of the connection, from which the body will be streamed
+        :return: the request (if at least the request-line was valid) and the error raised while parsing (if any)
+        """
+        request = None
         try:
             # Try to parse the request basic request (if not possible, HttpResponseError will catch it)
-            request = HttpRequest(conn.recv(1024))
-            # Now try with headers and body (but if fails, at least request object will exist)
-            request.parse_request(Server.__hosts)
-            # And generate the response based on the request
-            response = Server.__get_response(request)
+            request = HttpRequest(head, reader)
+            # Now try with headers (but if fails, at least request object will exist)
+            request.parse_request(Server.__hosts, Server.__max_body_size)
         except HttpResponseError as e:
-            response = e
+            return request, e
+        return request, None
+
+    @staticmethod
+    def __build_output(request: HttpRequest | None, error: HttpResponseError | None,
+                       close: bool) -> Tuple[List[bytes], List[bytes | FileContent | ChunkedContent] | None, bool]:
+        """
+        Generates the response for an already parsed request, and serializes it. This step may read files and
+        the request body, so the asyncio engine runs it outside the event loop.
+        :param request: parsed request (None if the request-line was invalid)
+        :param error: error raised while parsing the request (None if there was no error)
+        :param close: whether the connection will be closed after sending this response
+        :return: buffers of the raw HTTP response, the parts to be sent after it (if it includes files), and whether
+                 the connection has to be closed after sending it
+        """
+        response = error
+        if response is None:
+            try:
+                # Generate the response based on the request
+                response = Server.__get_response(request)
+            except HttpResponseError as e:
+                response = e
+
+        # Discard the unread body so the next request can be read, if the end of this request is known
+        if request is None or not request.finish_body():
+            close = True
+        # The server may have started shutting down while the request was being received
+        if Server.__stopping:
+            close = True
+
+        if close:
+            # Let the client know that it cannot send more requests through this connection
+            response.add_header(HEADER_CONNECTION, HttpHeader(HEADER_CONNECTION, HEADER_CONNECTION_CLOSE))
 
         # Generate the output based on the request and the repsonse
-        out = generate_output(request, response)
-        # Encode it as bytes and send it
-        conn.send(bytes(out))
+        return generate_output(request, response), response.get_streamed_content(), close
 
-        if request:
-            # For HTTP/1.0, we always close the connection
-            if request.get_http_version() == HttpVersion.HTTP_10:
-                conn.close()
-                return
-            # For HTTP/1.1, if "Connection: close" header is present, we also close the connection
-            if request.has_header(HEADER_CONNECTION) and request[HEADER_CONNECTION] == HEADER_CONNECTION_CLOSE:
-                conn.close()
-                return
-        # Otherwise, we keep listening for connections
-        Server.__process_connection(conn, addr)
+    @staticmethod
+    def __close_content(parts: List[bytes | FileContent | ChunkedContent] | None):
+        # Close the files of the response (several parts may share the same file)
+        for part in parts or ():
+            if isinstance(part, (FileContent, ChunkedContent)):
+                part.close()
+
+    @staticmethod
+    def __must_close(request: HttpRequest | None) -> bool:
+        """
+        Checks if the connection has to be closed after answering the given request.
+        :param request: request that has just been answered
+        :return: True if the connection must be closed
+        """
+        if not request:
+            return False
+        # For HTTP/1.0, we always close the connection
+        if request.get_http_version() == HttpVersion.HTTP_10:
+            return True
+        # For HTTP/1.1, if "Connection: close" header is present, we also close the connection
+        return request.has_header(HEADER_CONNECTION) and \
+            request[HEADER_CONNECTION].value.lower() == HEADER_CONNECTION_CLOSE
+
+    @staticmethod
+    def __is_pipelinable(request: HttpRequest | None, error: HttpResponseError | None) -> bool:
+        """
+        Checks if a request can be answered while the next pipelined request is processed, which requires the
+        request not to modify any file and its body to be completely read.
+        :param request: parsed request
+        :param error: error raised while parsing the request
+        :return: True if the response can be built concurrently with the next ones
+        """
+        return error is None and request.get_method() in (HttpMethod.GET, HttpMethod.NTW22INFO) and \
+            request.is_body_finished()
+
+    @staticmethod
+    def __send_buffers(conn, buffers: List[bytes]):
+        """
+        Sends several buffers with vectored writes (usually a single system call for all of them), so they do not
+        have to be copied into a single one first. Partially sent buffers are replaced in the given list.
+        :param conn: connection where the buffers are sent
+        :param buffers: buffers to be sent, in order
+        """
+        if not hasattr(conn, "sendmsg"):
+            # Vectored writes are not available in every platform
+            conn.sendall(b"".join(buffers))
+            return
+        index = 0
+        while index < len(buffers):
+            sent = conn.sendmsg(buffers[index:index + MAX_SEND_BUFFERS])
+            # Skip the buffers that have been completely sent, and keep the rest of a partially sent one
+            while index < len(buffers) and sent >= len(buffers[index]):
+                sent -= len(buffers[index])
+                index += 1
+            if sent:
+                buffers[index] = memoryview(buffers[index])[sent:]
+
+    @staticmethod
+    def __process_connection(conn, addr):
+        logging.debug('Serving a connection from host {} on port {}'.format(addr[0], addr[1]))
+
+        reader = HttpStreamReader(conn.recv)
+        # Buffers of the responses that have not been sent yet, so the ones of pipelined requests are sent all at once
+        pending = []
+        batched = 0
+        try:
+            for served in range(1, Server.__max_requests + 1):
+                if not reader.has_data():
+                    # Wait for the next request to start, but do not keep idle connections forever
+                    conn.settimeout(Server.__idle_timeout)
+                    if not reader.fill():
+                        # Client has closed the connection
+                        break
+
+                try:
+                    # Once the request has started, its head has to arrive before the deadline
+                    head = Server.__read_head(conn, reader)
+                except socket.timeout:
+                    Server.__send_buffers(conn, pending + [Server.__timeout_output])
+                    break
+                except HttpResponseError as e:
+                    Server.__send_buffers(conn, pending + Server.__build_output(None, e, True)[0])
+                    break
+                if head is None:
+                    break
+
+                request, error = Server.__parse_request(head, reader)
+                close = Server.__must_close(request) or served == Server.__max_requests or Server.__stopping
+                # The body is streamed while generating the response, so it cannot stall either
+                conn.settimeout(Server.__header_timeout)
+                out, parts, close = Server.__build_output(request, error, close)
+                pending += out
+                batched += 1
+                if parts is None and not close and batched < MAX_PIPELINE_DEPTH and reader.has_head():
+                    # The next request has already been received, so its response will be sent along with this one
+                    continue
+
+                try:
+                    for part in parts or ():
+                        if isinstance(part, (FileContent, ChunkedContent)):
+                            # Send everything before the file at once
+                            Server.__send_buffers(conn, pending)
+                            pending.clear()
+                        if isinstance(part, FileContent):
+                            # Followed by the files, copied by the kernel when possible (or by chunks otherwise)
+                            conn.sendfile(part.get_file(), part.get_offset(), part.get_size())
+                        elif isinstance(part, ChunkedContent):
+                            # Or by the chunks, as soon as they are generated
+                            for data in part.iter_chunks():
+                                conn.sendall(data)
+                        else:
+                            # Parts in memory are sent along with the head
+                            pending.append(part)
+                    Server.__send_buffers(conn, pending)
+                    pending.clear()
+                    batched = 0
+                finally:
+                    Server.__close_content(parts)
+                if close:
+                    break
+        except socket.timeout:
+            logging.debug('Closing idle connection from host {} on port {}'.format(addr[0], addr[1]))
+        except ConnectionError:
+            # Client went away while we were sending the response
+            pass
+        finally:
+            conn.close()
+
+    @staticmethod
+    async def __send_pending_async(pending: collections.deque, writer: asyncio.StreamWriter) -> bool:
+        """
+        Sends the responses of the pipelined requests as soon as they are built, in the same order the requests
+        were received.
+        :param pending: futures of the responses being built
+        :param writer: connection where the responses are sent
+        :return: True if the connection has to be closed
+        """
+        loop = asyncio.get_running_loop()
+        close = False
+        while pending and not close:
+            out, parts, close = await pending[0]
+            pending.popleft()
+            try:
+                # Transports write several buffers at once (with vectored writes, when supported)
+                writer.writelines(out)
+                for part in parts or ():
+                    if isinstance(part, FileContent):
+                        # Followed by the files, copied by the kernel when possible (or by chunks otherwise)
+                        await writer.drain()
+                        await loop.sendfile(writer.transport, part.get_file(), part.get_offset(), part.get_size())
+                    elif isinstance(part, ChunkedContent):
+                        # Or by the chunks, which are generated outside the event loop
+                        chunks = part.iter_chunks()
+                        data = await loop.run_in_executor(None, next, chunks, None)
+                        while data is not None:
+                            writer.write(data)
+                            await writer.drain()
+                            data = await loop.run_in_executor(None, next, chunks, None)
+                    else:
+                        writer.write(part)
+            finally:
+                Server.__close_content(parts)
+        await writer.drain()
+        return close
+
+    @staticmethod
+    def __discard_output(future: asyncio.Future):
+        # Close the files of a response that will never be sent
+        if not future.cancelled() and future.exception() is None:
+            Server.__close_content(future.result()[1])
+
+    @staticmethod
+    def __release_body_slot(_: asyncio.Future):
+        # A thread receiving bodies is free again (only called from the event loop)
+        Server.__body_slots += 1
+
+    @staticmethod
+    async def __process_connection_async(stream: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        addr = writer.get_extra_info('peername')
+        logging.debug('Serving a connection from host {} on port {}'.format(addr[0], addr[1]))
+
+        loop = asyncio.get_running_loop()
+        # Keep track of the connection, so the shutdown can wait for it
+        task = asyncio.current_task()
+        Server.__tasks.add(task)
+
+        def recv(size: int) -> bytes:
+            # The body is streamed from the executor, so it has to ask the event loop for the data
+            future = asyncio.run_coroutine_threadsafe(
+                asyncio.wait_for(stream.read(size), Server.__header_timeout), loop)
+            try:
+                return future.result()
+            except asyncio.TimeoutError:
+                raise socket.timeout()
+
+        reader = HttpStreamReader(recv)
+        # Responses being built for the pipelined requests, in the order the requests were received
+        pending = collections.deque()
+        try:
+            for served in range(1, Server.__max_requests + 1):
+                if pending and not reader.has_head():
+                    # No other request can be processed right away, so send the responses before waiting for data
+                    if await Server.__send_pending_async(pending, writer):
+                        break
+
+                if not reader.has_data():
+                    # Wait for the next request to start, but do not keep idle connections forever
+                    data = await asyncio.wait_for(stream.read(RECV_SIZE), Server.__idle_timeout)
+                    if not data:
+                        # Client has closed the connection
+                        break
+                    reader.feed(data)
+
+                try:
+                    # Once the request has started, its head has to arrive before the deadline
+                    head = await Server.__read_head_async(stream, reader)
+                except asyncio.TimeoutError:
+                    await Server.__send_pending_async(pending, writer)
+                    writer.write(Server.__timeout_output)
+                    await writer.drain()
+                    break
+                except HttpResponseError as e:
+                    await Server.__send_pending_async(pending, writer)
+                    writer.writelines(Server.__build_output(None, e, True)[0])
+                    await writer.drain()
+                    break
+                if head is None:
+                    break
+
+                request, error = Server.__parse_request(head, reader)
+                close = Server.__must_close(request) or served == Server.__max_requests or Server.__stopping
+                pipelinable = Server.__is_pipelinable(request, error)
+                if pending and not pipelinable:
+                    # Requests which modify files (or still have to read their body) wait for the previous ones
+                    if await Server.__send_pending_async(pending, writer):
+                        break
+
+                if error is None and not request.is_body_finished():
+                    if Server.__body_slots == 0:
+                        # Every thread receiving bodies is busy, so reject the request (without reading its body)
+                        logging.warning('Rejecting request from host {} on port {}: server overloaded'.format(
+                            addr[0], addr[1]))
+                        writer.write(Server.__overload_output)
+                        await writer.drain()
+                        break
+                    # The body is received while the output is built, which takes a thread until the client sends
+                    # all of it
+                    Server.__body_slots -= 1
+                    future = loop.run_in_executor(Server.__body_executor, Server.__build_output, request, error, close)
+                    future.add_done_callback(Server.__release_body_slot)
+                else:
+                    # Building the output may read files, so it is offloaded to the default executor
+                    future = loop.run_in_executor(None, Server.__build_output, request, error, close)
+                pending.append(future)
+                if close or not pipelinable or len(pending) >= MAX_PIPELINE_DEPTH:
+                    if await Server.__send_pending_async(pending, writer):
+                        break
+        except asyncio.TimeoutError:
+            logging.debug('Closing idle connection from host {} on port {}'.format(addr[0], addr[1]))
+        except ConnectionError:
+            # Client went away while we were sending the response
+            pass
+        finally:
+            for future in pending:
+                future.add_done_callback(Server.__discard_output)
+            writer.close()
+            Server.__tasks.discard(task)
 
 
 if __name__ == "__main__":
@@ -182,7 +1047,7 @@ if __name__ == "__main__":
 
     # Initialize the argument parser
     parser = argparse.ArgumentParser(
-        description="HTTP server based on TCP IPv4 with multithreading support.")
+        description="HTTP server based on TCP IPv4 with multithreading and asyncio support.")
     # Accept a custom port number as argument
     parser.add_argument("-p", "--port",
                         help="port to use to listen connections",
@@ -190,10 +1055,129 @@ if __name__ == "__main__":
                         nargs='?',
                         const=DEFAULT_PORT,
                         default=DEFAULT_PORT)
+    # Choose how connections are served (a thread per connection, or a single event loop)
+    parser.add_argument("-e", "--engine",
+                        help="engine to use to serve connections",
+                        choices=ENGINES,
+                        default=DEFAULT_ENGINE)
+    # Size of the queue of pending connections in the socket
+    parser.add_argument("-b", "--backlog",
+                        help="maximum number of pending connections in the socket",
+                        type=int,
+                        nargs='?',
+                        const=DEFAULT_BACKLOG,
+                        default=DEFAULT_BACKLOG)
+    # Number of processes serving connections (each one with its own engine)
+    parser.add_argument("-w", "--workers",
+                        help="number of worker processes (pre-fork mode if greater than 1)",
+                        type=int,
+                        nargs='?',
+                        const=DEFAULT_WORKERS,
+                        default=DEFAULT_WORKERS)
+    # Size of the pool of workers for the threaded engine
+    parser.add_argument("-t", "--threads",
+                        help="number of worker threads (threaded engine), or of threads receiving request bodies "
+                             "(asyncio engine)",
+                        type=int,
+                        nargs='?',
+                        const=DEFAULT_THREADS,
+                        default=DEFAULT_THREADS)
+    # Size of the queue of connections waiting for a worker
+    parser.add_argument("-q", "--queue-size",
+                        help="maximum number of connections waiting for a worker thread (threaded engine)",
+                        type=int,
+                        nargs='?',
+                        const=DEFAULT_QUEUE_SIZE,
+                        default=DEFAULT_QUEUE_SIZE)
+    # Keep-alive connections limits
+    parser.add_argument("--idle-timeout",
+                        help="seconds to wait for the next request in a keep-alive connection",
+                        type=float,
+                        nargs='?',
+                        const=IDLE_TIMEOUT,
+                        default=IDLE_TIMEOUT)
+    parser.add_argument("--header-timeout",
+                        help="seconds to receive a request once it has started",
+                        type=float,
+                        nargs='?',
+                        const=HEADER_TIMEOUT,
+                        default=HEADER_TIMEOUT)
+    parser.add_argument("--max-requests",
+                        help="maximum number of requests served per connection",
+                        type=int,
+                        nargs='?',
+                        const=MAX_KEEPALIVE_REQUESTS,
+                        default=MAX_KEEPALIVE_REQUESTS)
+    # Requests size limits
+    parser.add_argument("--max-header-size",
+                        help="maximum size in bytes of the request-line and headers",
+                        type=int,
+                        nargs='?',
+                        const=MAX_HEADER_SIZE,
+                        default=MAX_HEADER_SIZE)
+    parser.add_argument("--max-body-size",
+                        help="maximum size in bytes of the request body",
+                        type=int,
+                        nargs='?',
+                        const=MAX_BODY_SIZE,
+                        default=MAX_BODY_SIZE)
+    # File cache limits
+    parser.add_argument("--cache-size",
+                        help="maximum size in bytes of the in-memory file cache (0 to disable it)",
+                        type=int,
+                        nargs='?',
+                        const=CACHE_SIZE,
+                        default=CACHE_SIZE)
+    parser.add_argument("--cache-max-file-size",
+                        help="maximum size in bytes of a file to be cached",
+                        type=int,
+                        nargs='?',
+                        const=CACHE_MAX_FILE_SIZE,
+                        default=CACHE_MAX_FILE_SIZE)
+    # Compression limits
+    parser.add_argument("--compression-max-file-size",
+                        help="maximum size in bytes of a file to be compressed on the fly (0 to disable it)",
+                        type=int,
+                        nargs='?',
+                        const=COMPRESSION_MAX_FILE_SIZE,
+                        default=COMPRESSION_MAX_FILE_SIZE)
     args = parser.parse_args()
 
-    # Create the server in the specified port (8080 by default) and start listening for connections
-    server = Server(port=args.port)
-    server.listen()
-    # Close the server after finishing
-    server.close()
+    # Log the counters of the file cache and of the path locks when requested, so they can be tuned
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda *_: logging.info("File cache: {}, path locks: {}".format(
+            Server.get_cache_stats(), Server.get_lock_stats())))
+    # Reload the virtual hosts file when requested (it is also reloaded when it is modified)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, Server.request_reload)
+
+    def serve(reuse_port=False, lock_folder=None):
+        # Create the server in the specified port (8080 by default) and start listening for connections
+        server = Server(port=args.port, engine=args.engine, backlog=args.backlog, threads=args.threads,
+                        queue_size=args.queue_size, idle_timeout=args.idle_timeout,
+                        header_timeout=args.header_timeout, max_requests=args.max_requests,
+                        max_header_size=args.max_header_size, max_body_size=args.max_body_size,
+                        cache_size=args.cache_size, cache_max_file_size=args.cache_max_file_size,
+                        compression_max_file_size=args.compression_max_file_size, reuse_port=reuse_port,
+                        lock_folder=lock_folder)
+        server.listen()
+        # Close the server after finishing
+        server.close()
+
+    if args.workers > 1:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            parser.error("worker processes require SO_REUSEPORT, which is not available in this platform")
+        # The master only reserves the port (without listening on it), so it fails right away if it is in use, while
+        # each worker listens on its own socket
+        reserved = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        reserved.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        reserved.bind(('', args.port))
+        # The workers modify the same files, so they share the locks of the paths through the files of a folder
+        lock_folder = tempfile.mkdtemp(prefix=PATH_LOCK_FOLDER_PREFIX)
+        try:
+            WorkerSupervisor(args.workers, lambda: serve(reuse_port=True, lock_folder=lock_folder)).run()
+        finally:
+            shutil.rmtree(lock_folder, ignore_errors=True)
+        reserved.close()
+    else:
+        serve()
@@ -1,4 +1,65 @@
 DEFAULT_PORT = 8080
 HTTP_ENCODING = "utf-8"
+HEADER_ENCODING = "iso-8859-1"
 SERVER_NAME = "Group AMD Server"
 VHOSTS_FILE = "vhosts.conf"
+
+ENGINE_THREADED = "threaded"
+ENGINE_ASYNCIO = "asyncio"
+ENGINES = (ENGINE_THREADED, ENGINE_ASYNCIO)
+DEFAULT_ENGINE = ENGINE_THREADED
+
+DEFAULT_BACKLOG = 128
+DEFAULT_THREADS = 32
+DEFAULT_QUEUE_SIZE = 64
+RETRY_AFTER = 1
+
+DEFAULT_WORKERS = 1
+WORKER_RESTART_DELAY = 1
+SHUTDOWN_TIMEOUT = 30
+SHUTDOWN_POLL_INTERVAL = 0.1
+
+IDLE_TIMEOUT = 5
+HEADER_TIMEOUT = 10
+MAX_KEEPALIVE_REQUESTS = 100
+MAX_PIPELINE_DEPTH = 16
+
+RECV_SIZE = 64 * 1024
+# Buffers written by each vectored write (systems usually allow up to 1024)
+MAX_SEND_BUFFERS = 512
+MAX_HEADER_SIZE = 8 * 1024
+MAX_BODY_SIZE = 100 * 1024 * 1024
+MAX_CHUNK_LINE_SIZE = 4 * 1024
+
+CACHE_SIZE = 64 * 1024 * 1024
+CACHE_MAX_FILE_SIZE = 1024 * 1024
+CACHE_REVALIDATE_INTERVAL = 1
+
+INDEX_REBUILD_INTERVAL = 5
+# Folders modified less than these seconds before being walked are walked again, as timestamps are not precise enough
+INDEX_MTIME_MARGIN = 1
+VHOSTS_POLL_INTERVAL = 2
+VHOST_RECHECK_INTERVAL = 10
+
+# Durability of the files uploaded with PUT: not synced, synced, or synced along with their folder (so the rename that
+# puts them in place also survives a crash)
+DURABILITY_NONE = "none"
+DURABILITY_FILE = "fsync-file"
+DURABILITY_FOLDER = "fsync-dir"
+DURABILITIES = (DURABILITY_NONE, DURABILITY_FILE, DURABILITY_FOLDER)
+DEFAULT_DURABILITY = DURABILITY_NONE
+# Uploads are written to hidden temporary files (which are never served) until they are complete
+UPLOAD_TEMP_PREFIX = ".upload-"
+UPLOAD_TEMP_SUFFIX = ".tmp"
+# Maximum size of the files extracted from a deploy archive (which is usually compressed)
+DEPLOY_MAX_SIZE = 1024 * 1024 * 1024
+# Locks shared by the paths modified with PUT and DELETE
+PATH_LOCK_STRIPES = 256
+# Prefix of the temporary folder where the pre-fork workers share those locks
+PATH_LOCK_FOLDER_PREFIX = "ntw22-locks-"
+
+MAX_RANGES = 16
+
+COMPRESSION_LEVEL = 6
+COMPRESSION_MIN_SIZE = 256
+COMPRESSION_MAX_FILE_SIZE = 10 * 1024 * 1024
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from typing import List, Tuple
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.response import HttpResponseBadRequest, HttpResponsePayloadTooLarge  # noqa: E402
+from utils.deploy import extract_archive  # noqa: E402
+
+
+def build_archive(members: List[Tuple[str, bytes | str | None, bytes]], compression: str = "gz") -> bytes:
+    """
+    Generates a tar archive.
+    :param members: name, contents (bytes for files, None for folders, or the target of a link) and type of each member
+    :param compression: compression of the archive ("" for none)
+    :return: contents of the archive
+    """
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w:" + compression) as archive:
+        for name, contents, kind in members:
+            info = tarfile.TarInfo(name)
+            info.type = kind
+            if kind == tarfile.REGTYPE:
+                info.size = len(contents)
+                archive.addfile(info, io.BytesIO(contents))
+                continue
+            if kind in (tarfile.SYMTYPE, tarfile.LNKTYPE):
+                info.linkname = contents
+            archive.addfile(info)
+    return data.getvalue()
+
+
+def chunks(data: bytes, size: int = 1000) -> List[bytes]:
+    # The body is received by parts
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+class ExtractArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__folder = tempfile.TemporaryDirectory()
+        self.parent = Path(self.__folder.name)
+        self.folder = self.parent.joinpath("staging")
+        self.folder.mkdir()
+
+    def tearDown(self):
+        self.__folder.cleanup()
+
+    def extract(self, members: List[Tuple[str, bytes | str | None, bytes]], **kwargs) -> Tuple[int, int]:
+        return extract_archive(chunks(build_archive(members)), self.folder, **kwargs)
+
+    def assertRejected(self, members: List[Tuple[str, bytes | str | None, bytes]], error: type = HttpResponseBadRequest,
+                       **kwargs):
+        with self.assertRaises(error):
+            self.extract(members, **kwargs)
+        # Nothing is ever written outside the folder
+        self.assertEqual(["staging"], os.listdir(self.parent))
+
+    def test_extract(self):
+        files, size = self.extract([
+            ("./", None, tarfile.DIRTYPE),
+            ("index.html", b"<html></html>", tarfile.REGTYPE),
+            ("css", None, tarfile.DIRTYPE),
+            ("css/style.css", b"body {}", tarfile.REGTYPE),
+            ("js/app.js", b"", tarfile.REGTYPE),
+        ])
+        self.assertEqual((3, 20), (files, size))
+        self.assertEqual(b"body {}", self.folder.joinpath("css", "style.css").read_bytes())
+        self.assertTrue(self.folder.joinpath("js", "app.js").is_file())
+
+    def test_uncompressed(self):
+        archive = build_archive([("index.html", b"<html></html>", tarfile.REGTYPE)], compression="")
+        self.assertEqual((1, 13), extract_archive(chunks(archive, 100), self.folder))
+
+    def test_parent_path(self):
+        self.assertRejected([("../evil.html", b"evil", tarfile.REGTYPE)])
+        self.assertRejected([("css/../../evil.html", b"evil", tarfile.REGTYPE)])
+
+    def test_absolute_path(self):
+        self.assertRejected([("/tmp/evil.html", b"evil", tarfile.REGTYPE)])
+
+    def test_symbolic_link(self):
+        self.assertRejected([("passwd", "/etc/passwd", tarfile.SYMTYPE)])
+        self.assertRejected([("parent", "..", tarfile.SYMTYPE)])
+
+    def test_hard_link(self):
+        self.assertRejected([("passwd", "/etc/passwd", tarfile.LNKTYPE)])
+
+    def test_device(self):
+        self.assertRejected([("null", None, tarfile.CHRTYPE)])
+
+    def test_too_large(self):
+        members = [("a.txt", b"a" * 600, tarfile.REGTYPE), ("b.txt", b"b" * 600, tarfile.REGTYPE)]
+        self.assertRejected(members, HttpResponsePayloadTooLarge, max_size=1000)
+        # The limit counts all the files together
+        self.assertEqual((1, 600), self.extract(members[:1], max_size=1000))
+
+    def test_conflicting_paths(self):
+        self.assertRejected([("a", b"file", tarfile.REGTYPE), ("a/b.txt", b"file", tarfile.REGTYPE)])
+
+    def test_invalid_archive(self):
+        with self.assertRaises(HttpResponseBadRequest):
+            extract_archive([b"not an archive"], self.folder)
+        # Archives cut in the middle are not valid either
+        with self.assertRaises(HttpResponseBadRequest):
+            extract_archive(chunks(build_archive([("a.txt", b"a" * 5000, tarfile.REGTYPE)], compression="")[:1500]),
+                            self.folder)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import os
+import sys
+import unittest
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.enums import HttpResponseCode  # noqa: E402
+from http.header import HEADER_CONTENT_LENGTH  # noqa: E402
+from http.request import HttpRequest  # noqa: E402
+from http.response import ChunkedContent, HttpResponse, HttpResponseNotFound  # noqa: E402
+from utils.entity import generate_auto_headers  # noqa: E402
+
+
+def build_headers(head: bytes, response) -> HttpResponse:
+    """
+    Generates the automatic headers of a response.
+    :param head: head of the request being answered
+    :param response: response of the request
+    :return: the same response
+    """
+    generate_auto_headers(HttpRequest(head), response)
+    return response
+
+
+class ContentLengthTest(unittest.TestCase):
+    """
+    Responses without content must still be framed, so keep-alive clients know where they end.
+    """
+
+    def assertContentLength(self, response, value: str | None):
+        header = response[HEADER_CONTENT_LENGTH]
+        self.assertEqual(value, header.value if header is not None else None)
+
+    def test_empty_put(self):
+        response = build_headers(b"PUT /file.txt HTTP/1.1\r\n\r\n", HttpResponse(status=HttpResponseCode.CREATED))
+        self.assertContentLength(response, "0")
+
+    def test_empty_delete(self):
+        response = build_headers(b"DELETE /file.txt HTTP/1.1\r\n\r\n", HttpResponse())
+        self.assertContentLength(response, "0")
+
+    def test_empty_error(self):
+        response = build_headers(b"DELETE /missing.txt HTTP/1.1\r\n\r\n", HttpResponseNotFound())
+        self.assertContentLength(response, "0")
+
+    def test_content(self):
+        response = build_headers(b"GET / HTTP/1.1\r\n\r\n", HttpResponse(content="hello"))
+        self.assertContentLength(response, "5")
+
+    def test_not_modified(self):
+        response = build_headers(b"GET / HTTP/1.1\r\n\r\n", HttpResponse(status=HttpResponseCode.NOT_MODIFIED))
+        self.assertContentLength(response, None)
+
+    def test_chunked(self):
+        response = build_headers(b"GET / HTTP/1.1\r\n\r\n", HttpResponse(content=ChunkedContent(iter([b"hello"]))))
+        self.assertContentLength(response, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
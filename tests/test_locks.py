@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.locks import PathLockTable  # noqa: E402
+
+
+class PathLockTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__folder = tempfile.TemporaryDirectory()
+        self.folder = self.__folder.name
+
+    def tearDown(self):
+        self.__folder.cleanup()
+
+    @staticmethod
+    def try_hold(table: PathLockTable, path: str, parents_exclusive: bool = False) -> bool:
+        # Tries to hold the path from another thread, and checks if it got it before timing out
+        held = threading.Event()
+
+        def hold():
+            with table.hold("example.ch", path, parents_exclusive):
+                held.set()
+
+        thread = threading.Thread(target=hold, daemon=True)
+        thread.start()
+        return held.wait(0.2)
+
+    def test_same_path_waits(self):
+        table = PathLockTable(16)
+        with table.hold("example.ch", "a/b.txt"):
+            self.assertFalse(self.try_hold(table, "a/b.txt"))
+        self.assertTrue(self.try_hold(table, "a/b.txt"))
+
+    def test_root_exclusive_waits_for_every_path(self):
+        table = PathLockTable(16)
+        with table.hold("example.ch", "a/b.txt"):
+            self.assertFalse(self.try_hold(table, ""))
+
+    def test_shared_between_tables(self):
+        # Tables sharing a folder behave as the tables of different workers
+        first = PathLockTable(16, self.folder)
+        second = PathLockTable(16, self.folder)
+        with first.hold("example.ch", "a/b.txt"):
+            self.assertFalse(self.try_hold(second, "a/b.txt"))
+        self.assertTrue(self.try_hold(second, "a/b.txt"))
+
+
+if __name__ == "__main__":
+    unittest.main()
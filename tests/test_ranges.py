@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import os
+import sys
+import unittest
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.ranges import parse_range  # noqa: E402
+
+
+class ParseRangeTest(unittest.TestCase):
+    """
+    Ranges are parsed for a file of 1000 bytes.
+    """
+
+    def test_closed(self):
+        self.assertEqual([(0, 499)], parse_range("bytes=0-499", 1000))
+        self.assertEqual([(500, 500)], parse_range("bytes=500-500", 1000))
+        # The last byte is limited to the size of the file
+        self.assertEqual([(500, 999)], parse_range("bytes=500-5000", 1000))
+
+    def test_open_ended(self):
+        self.assertEqual([(500, 999)], parse_range("bytes=500-", 1000))
+        self.assertEqual([(999, 999)], parse_range("bytes=999-", 1000))
+        self.assertEqual([(0, 999)], parse_range("bytes=0-", 1000))
+
+    def test_suffix(self):
+        self.assertEqual([(500, 999)], parse_range("bytes=-500", 1000))
+        # A suffix longer than the file is the whole file
+        self.assertEqual([(0, 999)], parse_range("bytes=-5000", 1000))
+
+    def test_multiple(self):
+        self.assertEqual([(0, 99), (200, 299), (900, 999)], parse_range("bytes=0-99, 200-299,-100", 1000))
+        # Sorted by their first byte
+        self.assertEqual([(0, 99), (200, 299)], parse_range("bytes=200-299,0-99", 1000))
+
+    def test_merged(self):
+        # Overlapping, adjacent and repeated ranges
+        self.assertEqual([(0, 199)], parse_range("bytes=0-99,50-199", 1000))
+        self.assertEqual([(0, 199)], parse_range("bytes=100-199,0-99", 1000))
+        self.assertEqual([(0, 99)], parse_range("bytes=0-99,0-99,10-20", 1000))
+        self.assertEqual([(0, 999)], parse_range("bytes=0-,-500,100-200", 1000))
+
+    def test_unsatisfiable(self):
+        self.assertEqual([], parse_range("bytes=1000-", 1000))
+        self.assertEqual([], parse_range("bytes=1000-1999", 1000))
+        self.assertEqual([], parse_range("bytes=-0", 1000))
+        self.assertEqual([], parse_range("bytes=0-", 0))
+        self.assertEqual([], parse_range("bytes=-500", 0))
+        # Only the satisfiable ranges are kept
+        self.assertEqual([(0, 99)], parse_range("bytes=2000-2999,0-99", 1000))
+
+    def test_unit(self):
+        self.assertEqual([(0, 99)], parse_range("Bytes=0-99", 1000))
+        self.assertIsNone(parse_range("items=0-99", 1000))
+        self.assertIsNone(parse_range("0-99", 1000))
+
+    def test_malformed(self):
+        for value in ("bytes=", "bytes=-", "bytes=a-b", "bytes=0-99,", "bytes=,0-99", "bytes=0--99", "bytes=-5-",
+                      "bytes=0-99;200-299", "bytes=+0-99", "bytes=0x10-"):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_range(value, 1000))
+
+    def test_last_before_first(self):
+        self.assertIsNone(parse_range("bytes=500-499", 1000))
+        # The whole header is ignored, even if other ranges are valid
+        self.assertIsNone(parse_range("bytes=0-99,500-499", 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
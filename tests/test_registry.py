@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.registry import VhostRegistry  # noqa: E402
+
+
+class VhostRegistryTest(unittest.TestCase):
+    """
+    Hosts are found in a temporary folder, as their roots are relative to the working directory.
+    """
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__folder = tempfile.TemporaryDirectory()
+        os.chdir(self.__folder.name)
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__folder.cleanup()
+
+    @staticmethod
+    def create_host(hostname: str):
+        # Creates the root folder and the index file of a host, so it is available
+        os.makedirs(hostname)
+        with open(os.path.join(hostname, "index.html"), "w") as f:
+            f.write("<html></html>")
+
+    @staticmethod
+    def parse(*hostnames: str) -> VhostRegistry:
+        with open("vhosts.conf", "w") as f:
+            for hostname in hostnames:
+                f.write("{},index.html,Admin,admin@{}\n".format(hostname, hostname.lstrip("*.")))
+        return VhostRegistry.parse_file("vhosts.conf")
+
+    def test_default_is_first_exact_host(self):
+        self.create_host("first.ch")
+        self.create_host("second.ch")
+        self.assertEqual("first.ch", self.parse("first.ch", "second.ch").get_default().get_hostname())
+
+    def test_default_skips_unavailable_hosts(self):
+        self.create_host("second.ch")
+        # The first host has no folder, and the second one has no index file
+        os.makedirs("third.ch")
+        hosts = self.parse("first.ch", "third.ch", "second.ch")
+        self.assertEqual("second.ch", hosts.get_default().get_hostname())
+
+    def test_default_skips_wildcards(self):
+        self.create_host("*.example.ch")
+        self.create_host("example.ch")
+        self.assertEqual("example.ch", self.parse("*.example.ch", "example.ch").get_default().get_hostname())
+
+    def test_no_default_without_available_hosts(self):
+        self.assertIsNone(self.parse("first.ch", "second.ch").get_default())
+        self.assertIsNone(self.parse().get_default())
+
+    def test_last_definition_wins(self):
+        self.create_host("first.ch")
+        self.create_host("second.ch")
+        with open("vhosts.conf", "w") as f:
+            f.write("first.ch,index.html,Old,old@first.ch\n")
+            f.write("second.ch,index.html,Admin,admin@second.ch\n")
+            f.write("first.ch,index.html,New,new@first.ch\n")
+        hosts = VhostRegistry.parse_file("vhosts.conf")
+        self.assertEqual("New", hosts.find("first.ch").get_server_admin_name())
+        # But the host keeps the position of its first definition
+        self.assertEqual("first.ch", hosts.get_default().get_hostname())
+
+    def test_find_most_specific_wildcard(self):
+        hosts = self.parse("example.ch", "*.example.ch", "*.shop.example.ch")
+        self.assertEqual("example.ch", hosts.find("EXAMPLE.ch").get_hostname())
+        self.assertEqual("*.example.ch", hosts.find("www.example.ch").get_hostname())
+        self.assertEqual("*.shop.example.ch", hosts.find("www.shop.example.ch").get_hostname())
+        self.assertEqual("*.example.ch", hosts.find("shop.example.ch").get_hostname())
+        self.assertIsNone(hosts.find("www..example.ch"))
+        self.assertIsNone(hosts.find("example.com"))
+
+
+if __name__ == "__main__":
+    unittest.main()
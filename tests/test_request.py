@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+from typing import List
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.reader import HttpStreamReader  # noqa: E402
+from http.request import HttpRequest  # noqa: E402
+from http.response import HttpResponseBadRequest, HttpResponseNotImplemented, HttpResponsePayloadTooLarge  # noqa: E402
+from utils.registry import VhostRegistry  # noqa: E402
+
+
+class ChunkedBodyTest(unittest.TestCase):
+    """
+    Requests are parsed for a host created in a temporary folder, as their roots are relative to the working directory.
+    The body is received in the given pieces, so chunks split among several receptions are tested as well.
+    """
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__folder = tempfile.TemporaryDirectory()
+        os.chdir(self.__folder.name)
+        os.makedirs("example.ch")
+        with open(os.path.join("example.ch", "index.html"), "w") as f:
+            f.write("<html></html>")
+        with open("vhosts.conf", "w") as f:
+            f.write("example.ch,index.html,Admin,admin@example.ch\n")
+        self.hosts = VhostRegistry.parse_file("vhosts.conf")
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__folder.cleanup()
+
+    def parse(self, pieces: List[bytes], headers: bytes = b"Transfer-Encoding: chunked\r\n",
+              max_body_size: int = 1024) -> HttpRequest:
+        """
+        Parses a PUT request whose body is received in the given pieces.
+        :param pieces: data received after the head of the request
+        :param headers: headers of the request, besides Host
+        :param max_body_size: maximum allowed size for the request body
+        :return: parsed request, with the body not read yet
+        """
+        pieces = list(pieces)
+
+        def recv(size: int) -> bytes:
+            # Like a socket, never returns more than the requested size
+            if not pieces:
+                return b""
+            data = pieces.pop(0)
+            if len(data) > size:
+                pieces.insert(0, data[size:])
+            return data[:size]
+
+        self.reader = HttpStreamReader(recv)
+        head = b"PUT /file.txt HTTP/1.1\r\nHost: example.ch\r\n" + headers + b"\r\n"
+        request = HttpRequest(head, self.reader)
+        request.parse_request(self.hosts, max_body_size=max_body_size)
+        return request
+
+    def read_body(self, *pieces: bytes, max_body_size: int = 1024) -> bytes:
+        request = self.parse(list(pieces), max_body_size=max_body_size)
+        body = b"".join(bytes(chunk) for chunk in request.iter_body())
+        self.assertTrue(request.is_body_finished())
+        return body
+
+    def test_chunks(self):
+        self.assertEqual(b"hello world", self.read_body(b"5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"))
+
+    def test_split_chunks(self):
+        # Sizes, data and CRLFs split among receptions
+        pieces = [b"5", b"\r", b"\nhel", b"lo\r", b"\nA\r\n0123456789", b"\r\n0\r", b"\n\r\n"]
+        self.assertEqual(b"hello0123456789", self.read_body(*pieces))
+
+    def test_hexadecimal_size(self):
+        self.assertEqual(b"x" * 26, self.read_body(b"1a\r\n" + b"x" * 26 + b"\r\n0\r\n\r\n"))
+        self.assertEqual(b"x" * 26, self.read_body(b"1A\r\n" + b"x" * 26 + b"\r\n0\r\n\r\n"))
+
+    def test_extensions(self):
+        body = self.read_body(b"5;name=value\r\nhello\r\n6 ; other\r\n world\r\n0;last\r\n\r\n")
+        self.assertEqual(b"hello world", body)
+
+    def test_trailers(self):
+        self.assertEqual(b"hello", self.read_body(b"5\r\nhello\r\n0\r\nExpires: never\r\nX-Trailer: 1\r\n\r\n"))
+
+    def test_next_request_kept(self):
+        # Data after the last chunk (and its trailers) belongs to the next request
+        self.assertEqual(b"hello", self.read_body(b"5\r\nhello\r\n0\r\nX-Trailer: 1\r\n\r\nGET / HTTP/1.1\r\n\r\n"))
+        self.assertEqual(b"GET / HTTP/1.1\r\n\r\n", self.reader.take_head(1024))
+
+    def test_invalid_size(self):
+        for size in (b"", b"x", b"-5", b"+5", b"0x5", b"5 5", b"1" * 17):
+            with self.subTest(size=size), self.assertRaises(HttpResponseBadRequest):
+                self.read_body(size + b"\r\nhello\r\n0\r\n\r\n")
+
+    def test_too_long_size_line(self):
+        with self.assertRaises(HttpResponseBadRequest):
+            self.read_body(b"5;" + b"x" * 8192 + b"\r\nhello\r\n0\r\n\r\n")
+
+    def test_oversized_chunk(self):
+        with self.assertRaises(HttpResponsePayloadTooLarge):
+            self.read_body(b"401\r\n" + b"x" * 1025 + b"\r\n0\r\n\r\n")
+        with self.assertRaises(HttpResponsePayloadTooLarge):
+            self.read_body(b"fffffffffffffff\r\n")
+
+    def test_oversized_body(self):
+        # Each chunk is allowed, but not all of them together
+        with self.assertRaises(HttpResponsePayloadTooLarge):
+            self.read_body(b"200\r\n" + b"x" * 512 + b"\r\n201\r\n" + b"x" * 513 + b"\r\n0\r\n\r\n")
+        self.assertEqual(1024, len(self.read_body(b"400\r\n" + b"x" * 1024 + b"\r\n0\r\n\r\n")))
+
+    def test_missing_crlf(self):
+        # Chunk longer than its size, and chunk that is not followed by its CRLF
+        for body in (b"5\r\nhello!\r\n0\r\n\r\n", b"5\r\nhello0\r\n\r\n", b"5\r\nhello"):
+            with self.subTest(body=body), self.assertRaises(HttpResponseBadRequest):
+                self.read_body(body)
+
+    def test_missing_last_chunk(self):
+        for body in (b"5\r\nhello\r\n", b"5\r\nhel", b"5\r\nhello\r\n0\r\n"):
+            with self.subTest(body=body), self.assertRaises(HttpResponseBadRequest):
+                self.read_body(body)
+
+    def test_content_length(self):
+        # Both headers would allow to smuggle requests
+        for headers in (b"Transfer-Encoding: chunked\r\nContent-Length: 5\r\n",
+                        b"Content-Length: 5\r\nTransfer-Encoding: chunked\r\n"):
+            with self.subTest(headers=headers), self.assertRaises(HttpResponseBadRequest):
+                self.parse([b"5\r\nhello\r\n0\r\n\r\n"], headers=headers)
+
+    def test_unsupported_encoding(self):
+        for value in (b"gzip", b"gzip, chunked", b"identity"):
+            with self.subTest(value=value), self.assertRaises(HttpResponseNotImplemented):
+                self.parse([], headers=b"Transfer-Encoding: " + value + b"\r\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
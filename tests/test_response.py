@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.response import ChunkedContent, FileContent  # noqa: E402
+
+
+def read_file(content: FileContent):
+    # Generates the contents of the file by chunks, closing it once finished (as the compression of files does)
+    with content.get_file() as f:
+        yield from iter(lambda: f.read(4), b"")
+
+
+class ChunkedContentTest(unittest.TestCase):
+
+    def setUp(self):
+        self.file = tempfile.TemporaryFile()
+        self.file.write(b"hello world")
+        self.file.seek(0)
+
+    def tearDown(self):
+        self.file.close()
+
+    def test_framed(self):
+        content = ChunkedContent(iter([b"hello", b"", b" world"]))
+        self.assertEqual([b"5\r\nhello\r\n", b"6\r\n world\r\n", b"0\r\n\r\n"], list(content.iter_chunks()))
+
+    def test_not_framed(self):
+        content = ChunkedContent(iter([b"hello", b"", b" world"]))
+        content.set_framed(False)
+        self.assertEqual([b"hello", b" world"], list(content.iter_chunks()))
+
+    def test_close_finished(self):
+        source = FileContent(self.file)
+        content = ChunkedContent(read_file(source), source)
+        content.set_framed(False)
+        self.assertEqual(b"hello world", b"".join(content.iter_chunks()))
+        self.assertTrue(self.file.closed)
+        content.close()
+        self.assertTrue(self.file.closed)
+
+    def test_close_started(self):
+        source = FileContent(self.file)
+        content = ChunkedContent(read_file(source), source)
+        next(content.iter_chunks())
+        self.assertFalse(self.file.closed)
+        content.close()
+        self.assertTrue(self.file.closed)
+
+    def test_close_not_started(self):
+        # The generator never runs, so only the content can close the file (e.g. when a 304 is sent instead)
+        source = FileContent(self.file)
+        content = ChunkedContent(read_file(source), source)
+        content.close()
+        self.assertTrue(self.file.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.response import HttpResponseConflict  # noqa: E402
+from utils.vhosts import FileUpload  # noqa: E402
+
+
+class FileUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.__folder = tempfile.TemporaryDirectory()
+        self.folder = Path(self.__folder.name).joinpath("site")
+        self.folder.mkdir()
+
+    def tearDown(self):
+        self.__folder.cleanup()
+
+    def test_replace(self):
+        path = self.folder.joinpath("file.txt")
+        upload = FileUpload(path)
+        try:
+            upload.write([b"hello", b" world"])
+            upload.replace()
+        finally:
+            upload.discard()
+        self.assertEqual(b"hello world", path.read_bytes())
+        self.assertEqual(["file.txt"], os.listdir(self.folder))
+
+    def test_discard(self):
+        upload = FileUpload(self.folder.joinpath("file.txt"))
+        upload.write(b"hello")
+        upload.discard()
+        self.assertEqual([], os.listdir(self.folder))
+
+    def test_folder_replaced(self):
+        # A deploy replaces the folder (and removes the previous one) while the file is being received
+        path = self.folder.joinpath("file.txt")
+        upload = FileUpload(path)
+        try:
+            upload.write(b"hello")
+            shutil.rmtree(self.folder)
+            self.folder.mkdir()
+            with self.assertRaises(HttpResponseConflict):
+                upload.replace()
+        finally:
+            upload.discard()
+        self.assertEqual([], os.listdir(self.folder))
+
+    def test_folder_removed(self):
+        upload = FileUpload(self.folder.joinpath("file.txt"))
+        upload.write(b"hello")
+        shutil.rmtree(self.folder)
+        upload.discard()
+        self.assertFalse(self.folder.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import unittest
+
+# The local http package has to shadow the one of the standard library
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http.response import HttpResponseMethodNotAllowed, HttpResponseNotFound  # noqa: E402
+from utils.vhosts import Vhost  # noqa: E402
+
+
+class VhostResolveTest(unittest.TestCase):
+    """
+    Hosts are created in a temporary folder, as their roots are relative to the working directory.
+    """
+
+    def setUp(self):
+        self.__cwd = os.getcwd()
+        self.__folder = tempfile.TemporaryDirectory()
+        os.chdir(self.__folder.name)
+        os.makedirs("example.ch/docs")
+        for path in ("example.ch/index.html", "example.ch/docs/index.html", "example.ch/style.css"):
+            with open(path, "w") as f:
+                f.write(path)
+        self.vhost = Vhost("example.ch", "index.html", "Admin", "admin@example.ch")
+        # Build the index before the files of the tests are created
+        self.vhost.resolve("")
+
+    def tearDown(self):
+        os.chdir(self.__cwd)
+        self.__folder.cleanup()
+
+    def test_indexed_paths(self):
+        self.assertEqual("style.css", self.vhost.resolve("style.css").name)
+        self.assertEqual(self.vhost.resolve("docs/index.html"), self.vhost.resolve("docs/"))
+        with self.assertRaises(HttpResponseNotFound):
+            self.vhost.resolve("missing.css")
+
+    def test_file_created_after_the_index(self):
+        # As if it was uploaded through another worker
+        os.makedirs("example.ch/new")
+        with open("example.ch/new/index.html", "w") as f:
+            f.write("new")
+        self.assertEqual("index.html", self.vhost.resolve("new").name)
+        self.assertEqual(self.vhost.resolve("new"), self.vhost.resolve("new/index.html"))
+
+    def test_folder_as_index(self):
+        os.makedirs("example.ch/other/index.html")
+        with self.assertRaises(HttpResponseMethodNotAllowed):
+            self.vhost.resolve("other")
+
+    def test_temporary_files_are_not_served(self):
+        with open("example.ch/.upload-abc.tmp", "w") as f:
+            f.write("partial")
+        with self.assertRaises(HttpResponseNotFound):
+            self.vhost.resolve(".upload-abc.tmp")
+
+
+if __name__ == "__main__":
+    unittest.main()
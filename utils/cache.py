@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Hashable, List
+
+from http.header import HttpHeader
+
+
+class FileCacheEntry:
+    """
+    Cached file, with its contents, the headers that are always sent along with them and the data needed to know if
+    the file has changed in the filesystem.
+    """
+    __path = None
+    __content = None
+    __headers = None
+    __stat = None
+    __stat_key = None
+    # Last time (monotonic) the file was checked in the filesystem
+    __checked_at = None
+
+    def __init__(self, path: Path, content: bytes, headers: List[HttpHeader], stat: os.stat_result):
+        self.__path = path
+        self.__content = content
+        self.__headers = headers
+        self.__stat = stat
+        self.__stat_key = FileCacheEntry.get_stat_key(stat)
+        self.__checked_at = time.monotonic()
+
+    @staticmethod
+    def get_stat_key(stat: os.stat_result) -> tuple:
+        """
+        Given the stat of a file, returns the values that change when the file is modified or replaced.
+        :param stat: stat of the file
+        :return: tuple with the inode, the size and the modification time
+        """
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get_path(self) -> Path:
+        return self.__path
+
+    def get_content(self) -> bytes:
+        return self.__content
+
+    def get_headers(self) -> List[HttpHeader]:
+        return self.__headers
+
+    def get_stat(self) -> os.stat_result:
+        return self.__stat
+
+    def get_size(self) -> int:
+        return len(self.__content)
+
+    def is_stale(self, interval: float) -> bool:
+        """
+        Checks if the file has changed in the filesystem, at most once every interval.
+        :param interval: seconds during which the entry is trusted without checking the filesystem
+        :return: True if the file has been modified, replaced or removed
+        """
+        now = time.monotonic()
+        if now - self.__checked_at < interval:
+            return False
+        try:
+            stale = FileCacheEntry.get_stat_key(os.stat(self.__path)) != self.__stat_key
+        except OSError:
+            # File is not available anymore
+            return True
+        self.__checked_at = now
+        return stale
+
+
+class FileCache:
+    """
+    Thread-safe cache of small files, limited to a total size in bytes. When the limit is reached, the least recently
+    used files are evicted.
+    Entries are stored by the path of the file (once resolved, so a folder and its index file share the same entry),
+    or by the path of the file and the encoding for compressed variants. They are revalidated against the filesystem
+    once in a while, and have to be invalidated explicitly (by the path of the file) when the server itself modifies a
+    file.
+    """
+    __lock = None
+    __entries = None
+    # Keys of the entries (the file itself and its compressed variants) for each cached file
+    __keys = None
+    __max_size = None
+    __max_file_size = None
+    __revalidate_interval = None
+    __size = 0
+    __hits = 0
+    __misses = 0
+    __evictions = 0
+
+    def __init__(self, max_size: int, max_file_size: int, revalidate_interval: float):
+        self.__lock = threading.Lock()
+        self.__entries = OrderedDict()
+        self.__keys = {}
+        self.__max_size = max_size
+        self.__max_file_size = max_file_size
+        self.__revalidate_interval = revalidate_interval
+        self.__size = 0
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+
+    def accepts(self, size: int) -> bool:
+        """
+        Checks if a file of the given size can be cached.
+        :param size: size of the file in bytes
+        :return: True if the file is small enough to be cached
+        """
+        return size <= self.__max_file_size and size <= self.__max_size
+
+    def get(self, key: Hashable) -> FileCacheEntry | None:
+        """
+        Gets the cached file, if present and not modified in the filesystem.
+        :param key: path of the file (along with the encoding, for compressed variants)
+        :return: cached entry, or None if it is not cached
+        """
+        with self.__lock:
+            entry = self.__entries.get(key)
+        # Checking the filesystem is done without holding the lock
+        if entry is not None and entry.is_stale(self.__revalidate_interval):
+            self.invalidate(entry.get_path())
+            entry = None
+
+        with self.__lock:
+            if entry is None:
+                self.__misses += 1
+                return None
+            if key in self.__entries:
+                # Mark it as the most recently used one
+                self.__entries.move_to_end(key)
+            self.__hits += 1
+            return entry
+
+    def put(self, key: Hashable, entry: FileCacheEntry):
+        """
+        Adds a file to the cache, evicting the least recently used ones if there is not enough space.
+        :param key: path of the file (along with the encoding, for compressed variants)
+        :param entry: entry to be cached
+        """
+        if not self.accepts(entry.get_size()):
+            return
+        with self.__lock:
+            self.__remove(key)
+            while self.__size + entry.get_size() > self.__max_size:
+                self.__remove(next(iter(self.__entries)))
+                self.__evictions += 1
+            self.__entries[key] = entry
+            self.__keys.setdefault(entry.get_path(), set()).add(key)
+            self.__size += entry.get_size()
+
+    def invalidate(self, path: Path):
+        """
+        Removes a file from the cache (if present), because it has been modified.
+        :param path: path of the file
+        """
+        with self.__lock:
+            for key in list(self.__keys.get(path, ())):
+                self.__remove(key)
+
+    def invalidate_folder(self, folder: Path):
+        """
+        Removes all the files inside a folder from the cache, because the folder has been replaced.
+        :param folder: path of the folder
+        """
+        with self.__lock:
+            for path in [path for path in self.__keys if folder in path.parents]:
+                for key in list(self.__keys[path]):
+                    self.__remove(key)
+
+    def __remove(self, key: Hashable):
+        # Lock must be held by the caller
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return
+        self.__size -= entry.get_size()
+        keys = self.__keys[entry.get_path()]
+        keys.discard(key)
+        if not keys:
+            del self.__keys[entry.get_path()]
+
+    def get_stats(self) -> Dict[str, int]:
+        """
+        Returns the counters of the cache, so its size can be tuned.
+        :return: dictionary with the number of hits, misses, evictions, entries and used bytes
+        """
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "entries": len(self.__entries),
+                "size": self.__size,
+            }
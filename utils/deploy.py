@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import ctypes
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from pathlib import Path
+from typing import Iterable, Tuple
+
+from http.response import HttpResponseBadRequest, HttpResponseConflict, HttpResponseForbidden, \
+    HttpResponsePayloadTooLarge
+from settings import DEPLOY_MAX_SIZE, UPLOAD_TEMP_PREFIX, UPLOAD_TEMP_SUFFIX
+from utils.vhosts import NEW_FOLDER_MODE, Vhost
+
+try:
+    # Linux is able to exchange two folders at once (glibc 2.28+), otherwise they are renamed one after the other
+    _renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+except (AttributeError, OSError, TypeError):
+    _renameat2 = None
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2
+
+
+class BodyStream(io.RawIOBase):
+    """
+    Read-only file over the chunks of a request body, so it can be read by modules which expect a file (like tarfile)
+    while it is being received.
+    """
+    __chunks = None
+    __pending = None
+
+    def __init__(self, chunks: Iterable[bytes]):
+        super().__init__()
+        self.__chunks = iter(chunks)
+        self.__pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self.__pending:
+            chunk = next(self.__chunks, None)
+            if chunk is None:
+                # End of the body
+                return 0
+            self.__pending = memoryview(chunk)
+        size = min(len(buffer), len(self.__pending))
+        buffer[:size] = self.__pending[:size]
+        self.__pending = self.__pending[size:]
+        return size
+
+
+def create_staging_folder(folder: Path) -> Path:
+    """
+    Creates the hidden folder where a deploy is extracted before replacing the given one (parent folders must exist).
+    :param folder: folder to be replaced
+    :return: path of the new folder, which is in the same parent folder (so it can be renamed into place)
+    """
+    try:
+        staging = Path(tempfile.mkdtemp(prefix=UPLOAD_TEMP_PREFIX, suffix=UPLOAD_TEMP_SUFFIX, dir=folder.parent))
+        # Temporary folders are only accessible by their owner, so keep the permissions of the replaced folder
+        os.chmod(staging, os.stat(folder).st_mode & 0o7777 if folder.is_dir() else NEW_FOLDER_MODE)
+    except PermissionError:
+        raise HttpResponseForbidden()
+    except (FileNotFoundError, NotADirectoryError):
+        # The parent folder has been removed (or replaced by a file) from outside the server
+        raise HttpResponseConflict(content="The parent folder does not exist")
+    return staging
+
+
+def extract_archive(chunks: Iterable[bytes], folder: Path, max_size: int = DEPLOY_MAX_SIZE) -> Tuple[int, int]:
+    """
+    Extracts a tar archive (which may be compressed) into a folder while it is being received. Only files and folders
+    are extracted, and none of them can be outside the folder.
+    :param chunks: contents of the archive
+    :param folder: destination folder
+    :param max_size: maximum size of all the extracted files together
+    :return: number of extracted files and their size
+    """
+    files, size = 0, 0
+    try:
+        with tarfile.open(fileobj=BodyStream(chunks), mode="r|*") as archive:
+            for member in archive:
+                # Absolute paths would be joined as they are, so they are never secure
+                if member.name.startswith("/") or not Vhost.is_secure_path(member.name):
+                    raise HttpResponseBadRequest(content="Path {} is outside of the folder".format(member.name))
+                path = folder.joinpath(Vhost.normalize_path(member.name))
+                if member.isdir():
+                    os.makedirs(path, exist_ok=True)
+                    continue
+                # Links (and devices) could point anywhere
+                if not member.isfile() or path == folder:
+                    raise HttpResponseBadRequest(content="Path {} is not a regular file".format(member.name))
+
+                size += member.size
+                if size > max_size:
+                    raise HttpResponsePayloadTooLarge(content="Extracted files are larger than {} bytes".format(
+                        max_size))
+                os.makedirs(path.parent, exist_ok=True)
+                with archive.extractfile(member) as source, open(path, "wb") as target:
+                    shutil.copyfileobj(source, target)
+                files += 1
+    except tarfile.TarError as e:
+        raise HttpResponseBadRequest(content="Could not extract the archive: {}".format(e))
+    except (FileExistsError, IsADirectoryError, NotADirectoryError):
+        # The same path is both a file and a folder in the archive
+        raise HttpResponseBadRequest(content="The archive contains conflicting paths")
+    return files, size
+
+
+def swap_folders(folder: Path, staging: Path):
+    """
+    Puts the staging folder in place of the given one, at once if the system allows it (otherwise the folder is missing
+    for a moment). Afterwards, the previous folder (if there was one) is in the staging path, and has to be removed.
+    :param folder: folder to be replaced
+    :param staging: folder with the new contents, in the same parent folder
+    """
+    if not folder.exists():
+        os.rename(staging, folder)
+        return
+    if _renameat2 is not None and _renameat2(AT_FDCWD, os.fsencode(staging), AT_FDCWD, os.fsencode(folder),
+                                             RENAME_EXCHANGE) == 0:
+        return
+    previous = staging.with_name(UPLOAD_TEMP_PREFIX + "previous-" + staging.name[len(UPLOAD_TEMP_PREFIX):])
+    os.rename(folder, previous)
+    os.rename(staging, folder)
+    os.rename(previous, staging)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import zlib
+from typing import Iterable, Iterator, List
+
+from http.header import HttpHeader, HEADER_ACCEPT_ENCODING, HEADER_CONTENT_ENCODING, HEADER_ETAG, HEADER_VARY
+from http.request import HttpRequest
+from settings import COMPRESSION_LEVEL
+from utils.mime import COMPRESSIBLE_MIMETYPES
+
+try:
+    # Brotli is optional, so on-the-fly compression falls back to gzip if it is not installed
+    import brotli
+except ImportError:
+    brotli = None
+
+# Window bits of zlib which select the gzip format
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+ENCODING_BROTLI = "br"
+ENCODING_GZIP = "gzip"
+# Supported encodings, in order of preference, with the extension of their precompressed files
+ENCODINGS = {
+    ENCODING_BROTLI: ".br",
+    ENCODING_GZIP: ".gz",
+}
+
+
+def is_compressible(content_type: str) -> bool:
+    """
+    Checks if files of the given type are worth compressing.
+    :param content_type: MIME type of the file
+    :return: True if the type is text based
+    """
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_MIMETYPES
+
+
+def can_compress(encoding: str) -> bool:
+    """
+    Checks if the server is able to compress files on the fly with the given encoding.
+    :param encoding: name of the encoding
+    :return: True if the encoding is available
+    """
+    return encoding == ENCODING_GZIP or (encoding == ENCODING_BROTLI and brotli is not None)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    Compresses the contents of a file with the given encoding.
+    :param data: contents of the file
+    :param encoding: name of the encoding (it must be available)
+    :return: compressed contents
+    """
+    return b"".join(compress_stream((data,), encoding))
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """
+    Compresses the contents of a file chunk after chunk, so it can be sent while it is being compressed. The result
+    is the same as compressing the whole contents at once.
+    :param chunks: contents of the file
+    :param encoding: name of the encoding (it must be available)
+    :return: iterator over the compressed contents
+    """
+    if encoding == ENCODING_BROTLI:
+        compressor = brotli.Compressor(quality=COMPRESSION_LEVEL)
+        process, finish = compressor.process, compressor.finish
+    else:
+        # Use the gzip format (which has a fixed mtime, so the same file is always compressed into the same bytes)
+        compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def negotiate_encodings(request: HttpRequest) -> List[str]:
+    """
+    Parses the Accept-Encoding header of the request.
+    :param request: original request from the client
+    :return: supported encodings accepted by the client, from the most to the least preferred one
+    """
+    if not request.has_header(HEADER_ACCEPT_ENCODING):
+        return []
+
+    weights = {}
+    for coding in request.get_header(HEADER_ACCEPT_ENCODING).value.split(","):
+        name, _, params = coding.partition(";")
+        weight = 1.0
+        param, _, value = params.partition("=")
+        if param.strip().lower() == "q":
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+
+    accepted = []
+    for encoding in ENCODINGS:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > 0:
+            accepted.append((weight, encoding))
+    # Sorting is stable, so the preference of the server breaks the ties
+    return [encoding for _, encoding in sorted(accepted, key=lambda item: -item[0])]
+
+
+def generate_variant_headers(headers: List[HttpHeader], encoding: str,
+                             validators: List[HttpHeader] | None = None) -> List[HttpHeader]:
+    """
+    Given the headers of a file, generates the headers of its compressed variant.
+    :param headers: headers of the file
+    :param encoding: name of the encoding of the variant
+    :param validators: ETag and Last-Modified headers of the variant (if it is a file by itself), otherwise the ETag
+                       of the file is tagged with the encoding
+    :return: list of headers of the variant
+    """
+    replaced = {header.name: header for header in validators or ()}
+    variant = []
+    for header in headers:
+        if header.name in replaced:
+            header = replaced[header.name]
+        elif header.name == HEADER_ETAG:
+            # Each variant needs its own strong ETag
+            header = HttpHeader(HEADER_ETAG, '{}-{}"'.format(header.value[:-1], encoding))
+        variant.append(header)
+    variant.append(HttpHeader(HEADER_CONTENT_ENCODING, encoding))
+    if not any(header.name == HEADER_VARY for header in variant):
+        variant.append(HttpHeader(HEADER_VARY, HEADER_ACCEPT_ENCODING))
+    return variant
@@ -1,18 +1,41 @@
 from __future__ import annotations
 
-import datetime
-import locale
+import os
+from typing import List
 
-from http.enums import HttpVersion, HttpMethod
+from http.date import format_http_date, get_current_http_date, parse_http_date
+from http.enums import HttpMethod, HttpResponseCode, HttpVersion
 from http.header import HttpHeader, HEADER_DATE, HEADER_CONTENT_LENGTH, HEADER_SERVER, HEADER_CONTENT_TYPE, \
-    HEADER_CONTENT_TYPE_TEXT_HTML, HEADER_CONTENT_TYPE_TEXT_PLAIN
+    HEADER_CONTENT_TYPE_TEXT_HTML, HEADER_CONTENT_TYPE_TEXT_PLAIN, HEADER_ETAG, HEADER_LAST_MODIFIED, \
+    HEADER_IF_NONE_MATCH, HEADER_IF_MODIFIED_SINCE, HEADER_TRANSFER_ENCODING, HEADER_TRANSFER_ENCODING_CHUNKED, \
+    HEADER_ACCEPT_RANGES, HEADER_ACCEPT_RANGES_BYTES, HEADER_VARY, HEADER_ACCEPT_ENCODING
 from http.request import HttpRequest
-from http.response import HttpResponse, HttpResponseError
-from settings import HTTP_ENCODING, SERVER_NAME
+from http.response import ChunkedContent, HttpResponseBase, HttpResponseError
+from settings import SERVER_NAME
 from utils.vhosts import Vhost
 
+# Headers shared by many responses, so their lines are encoded only once (they must never be modified)
+SERVER_HEADER = HttpHeader(HEADER_SERVER, SERVER_NAME)
+ACCEPT_RANGES_HEADER = HttpHeader(HEADER_ACCEPT_RANGES, HEADER_ACCEPT_RANGES_BYTES)
+VARY_HEADER = HttpHeader(HEADER_VARY, HEADER_ACCEPT_ENCODING)
+CONTENT_TYPE_HEADERS = {}
+# Date header of the current second
+_date_header = HttpHeader(HEADER_DATE, "")
 
-def generate_error_response_content(request: HttpRequest, response: HttpResponse):
+
+def get_content_type_header(content_type: str) -> HttpHeader:
+    """
+    Returns the Content-Type header of the given type, which is shared by all the responses of that type.
+    :param content_type: MIME type of the content
+    :return: Content-Type header
+    """
+    header = CONTENT_TYPE_HEADERS.get(content_type)
+    if header is None:
+        header = CONTENT_TYPE_HEADERS.setdefault(content_type, HttpHeader(HEADER_CONTENT_TYPE, content_type))
+    return header
+
+
+def generate_error_response_content(request: HttpRequest, response: HttpResponseBase):
     """
     If the specified request method is GET and the response is an error, try to insert the "CODE.html" file
     as response content, if exist. Otherwise, just proceed with the reason.
@@ -30,59 +53,120 @@ def generate_error_response_content(request: HttpRequest, response: HttpResponse
     if response.get_content() is not None:
         return
 
-    # Search for CODE.html file and, if exists and is file, put such contents as response
-    error_file_path = request.get_vhost().get_host_root_path().joinpath(
-        "{}.html".format(str(response.get_status_code().get_code()))
-    )
-    if error_file_path.exists() and error_file_path.is_file():
+    # Search for CODE.html file in the index of the host and, if exists and is file, put such contents as response
+    try:
+        error_file_path = request.get_vhost().resolve("{}.html".format(str(response.get_status_code().get_code())))
         content = Vhost.get_file_contents(error_file_path)
-        content_type_header = HttpHeader(HEADER_CONTENT_TYPE, HEADER_CONTENT_TYPE_TEXT_HTML)
-    else:
+        content_type_header = get_content_type_header(HEADER_CONTENT_TYPE_TEXT_HTML)
+    except HttpResponseError:
         content = response.get_status_code().get_reason()
-        content_type_header = HttpHeader(HEADER_CONTENT_TYPE, HEADER_CONTENT_TYPE_TEXT_PLAIN)
+        content_type_header = get_content_type_header(HEADER_CONTENT_TYPE_TEXT_PLAIN)
 
     # Update the response content and Content-Type header
     response.set_content(content)
     response[HEADER_CONTENT_TYPE] = content_type_header
 
 
-def generate_header_server(response: HttpResponse):
+def generate_validator_headers(stat: os.stat_result) -> List[HttpHeader]:
+    """
+    Given the stat of a file, generates the ETag and Last-Modified headers, which allow clients to check if their
+    copy of the file is still valid.
+    :param stat: stat of the file
+    :return: list with the ETag and Last-Modified headers
+    """
+    # The strong ETag changes whenever the file is replaced (inode), or its size or modification time change
+    etag = '"{:x}-{:x}-{:x}"'.format(stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    return [
+        HttpHeader(HEADER_ETAG, etag),
+        HttpHeader(HEADER_LAST_MODIFIED, format_http_date(stat.st_mtime)),
+    ]
+
+
+def is_not_modified(request: HttpRequest, validators: List[HttpHeader]) -> bool:
+    """
+    Given a request and the validator headers of the requested file, checks if the copy of the client is still
+    valid, so a 304 response can be sent instead of the file.
+    :param request: original request from the client
+    :param validators: ETag and Last-Modified headers of the file
+    :return: True if the file has not been modified
+    """
+    values = {header.name: header.value for header in validators}
+
+    # If-None-Match has precedence over If-Modified-Since
+    if request.has_header(HEADER_IF_NONE_MATCH):
+        if HEADER_ETAG not in values:
+            return False
+        # Weak comparison, so weak tags are considered as well
+        etag = values[HEADER_ETAG]
+        etag = etag[2:] if etag.startswith('W/') else etag
+        for tag in request.get_header(HEADER_IF_NONE_MATCH).value.split(','):
+            tag = tag.strip()
+            if tag == '*' or (tag[2:] if tag.startswith('W/') else tag) == etag:
+                return True
+        return False
+
+    if request.has_header(HEADER_IF_MODIFIED_SINCE) and HEADER_LAST_MODIFIED in values:
+        since = parse_http_date(request.get_header(HEADER_IF_MODIFIED_SINCE).value)
+        modified = parse_http_date(values[HEADER_LAST_MODIFIED])
+        return since is not None and modified is not None and modified <= since
+
+    return False
+
+
+def generate_header_server(response: HttpResponseBase):
     """
     Given a response, appends the Server header.
     :param response: response object where the Server header will be added
     """
-    header = HttpHeader(HEADER_SERVER, SERVER_NAME)
-    response[HEADER_SERVER] = header
+    response[HEADER_SERVER] = SERVER_HEADER
 
 
-def generate_header_date(response: HttpResponse):
+def generate_header_date(response: HttpResponseBase):
     """
     Given a response, appends the Date header.
     :param response: response object where the Date header will be added
     """
-    # https://stackoverflow.com/a/225106
-    locale.setlocale(locale.LC_TIME, 'en_US')
-    header = HttpHeader(name=HEADER_DATE, value=datetime.datetime.utcnow().strftime('%a, %d %b %Y %H:%M:%S GMT'))
+    global _date_header
+    # The date does not depend on the locale, and it is only formatted (and encoded) once per second
+    value = get_current_http_date()
+    header = _date_header
+    if header.value is not value:
+        header = HttpHeader(HEADER_DATE, value)
+        _date_header = header
     response[HEADER_DATE] = header
 
 
-def generate_header_content_length(response: HttpResponse):
+def generate_header_content_length(response: HttpResponseBase):
     """
     Given a response, appends the Content-Length header if needed
     :param response: response where the Content-Length header will be added
     """
-    if response.get_content() is None:
-        # If no content, we ignore this header
+    if response.get_content_length() is None or response.get_status_code() == HttpResponseCode.NOT_MODIFIED:
+        # If the length is not known in advance (or the response never has content), we ignore this header
         return
-    # Otherwise, get the size of the contents and append it as header
-    v = response.get_content()
-    if isinstance(response.get_content(), str):
-        v = response.get_content().encode(HTTP_ENCODING)
-    header = HttpHeader(name=HEADER_CONTENT_LENGTH, value=str(len(v)))
+    # Otherwise, get the size of the contents (or of the file and parts to be sent) and append it as header, also if
+    # there is no content, so the client knows where the response ends without waiting for the connection to close
+    header = HttpHeader(name=HEADER_CONTENT_LENGTH, value=str(response.get_content_length()))
     response[HEADER_CONTENT_LENGTH] = header
 
 
-def generate_auto_headers(request: HttpRequest, response: HttpResponse):
+def generate_header_transfer_encoding(request: HttpRequest, response: HttpResponseBase):
+    """
+    Given a response whose content length is not known in advance, appends the Transfer-Encoding header if the
+    client supports it.
+    :param request: original request from the client
+    :param response: response where the Transfer-Encoding header will be added
+    """
+    content = response.get_content()
+    if not isinstance(content, ChunkedContent):
+        return
+    # HTTP/1.0 clients do not know about chunks, so the content ends when the connection is closed
+    content.set_framed(request.get_http_version() != HttpVersion.HTTP_10)
+    if content.is_framed():
+        response[HEADER_TRANSFER_ENCODING] = HttpHeader(HEADER_TRANSFER_ENCODING, HEADER_TRANSFER_ENCODING_CHUNKED)
+
+
+def generate_auto_headers(request: HttpRequest, response: HttpResponseBase):
     """
     Given a request and a response, add to the response object the "automatic" headers.
     :param request: original request from the client
@@ -91,36 +175,42 @@ def generate_auto_headers(request: HttpRequest, response: HttpResponse):
     # Server header is used in all methods
     generate_header_server(response)
     if request.get_method() == HttpMethod.GET:
-        # We need Date, Content-Length and Content-Type
+        # We need Date, Content-Length (or Transfer-Encoding) and Content-Type
         generate_header_date(response)
         generate_header_content_length(response)
+        generate_header_transfer_encoding(request, response)
         # Content-Type is generated at server.py
     elif request.get_method() == HttpMethod.PUT:
-        # We need Content-Location
+        # We need Content-Location and Content-Length
         # Content-Location is generated at server.py
-        pass
+        generate_header_content_length(response)
     elif request.get_method() == HttpMethod.DELETE:
-        # We need Date
+        # We need Date and Content-Length
         generate_header_date(response)
-    elif request.get_method() == HttpMethod.NTW22INFO:
+        generate_header_content_length(response)
+    elif request.get_method() in (HttpMethod.NTW22INFO, HttpMethod.NTW22DEPLOY):
         # We need Date, Content-Length and Content-Type
         generate_header_date(response)
         generate_header_content_length(response)
         # Content-Type is generated at server.py
 
 
-def generate_output(request: HttpRequest | None, response: HttpResponse) -> bytes:
+def generate_output(request: HttpRequest | None, response: HttpResponseBase) -> List[bytes]:
     """
-    Given a request object and a response, generates the corresponding HTTP responding as a string.
+    Given a request object and a response, generates the corresponding HTTP response as a list of buffers, which
+    are written to the socket at once (without joining them). If the content of the response is a file, it is not
+    included (it has to be sent afterwards).
     :param request: original request from the client
     :param response: prepared response from the server
-    :return: valid HTTP response string
+    :return: buffers of the valid HTTP response
     """
     if request:
         # Check if the specified response is an error and, if is, try to inject the output
         generate_error_response_content(request, response)
         # If we receive a valid request, then try to generate the needed headers automatically
         generate_auto_headers(request, response)
-    # Generate the response-line and append the response serialization (headers and body) afterwards
-    return "{} {}\r\n".format(HttpVersion.HTTP_10 if not request else request.get_http_version(),
-                              response.get_status_code()).encode(HTTP_ENCODING) + bytes(response)
+    # The response-line (already encoded) is followed by the response serialization (headers and body)
+    version = HttpVersion.HTTP_10 if not request else request.get_http_version()
+    buffers = [response.get_status_code().get_status_line(version)]
+    buffers += response.get_buffers()
+    return buffers
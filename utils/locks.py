@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import os
+import posixpath
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Worker processes (the only ones which need to share the locks) are not supported in this platform either
+    fcntl = None
+
+
+class SharedLock:
+    """
+    Lock which can be held by several readers at once, or by a single writer. Writers waiting for the lock go before
+    new readers, so they are never starved.
+    """
+    __condition = None
+    __readers = 0
+    __writer = False
+    __writers_waiting = 0
+
+    def __init__(self):
+        self.__condition = threading.Condition(threading.Lock())
+        self.__readers = 0
+        self.__writer = False
+        self.__writers_waiting = 0
+
+    def __can_acquire(self, exclusive: bool) -> bool:
+        # Lock of the condition must be held by the caller
+        if exclusive:
+            return not self.__writer and self.__readers == 0
+        return not self.__writer and self.__writers_waiting == 0
+
+    def acquire(self, exclusive: bool, blocking: bool = True) -> bool:
+        """
+        Acquires the lock.
+        :param exclusive: True to acquire it as a writer, False to share it with other readers
+        :param blocking: False to give up right away if it is not available
+        :return: True if the lock has been acquired
+        """
+        with self.__condition:
+            if not self.__can_acquire(exclusive):
+                if not blocking:
+                    return False
+                if exclusive:
+                    self.__writers_waiting += 1
+                try:
+                    self.__condition.wait_for(lambda: self.__can_acquire(exclusive))
+                finally:
+                    if exclusive:
+                        self.__writers_waiting -= 1
+            if exclusive:
+                self.__writer = True
+            else:
+                self.__readers += 1
+            return True
+
+    def release(self, exclusive: bool):
+        """
+        Releases the lock.
+        :param exclusive: whether it was acquired as a writer
+        """
+        with self.__condition:
+            if exclusive:
+                self.__writer = False
+            else:
+                self.__readers -= 1
+            self.__condition.notify_all()
+
+
+class PathLockTable:
+    """
+    Locks of the files and folders of the virtual hosts, so requests modifying the same paths do not race. Paths are
+    spread over a fixed number of stripes (each one a shared lock), so requests for unrelated paths almost never wait
+    for each other, and the table never grows. Holding a path also holds its parent folders: shared, so they are not
+    removed meanwhile, or exclusive, to remove them (but the root of the host, which is never removed, so holding it
+    exclusively, as its path is empty, waits for every other request modifying the host).
+    In pre-fork mode, the workers modify the same files, so each stripe is also locked (with flock) through a file of
+    a folder shared by all of them. Workers are forked from the same process, so they spread the paths alike.
+    """
+    __stripes = None
+    # Folder of the files of the stripes shared with other processes (None if the locks are only used by this one)
+    __folder = None
+    # Counters of the acquisitions and of the time spent waiting for them
+    __stats_lock = None
+    __acquisitions = 0
+    __waits = 0
+    __wait_time = 0.0
+    __max_wait_time = 0.0
+
+    def __init__(self, stripes: int, folder: str | None = None):
+        """
+        :param stripes: number of stripes
+        :param folder: existing folder where the files of the stripes are created, in order to share the locks with
+                       other processes (None to use them only in this one)
+        """
+        if folder is not None and fcntl is None:
+            raise OSError("Locks shared by several processes are not supported in this platform")
+        self.__stripes = [SharedLock() for _ in range(stripes)]
+        self.__folder = folder
+        self.__stats_lock = threading.Lock()
+        self.__acquisitions = 0
+        self.__waits = 0
+        self.__wait_time = 0.0
+        self.__max_wait_time = 0.0
+
+    def __get_stripes(self, hostname: str, path: str, parents_exclusive: bool) -> List[Tuple[int, bool]]:
+        # Returns the stripes of the path and its parent folders, in order, along with whether each one has to be
+        # acquired as a writer
+        stripes = {hash((hostname, path)) % len(self.__stripes): True}
+        folder = path
+        while folder != "":
+            folder = posixpath.dirname(folder)
+            stripe = hash((hostname, folder)) % len(self.__stripes)
+            # Different paths may share a stripe, and then the most restrictive mode is needed
+            stripes[stripe] = stripes.get(stripe, False) or (parents_exclusive and folder != "")
+        # Always acquiring the stripes in the same order means no request can wait for another that waits for it
+        return sorted(stripes.items())
+
+    @contextmanager
+    def hold(self, hostname: str, path: str, parents_exclusive: bool = False) -> Iterator[None]:
+        """
+        Holds a path (exclusively) and its parent folders.
+        :param hostname: hostname of the virtual host
+        :param path: normalized path, relative to the root of the host
+        :param parents_exclusive: True to hold the parent folders exclusively too (in order to remove them),
+                                  otherwise they are shared with the other requests in them
+        """
+        acquired = []
+        files = []
+        waited = 0.0
+        try:
+            for stripe, exclusive in self.__get_stripes(hostname, path, parents_exclusive):
+                lock = self.__stripes[stripe]
+                if not lock.acquire(exclusive, blocking=False):
+                    start = time.monotonic()
+                    lock.acquire(exclusive)
+                    waited += time.monotonic() - start
+                acquired.append((lock, exclusive))
+                if self.__folder is not None:
+                    # Each file is opened for every acquisition, so its flock is shared (or not) as the lock itself
+                    fd = os.open(os.path.join(self.__folder, str(stripe)), os.O_RDWR | os.O_CREAT, 0o600)
+                    files.append(fd)
+                    operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+                    try:
+                        fcntl.flock(fd, operation | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        start = time.monotonic()
+                        fcntl.flock(fd, operation)
+                        waited += time.monotonic() - start
+            self.__count(waited)
+            yield
+        finally:
+            # Closing the files releases their flocks
+            for fd in reversed(files):
+                os.close(fd)
+            for lock, exclusive in reversed(acquired):
+                lock.release(exclusive)
+
+    def __count(self, waited: float):
+        with self.__stats_lock:
+            self.__acquisitions += 1
+            if waited > 0:
+                self.__waits += 1
+                self.__wait_time += waited
+                self.__max_wait_time = max(self.__max_wait_time, waited)
+
+    def get_stats(self) -> Dict[str, int | float]:
+        """
+        Returns the counters of the locks, so contention can be noticed.
+        :return: dictionary with the number of acquisitions, the ones which had to wait, and the total and maximum
+                 time (in milliseconds) spent waiting
+        """
+        with self.__stats_lock:
+            return {
+                "acquisitions": self.__acquisitions,
+                "waits": self.__waits,
+                "wait_ms": round(self.__wait_time * 1e3, 3),
+                "max_wait_ms": round(self.__max_wait_time * 1e3, 3),
+            }
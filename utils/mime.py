@@ -2,3 +2,18 @@ CUSTOM_MIMETYPES = {
     "woff": "font/woff",
     "woff2": "font/woff2",
 }
+
+# Types worth compressing (besides every text/* type), as the rest are usually compressed already
+COMPRESSIBLE_MIMETYPES = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xhtml+xml",
+    "application/xml",
+    "font/otf",
+    "font/ttf",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+}
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import re
+import secrets
+from typing import List, Tuple
+
+from http.date import parse_http_date
+from http.enums import HttpResponseCode
+from http.header import HttpHeader, HEADER_RANGE, HEADER_IF_RANGE, HEADER_ETAG, HEADER_LAST_MODIFIED, \
+    HEADER_CONTENT_TYPE, HEADER_CONTENT_RANGE, HEADER_CONTENT_TYPE_MULTIPART_BYTERANGES
+from http.request import HttpRequest
+from http.response import FileContent, HttpResponse, HttpResponseRangeNotSatisfiable
+from settings import HEADER_ENCODING, MAX_RANGES
+
+RANGE_UNIT = "bytes"
+# First and last byte of a range (either of them may be missing, but not both)
+RANGE_SPEC = re.compile(r"([0-9]*)-([0-9]*)")
+
+
+def parse_range(value: str, size: int) -> List[Tuple[int, int]] | None:
+    """
+    Parses the value of a Range header for a file of the given size. Overlapping and adjacent ranges are merged, so
+    no byte is sent twice.
+    :param value: value of the Range header (e.g. "bytes=0-499,-500")
+    :param size: size of the requested file
+    :return: sorted list of satisfiable ranges, as (first byte, last byte) tuples (empty if none is satisfiable), or
+             None if the header is not valid and has to be ignored
+    """
+    unit, _, specs = value.partition("=")
+    if unit.strip().lower() != RANGE_UNIT:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        match = RANGE_SPEC.fullmatch(spec.strip())
+        if match is None or not (match.group(1) or match.group(2)):
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range (the last bytes of the file, so none of an empty file)
+            if int(last) > 0 and size > 0:
+                ranges.append((max(0, size - int(last)), size - 1))
+            continue
+        if last and int(last) < int(first):
+            # The last byte cannot be before the first one
+            return None
+        if int(first) < size:
+            ranges.append((int(first), min(int(last), size - 1) if last else size - 1))
+
+    # Merge the ranges, so a few overlapping ones cannot make the response huge
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def is_range_fresh(request: HttpRequest, validators: List[HttpHeader]) -> bool:
+    """
+    Checks the If-Range header of the request, which asks for the ranges only if the file has not changed.
+    :param request: original request from the client
+    :param validators: ETag and Last-Modified headers of the file
+    :return: True if the ranges can be sent, False if the whole file has to be sent instead
+    """
+    if not request.has_header(HEADER_IF_RANGE):
+        return True
+    values = {header.name: header.value for header in validators}
+    condition = request.get_header(HEADER_IF_RANGE).value.strip()
+
+    if condition.startswith('"') or condition.startswith('W/'):
+        # Strong comparison, so weak tags never match
+        return not condition.startswith('W/') and values.get(HEADER_ETAG) == condition
+
+    # Otherwise it is a date, which has to match exactly
+    if HEADER_LAST_MODIFIED not in values:
+        return False
+    since = parse_http_date(condition)
+    return since is not None and since == parse_http_date(values[HEADER_LAST_MODIFIED])
+
+
+def generate_range_response(request: HttpRequest, content: bytes | FileContent,
+                            headers: List[HttpHeader]) -> HttpResponse:
+    """
+    Given a GET request and the file to be sent, generates a 206 response with only the requested ranges of the
+    file if the request has a valid Range header, or a 200 response with the whole file otherwise.
+    :param request: original request from the client
+    :param content: contents of the file (or the opened file)
+    :param headers: headers of the file (Content-Type and validators)
+    :return: response with the headers of the file
+    """
+    ranges = None
+    if request.has_header(HEADER_RANGE) and is_range_fresh(request, headers):
+        ranges = parse_range(request.get_header(HEADER_RANGE).value, len(content))
+    if ranges is not None and len(ranges) > MAX_RANGES:
+        # Too many ranges are more expensive than sending the whole file
+        ranges = None
+
+    if ranges is None:
+        response = HttpResponse(content=content)
+        for header in headers:
+            response.add_header(header.name, header)
+        return response
+
+    if not ranges:
+        # None of the ranges is inside the file
+        if isinstance(content, FileContent):
+            content.close()
+        error = HttpResponseRangeNotSatisfiable()
+        error.add_header(HEADER_CONTENT_RANGE, HttpHeader(HEADER_CONTENT_RANGE, "{} */{}".format(
+            RANGE_UNIT, len(content))))
+        raise error
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        response = HttpResponse(status=HttpResponseCode.PARTIAL_CONTENT, content=slice_content(content, first, last))
+        for header in headers:
+            response.add_header(header.name, header)
+        response.add_header(HEADER_CONTENT_RANGE, HttpHeader(HEADER_CONTENT_RANGE, "{} {}-{}/{}".format(
+            RANGE_UNIT, first, last, len(content))))
+        return response
+
+    # Several ranges are sent as a multipart body, where each part has its own headers
+    boundary = secrets.token_hex(16)
+    content_type = next((header for header in headers if header.name == HEADER_CONTENT_TYPE), None)
+    parts = []
+    for first, last in ranges:
+        part_head = "{}--{}\r\n".format("\r\n" if parts else "", boundary)
+        if content_type is not None:
+            part_head += "{}: {}\r\n".format(HEADER_CONTENT_TYPE, content_type.value)
+        part_head += "{}: {} {}-{}/{}\r\n\r\n".format(HEADER_CONTENT_RANGE, RANGE_UNIT, first, last, len(content))
+        parts.append(part_head.encode(HEADER_ENCODING))
+        parts.append(slice_content(content, first, last))
+    parts.append("\r\n--{}--\r\n".format(boundary).encode(HEADER_ENCODING))
+
+    response = HttpResponse(status=HttpResponseCode.PARTIAL_CONTENT, content=parts)
+    for header in headers:
+        response.add_header(header.name, header)
+    # The Content-Type of the file is replaced by the one of the multipart body
+    response.add_header(HEADER_CONTENT_TYPE, HttpHeader(HEADER_CONTENT_TYPE, "{}; boundary={}".format(
+        HEADER_CONTENT_TYPE_MULTIPART_BYTERANGES, boundary)))
+    return response
+
+
+def slice_content(content: bytes | FileContent, first: int, last: int) -> bytes | FileContent:
+    """
+    Takes a range of the contents of a file, without copying it.
+    :param content: contents of the file (or the opened file)
+    :param first: first byte of the range
+    :param last: last byte of the range (included)
+    :return: view of the contents, or span of the opened file
+    """
+    if isinstance(content, FileContent):
+        return content.get_range(first, last - first + 1)
+    return memoryview(content)[first:last + 1]
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from settings import VHOSTS_FILE, DURABILITIES, DEFAULT_DURABILITY
+from utils.vhosts import Vhost
+
+# Prefix of the hostnames that match any subdomain (*.example.ch matches www.example.ch, but not example.ch)
+WILDCARD_PREFIX = "*."
+# Key of the trie nodes where the host of a wildcard is kept (it can never be a label)
+WILDCARD_KEY = None
+
+
+class VhostRegistry(Mapping):
+    """
+    Virtual hosts of the server, by the hostname they were defined with. Exact hostnames are found with a single
+    lookup, and wildcard ones are kept in a trie of their labels in reverse order (ch -> example), so finding the most
+    specific wildcard for a hostname only takes as many steps as labels it has, no matter how many hosts there are.
+    """
+    __hosts = None
+    # Hosts with an exact hostname, and trie of the wildcard ones
+    __exact = None
+    __wildcards = None
+
+    def __init__(self, hosts: Iterable[Vhost] = ()):
+        self.__hosts = {}
+        self.__exact = {}
+        self.__wildcards = {}
+        for vhost in hosts:
+            hostname = vhost.get_hostname()
+            self.__hosts[hostname] = vhost
+            if not hostname.startswith(WILDCARD_PREFIX):
+                self.__exact[hostname] = vhost
+                continue
+            node = self.__wildcards
+            for label in reversed(hostname[len(WILDCARD_PREFIX):].split(".")):
+                node = node.setdefault(label, {})
+            node[WILDCARD_KEY] = vhost
+
+    @staticmethod
+    def parse_file(file: str = VHOSTS_FILE, current: VhostRegistry | None = None) -> VhostRegistry:
+        """
+        Parses the virtual hosts file. Hosts are not checked in the filesystem until they are used, so loading
+        thousands of them is as fast as reading the file.
+        :param file: path of the file, from the root of the server
+        :param current: hosts being served, which are kept (along with their resolution index) if their line has not
+                        changed
+        :return: hosts of the file
+        """
+        current = current or {}
+        hosts = {}
+        # Open the file from the root of the server
+        with open(Path().parent.joinpath(file).absolute(), 'r') as f:
+            for line in f:
+                # Start parsing the virtual host line and, if any error appears, discard the line
+                line = line.strip()
+                if line == "":
+                    continue
+                # Line should have 4 items, and optionally the durability of the uploads
+                splitted = [e.strip() for e in line.split(",")]
+                if len(splitted) == 4:
+                    splitted.append(DEFAULT_DURABILITY)
+                if len(splitted) != 5:
+                    continue
+                # If any element is empty (or the durability is unknown), discard
+                hostname, index, name, email, durability = splitted
+                if hostname == "" or index == "" or name == "" or email == "" or durability not in DURABILITIES:
+                    continue
+                hostname = hostname.lower()
+                # A wildcard can only be the whole first label, and it has to be followed by a domain
+                domain = hostname[len(WILDCARD_PREFIX):] if hostname.startswith(WILDCARD_PREFIX) else hostname
+                if "*" in domain or "" in domain.split("."):
+                    continue
+
+                # Create the Vhost, unless it is already being served as it is
+                vhost = current.get(hostname)
+                if vhost is None or not vhost.is_defined_as(index, name, email, durability):
+                    vhost = Vhost(hostname, index, name, email, durability)
+                # The last definition of a hostname is the one that counts (but it keeps the position of the first
+                # one, which matters to find the default host)
+                hosts[hostname] = vhost
+        return VhostRegistry(hosts.values())
+
+    def find(self, hostname: str) -> Vhost | None:
+        """
+        Gets the host which serves the given hostname: the one with the same hostname or, if there is none, the one
+        with the most specific wildcard matching it.
+        :param hostname: hostname of the request (without the port)
+        :return: host, or None if no host matches
+        """
+        hostname = hostname.lower()
+        vhost = self.__exact.get(hostname)
+        if vhost is not None or not self.__wildcards:
+            return vhost
+        labels = hostname.split(".")
+        if "" in labels:
+            # Malformed hostnames never match a wildcard
+            return None
+        node = self.__wildcards
+        # A wildcard needs at least one more label, so the first one is never looked up in the trie
+        for position in range(len(labels) - 1, 0, -1):
+            node = node.get(labels[position])
+            if node is None:
+                break
+            vhost = node.get(WILDCARD_KEY, vhost)
+        return vhost
+
+    def get_default(self) -> Vhost | None:
+        """
+        Gets the host of the requests without Host header (HTTP/1.0), which is the first available one with an exact
+        hostname.
+        :return: host, or None if no host is available
+        """
+        return next((vhost for vhost in self.__exact.values() if vhost.is_available()), None)
+
+    def __getitem__(self, hostname: str) -> Vhost:
+        return self.__hosts[hostname]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__hosts)
+
+    def __len__(self) -> int:
+        return len(self.__hosts)
+
+    def __repr__(self) -> str:
+        return "VhostRegistry({})".format(", ".join(self.__hosts))
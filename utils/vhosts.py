@@ -1,12 +1,44 @@
 from __future__ import annotations
 
+import os
+import posixpath
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterable, Tuple
 
-from settings import VHOSTS_FILE
+from settings import VHOST_RECHECK_INTERVAL, DEFAULT_DURABILITY, DURABILITY_NONE, DURABILITY_FOLDER, \
+    UPLOAD_TEMP_PREFIX, UPLOAD_TEMP_SUFFIX, INDEX_MTIME_MARGIN
 
 
-from http.response import HttpResponseNotFound, HttpResponseForbidden
+from http.response import HttpResponseNotFound, HttpResponseForbidden, HttpResponseMethodNotAllowed, \
+    HttpResponseConflict, FileContent
+
+# Permissions of the new files and folders, as if they were created with open and mkdir (the umask can only be read by
+# replacing it, so it is done once, before any thread is started)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+NEW_FILE_MODE = 0o666 & ~_UMASK
+NEW_FOLDER_MODE = 0o777 & ~_UMASK
+
+
+def is_upload_temp_name(name: str) -> bool:
+    """
+    Checks if a file or folder is a temporary one of an upload (or a deploy), which is never served.
+    :param name: name of the file or folder
+    :return: True if it is temporary
+    """
+    return name.startswith(UPLOAD_TEMP_PREFIX) and name.endswith(UPLOAD_TEMP_SUFFIX)
+
+
+def is_upload_temp_path(path: str) -> bool:
+    """
+    Checks if a request path is (or is inside) a temporary file or folder of an upload (or a deploy).
+    :param path: request path
+    :return: True if any of its parts is temporary
+    """
+    return any(is_upload_temp_name(name) for name in path.split("/"))
 
 
 class Vhost:
@@ -14,47 +46,45 @@ class Vhost:
     __index = None
     __name = None
     __email = None
+    # Durability of the uploaded files (one of DURABILITIES)
+    __durability = None
+    # Root folder of the host (it is only generated when needed, as it is slow to generate for thousands of hosts)
+    __root = None
+    # Whether the root folder and the index file exist (None until the host is used for the first time), and last time
+    # (monotonic) they were checked
+    __available = None
+    __checked_at = None
+    # Resolution index: maps each (normalized) request path to the file to be served, or to None if it is a folder
+    # that cannot be served (it is built when the host is used for the first time)
+    __paths = None
+    __paths_lock = None
+    # Builds of the index walk the files without holding the lock of the index, so they are serialized by their own
+    # lock, and the changes made meanwhile are kept to be applied to the new index
+    __build_lock = None
+    __changes = None
+    # Modification time of each folder walked by the last build (None if it was too recent to be trusted)
+    __folder_mtimes = None
 
-    def __init__(self, hostname: str, index: str, name: str, email: str):
+    def __init__(self, hostname: str, index: str, name: str, email: str, durability: str = DEFAULT_DURABILITY):
         self.__hostname = hostname
         self.__index = index
         self.__name = name
         self.__email = email
+        self.__durability = durability
+        self.__paths_lock = threading.Lock()
+        self.__build_lock = threading.Lock()
 
-    @staticmethod
-    def parse_file(file: str = VHOSTS_FILE) -> Dict[str, Vhost]:
-        out = {}
-        # Get the root of the server
-        root_server = Path().parent
-        # Open the file from the root of the server
-        with open(root_server.joinpath(file).absolute(), 'r') as f:
-            for line in f.readlines():
-                # Start parsing the virtual host line and, if any error appears, discard the line
-                line = line.strip()
-                if line == "":
-                    continue
-                # Line should have 4 items
-                splitted = [e.strip() for e in line.split(",")]
-                if len(splitted) != 4:
-                    continue
-                # If any element is empty, discard
-                hostname, index, name, email = splitted
-                if hostname == "" or index == "" or name == "" or email == "":
-                    continue
-                hostname = hostname.lower()
-
-                # Check if the specified path for the host exists
-                root_host = root_server.joinpath(hostname)
-                if not root_host.exists() or root_host.is_file():
-                    continue
-                # Check if the root file exists
-                root_file = root_host.joinpath(index)
-                if not root_file.exists() or not root_file.is_file():
-                    continue
-                # Create the Vhost and add it
-                vhost = Vhost(hostname, index, name, email)
-                out[hostname] = vhost
-        return out
+    def is_defined_as(self, index: str, name: str, email: str, durability: str = DEFAULT_DURABILITY) -> bool:
+        """
+        Checks if the host has the given settings.
+        :param index: index file
+        :param name: name of the administrator
+        :param email: email of the administrator
+        :param durability: durability of the uploaded files
+        :return: True if all of them are the same
+        """
+        return self.__index == index and self.__name == name and self.__email == email and \
+            self.__durability == durability
 
     def get_hostname(self) -> str:
         return self.__hostname
@@ -68,8 +98,213 @@ class Vhost:
     def get_server_admin_email(self) -> str:
         return self.__email
 
+    def get_durability(self) -> str:
+        return self.__durability
+
     def get_host_root_path(self) -> Path:
-        return Path().parent.joinpath(self.__hostname).absolute()
+        if self.__root is None:
+            self.__root = Path().parent.joinpath(self.__hostname).absolute()
+        return self.__root
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        """
+        Normalizes a request path (without the starting /), so all the paths pointing to the same file are equal.
+        :param path: request path
+        :return: normalized path, which is empty for the root of the host
+        """
+        path = posixpath.normpath(path)
+        return "" if path == "." else path
+
+    def is_available(self) -> bool:
+        """
+        Checks if the root folder and the index file of the host exist. They are only checked the first time the host
+        is used (and, if they did not exist, again once in a while), so hosts are not validated when they are loaded.
+        :return: True if the host can be served
+        """
+        if self.__available:
+            return True
+        now = time.monotonic()
+        if self.__available is None or now - self.__checked_at >= VHOST_RECHECK_INTERVAL:
+            root = self.get_host_root_path()
+            self.__available = root.is_dir() and root.joinpath(self.__index).is_file()
+            self.__checked_at = now
+        return self.__available
+
+    def is_indexed(self) -> bool:
+        """
+        Checks if the resolution index has been built (i.e. the host has already been used).
+        :return: True if the index exists
+        """
+        return self.__paths is not None
+
+    def __walk(self) -> Tuple[Dict[str, Path | None], Dict[str, int | None]]:
+        # Walks the files of the host to generate its resolution index, along with the modification time of each folder
+        # (taken before listing it, so any later change is noticed)
+        paths = {}
+        mtimes = {}
+        # Folders modified right before the walk may change again within the same timestamp
+        recent = time.time_ns() - int(INDEX_MTIME_MARGIN * 1e9)
+        folders = [("", self.get_host_root_path())]
+        while folders:
+            key, folder = folders.pop()
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+                with os.scandir(folder) as entries:
+                    entries = list(entries)
+            except OSError:
+                # As os.walk, folders which cannot be listed are skipped
+                continue
+            mtimes[str(folder)] = mtime if mtime < recent else None
+            for entry in entries:
+                # Uploads and deploys still being written are not served
+                if is_upload_temp_name(entry.name):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    paths[posixpath.join(key, entry.name)] = folder.joinpath(entry.name)
+                elif not entry.is_symlink():
+                    folders.append((posixpath.join(key, entry.name), folder.joinpath(entry.name)))
+            # Requesting a folder means requesting its index file (and a folder as index cannot be served)
+            index = posixpath.join(key, self.__index)
+            if index in paths:
+                paths[key] = paths[index]
+            elif any(entry.name == self.__index for entry in entries):
+                paths[key] = None
+        return paths, mtimes
+
+    def build_index(self):
+        """
+        Walks the files of the host and (re)builds the resolution index, replacing the previous one at once. The index
+        is still used (and updated) during the walk, and the changes made meanwhile are applied to the new one.
+        """
+        with self.__build_lock:
+            self.__build()
+
+    def __build(self):
+        # Builds the resolution index (the build lock must be held by the caller)
+        with self.__paths_lock:
+            self.__changes = []
+        paths = None
+        try:
+            paths, mtimes = self.__walk()
+        finally:
+            with self.__paths_lock:
+                changes = self.__changes
+                self.__changes = None
+                if paths is not None:
+                    for key, file_path in changes:
+                        self.__apply_change(paths, key, file_path)
+                    self.__paths = paths
+        self.__folder_mtimes = mtimes
+
+    def refresh_index(self):
+        """
+        Rebuilds the resolution index if any folder of the host has been modified since it was built (files created,
+        deleted or renamed from outside the server), which is checked without listing the folders.
+        """
+        mtimes = self.__folder_mtimes
+        if mtimes is not None and not Vhost.__are_folders_modified(mtimes):
+            return
+        self.build_index()
+
+    @staticmethod
+    def __are_folders_modified(mtimes: Dict[str, int | None]) -> bool:
+        # Checks if any of the walked folders has changed (or may have, if its time was not trusted)
+        for folder, mtime in mtimes.items():
+            try:
+                if mtime is None or os.stat(folder).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def __get_paths(self) -> Dict[str, Path | None]:
+        # Returns the resolution index, building it if the host has not been used yet
+        paths = self.__paths
+        if paths is None:
+            with self.__build_lock:
+                if self.__paths is None:
+                    self.__build()
+            paths = self.__paths
+        return paths
+
+    def resolve(self, path: str) -> Path:
+        """
+        Given a request path, gets the file to be served. The filesystem is only accessed if the path is not in the
+        resolution index.
+        :param path: request path (without the starting /)
+        :return: path of the file
+        """
+        key = Vhost.normalize_path(path)
+        file_path = self.__get_paths().get(key, False)
+        if file_path is False:
+            # The file may have been created since the index was built (by another worker, or from outside the server)
+            file_path = self.__find_file(key)
+        if file_path is None:
+            # And if it is a folder, then 405
+            raise HttpResponseMethodNotAllowed()
+        return file_path
+
+    def __find_file(self, key: str) -> Path | None:
+        """
+        Looks for a path which is not in the resolution index in the filesystem, and adds it to the index if found.
+        :param key: normalized request path
+        :return: path of the file, or None if it is a folder whose index is a folder
+        """
+        if is_upload_temp_path(key):
+            # Uploads and deploys still being written are not served
+            raise HttpResponseNotFound()
+        file_path = self.get_host_root_path().joinpath(key)
+        if file_path.is_dir():
+            # Requesting a folder means requesting its index file
+            key = posixpath.join(key, self.__index)
+            file_path = file_path.joinpath(self.__index)
+            if file_path.is_dir():
+                return None
+        if not file_path.is_file():
+            # If file does not exist, then 404
+            raise HttpResponseNotFound()
+        self.index_file_added(key)
+        return file_path
+
+    def __apply_change(self, paths: Dict[str, Path | None], key: str, file_path: Path | None):
+        # Adds a file to the given index (or removes it, if it has no path), along with the folder it is the index of
+        if file_path is None:
+            paths.pop(key, None)
+            if posixpath.basename(key) == self.__index:
+                paths.pop(posixpath.dirname(key), None)
+            return
+        paths[key] = file_path
+        if posixpath.basename(key) == self.__index:
+            paths[posixpath.dirname(key)] = file_path
+
+    def __index_change(self, key: str, file_path: Path | None):
+        # Updates the resolution index after creating or deleting a file, and keeps the change if the index is being
+        # built (if there is no index at all, the file will be found when it is built)
+        with self.__paths_lock:
+            if self.__changes is not None:
+                self.__changes.append((key, file_path))
+            if self.__paths is not None:
+                self.__apply_change(self.__paths, key, file_path)
+
+    def index_file_added(self, path: str):
+        """
+        Updates the resolution index after creating a file.
+        :param path: request path of the file (without the starting /)
+        """
+        key = Vhost.normalize_path(path)
+        self.__index_change(key, self.get_host_root_path().joinpath(key))
+
+    def index_file_removed(self, path: str):
+        """
+        Updates the resolution index after deleting a file.
+        :param path: request path of the file (without the starting /)
+        """
+        self.__index_change(Vhost.normalize_path(path), None)
 
     @staticmethod
     def is_secure_path(path: str) -> bool:
@@ -120,16 +355,20 @@ class Vhost:
             raise HttpResponseForbidden()
 
     @staticmethod
-    def put_file_contents(path: Path, content: bytes):
+    def open_file(path: Path) -> FileContent:
         """
-        Put the specified content into a file (parent folders must exist)
-        :param path: file to be written
-        :param content: data to write
+        Opens the file so its contents can be sent without loading them into memory.
+        :param path: file to open
+        :return: file content, which has to be closed once sent
         """
         try:
-            with open(path, "wb") as f:
-                f.write(content)
+            # Open in binary mode
+            return FileContent(open(path, mode='rb'))
+        except FileNotFoundError:
+            # If file does not exist (should never reach here), then 404
+            raise HttpResponseNotFound()
         except PermissionError:
+            # If no permission to open the file, then 403
             raise HttpResponseForbidden()
 
     @staticmethod
@@ -159,3 +398,89 @@ class Vhost:
                 break
             except OSError:
                 break
+
+
+class FileUpload:
+    """
+    Upload of a file: its contents are written to a hidden temporary file in the same folder, which then replaces the
+    file at once. As long as the upload exists, its folder is not empty, so it is not removed by a DELETE.
+    """
+    __path = None
+    __durability = None
+    __temp_path = None
+    __file = None
+
+    def __init__(self, path: Path, durability: str = DEFAULT_DURABILITY):
+        """
+        Creates the temporary file (parent folders must exist).
+        :param path: file to be written
+        :param durability: whether the file (and its folder) are synced to the disk when replaced
+        """
+        try:
+            fd, self.__temp_path = tempfile.mkstemp(prefix=UPLOAD_TEMP_PREFIX, suffix=UPLOAD_TEMP_SUFFIX,
+                                                    dir=path.parent)
+        except PermissionError:
+            raise HttpResponseForbidden()
+        except (FileNotFoundError, NotADirectoryError):
+            # The folder has been removed (or replaced) from outside the server
+            raise HttpResponseConflict(content="The folder of the file does not exist")
+        self.__file = open(fd, "wb")
+        self.__path = path
+        self.__durability = durability
+
+    def write(self, content: bytes | Iterable[bytes]):
+        """
+        Writes the contents of the file.
+        :param content: data to write, either at once or as chunks (so it can be streamed)
+        """
+        if isinstance(content, bytes):
+            content = [content]
+        for chunk in content:
+            self.__file.write(chunk)
+
+    def replace(self):
+        """
+        Puts the file in place, replacing the previous one (if any).
+        """
+        if self.__durability != DURABILITY_NONE:
+            self.__file.flush()
+            os.fsync(self.__file.fileno())
+        self.__file.close()
+        try:
+            # Temporary files are only readable by their owner, so keep the permissions of the replaced file
+            try:
+                mode = os.stat(self.__path).st_mode & 0o7777
+            except FileNotFoundError:
+                mode = NEW_FILE_MODE
+            os.chmod(self.__temp_path, mode)
+            os.replace(self.__temp_path, self.__path)
+        except IsADirectoryError:
+            # A folder cannot be replaced by a file
+            raise HttpResponseMethodNotAllowed()
+        except PermissionError:
+            raise HttpResponseForbidden()
+        except FileNotFoundError:
+            # The folder of the file has been replaced (by a deploy) while the file was being received
+            raise HttpResponseConflict(content="The folder was replaced while the file was being uploaded")
+        self.__temp_path = None
+
+        if self.__durability == DURABILITY_FOLDER:
+            # The rename is only durable once the folder is synced
+            fd = os.open(self.__path.parent, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def discard(self):
+        """
+        Removes the temporary file if the upload has not been put in place (it does nothing otherwise).
+        """
+        self.__file.close()
+        if self.__temp_path is not None:
+            try:
+                os.unlink(self.__temp_path)
+            except FileNotFoundError:
+                # It was removed along with its folder
+                pass
+            self.__temp_path = None
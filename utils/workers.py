@@ -0,0 +1,101 @@
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import time
+from typing import Callable
+
+from settings import WORKER_RESTART_DELAY
+
+
+class WorkerSupervisor:
+    """
+    Master of the pre-fork mode. It forks the given number of worker processes (each one running the given
+    function), restarts the ones that die unexpectedly and, when it receives SIGTERM or SIGINT, asks all of them to
+    shut down gracefully and waits until they finish.
+    """
+    __workers = None
+    __target = None
+    # Process ids of the running workers
+    __pids = None
+    __stopping = False
+    # Handlers of the signals forwarded to the workers (SIGUSR1 and SIGHUP) before being replaced by the master, which
+    # are restored in the workers
+    __forwarded_handlers = None
+
+    def __init__(self, workers: int, target: Callable[[], None]):
+        if not hasattr(os, "fork"):
+            raise OSError("Worker processes are not supported in this platform")
+        self.__workers = workers
+        self.__target = target
+        self.__pids = set()
+        self.__stopping = False
+        self.__forwarded_handlers = {}
+
+    def run(self):
+        """
+        Starts the workers and supervises them until all of them have been stopped.
+        """
+        signal.signal(signal.SIGTERM, self.__stop)
+        signal.signal(signal.SIGINT, self.__stop)
+        # Each worker logs its own counters (SIGUSR1) and reloads its own virtual hosts (SIGHUP)
+        for name in ("SIGUSR1", "SIGHUP"):
+            if hasattr(signal, name):
+                signum = getattr(signal, name)
+                self.__forwarded_handlers[signum] = signal.getsignal(signum)
+                signal.signal(signum, lambda forwarded, _: self.__signal_workers(forwarded))
+
+        for _ in range(self.__workers):
+            self.__spawn()
+
+        while self.__pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            self.__pids.discard(pid)
+            if self.__stopping:
+                continue
+            logging.warning("Worker {} exited unexpectedly with status {}, restarting it".format(pid, status))
+            # Do not keep restarting workers in a tight loop if they fail right away
+            time.sleep(WORKER_RESTART_DELAY)
+            if not self.__stopping:
+                self.__spawn()
+        logging.info("All workers have been stopped")
+
+    def __spawn(self):
+        pid = os.fork()
+        if pid != 0:
+            self.__pids.add(pid)
+            return
+
+        # Worker process: only the master handles Ctrl+C, which is forwarded as SIGTERM to the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        for signum, handler in self.__forwarded_handlers.items():
+            if handler is not None:
+                signal.signal(signum, handler)
+        code = 0
+        try:
+            self.__target()
+        except BaseException:
+            logging.exception("Worker {} failed".format(os.getpid()))
+            code = 1
+        finally:
+            # Never return to the code of the master
+            os._exit(code)
+
+    def __signal_workers(self, signum: int):
+        for pid in list(self.__pids):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def __stop(self, *_):
+        if self.__stopping:
+            return
+        logging.info("Stopping {} workers".format(len(self.__pids)))
+        self.__stopping = True
+        self.__signal_workers(signal.SIGTERM)